@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+Benchmarks ordering methods on synthetic corpora.
+
+Each selected method runs on each selected corpus in a fresh process, under
+a fixed iteration count and optionally a time budget. For every run the
+benchmark records the wall time, the number of candidate orderings scored
+and the rate at which they were scored, the peak RSS of the process, and the
+size of the final archive. Results are written as JSON, which
+`tables.py --bench` renders.
+
+usage: bench.py [--corpora source,neardup] [--methods default,hillclimb]
+                [--files 60] [--count 200] [--time-budget 30] [--output bench.json]
+
+--methods defaults to all, every method but the ones needing external tools.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue as queues
+import resource
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import corpora
+from archive import write_archive
+from backends import BACKENDS
+from tarper import Runner
+
+# methods that need tools that aren't part of this repo
+EXTERNAL = {"binsort"}
+
+
+def run_one(
+    corpus: str, method: str, extension: str, count: int, settings: Dict[str, Any], queue
+) -> None:
+    """Run one method on one corpus, putting its measurements on queue"""
+    with tempfile.TemporaryDirectory() as workdir:
+        runner = Runner(
+            os.path.join(workdir, "archive"), corpus, extension, count, **settings
+        )
+        order = runner.options[method].order()
+        summary = runner.telemetry.summary()
+        target = os.path.join(workdir, "archive" + extension)
+        write_archive(target, order, extension, runner.store)
+        size = os.path.getsize(target)
+        runner.close()
+    queue.put(
+        {
+            "wall_time": summary["wall_time"],
+            "evaluations": summary["evaluations"],
+            "evaluations_per_sec": summary["evaluations_per_sec"],
+            "phases": summary["phases"],
+            # kilobytes on Linux
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "size": size,
+            "files": len(order),
+        }
+    )
+
+
+def measure(
+    corpus: str, method: str, extension: str, count: int, settings: Dict[str, Any]
+) -> Dict[str, Any]:
+    # a fresh process per run, so that peak RSS belongs to this run alone
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=run_one, args=(corpus, method, extension, count, settings, queue)
+    )
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except queues.Empty:
+            if not process.is_alive():
+                # the run failed; its traceback is on stderr
+                result = {"error": "exit code " + str(process.exitcode)}
+                break
+    process.join()
+    return result
+
+
+def method_names(methods: str, corpus: str) -> List[str]:
+    """The comma separated methods, or every method of the Runner for all"""
+    if methods != "all":
+        return methods.split(",")
+    with tempfile.TemporaryDirectory() as workdir:
+        runner = Runner(os.path.join(workdir, "archive"), corpus, ".gz", 1)
+        try:
+            return list(runner.options)
+        finally:
+            runner.close()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpora", default=",".join(corpora.GENERATORS))
+    parser.add_argument("--methods", default="all")
+    parser.add_argument("--files", type=int, default=60)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--extension", default=".gz", choices=sorted(BACKENDS))
+    parser.add_argument("--evaluator", default="inprocess")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dedup", choices=["off", "exact", "near"], default="off")
+    parser.add_argument("--output", default="bench.json")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    settings = {
+        "evaluator": args.evaluator,
+        "seed": args.seed,
+        "time_budget": args.time_budget,
+        "dedup": args.dedup,
+    }
+    runs = []
+    with tempfile.TemporaryDirectory() as root:
+        for kind in args.corpora.split(","):
+            corpus = corpora.generate(kind, os.path.join(root, kind), args.files, args.seed)
+            for method in method_names(args.methods, corpus):
+                if method in EXTERNAL:
+                    continue
+                result = measure(corpus, method, args.extension, args.count, settings)
+                result.update(
+                    {
+                        "corpus": kind,
+                        "method": method,
+                        "extension": args.extension,
+                        "count": args.count,
+                        "time_budget": args.time_budget,
+                    }
+                )
+                if "error" in result:
+                    print(f"{kind} {method}: failed, {result['error']}")
+                else:
+                    print(
+                        f"{kind} {method}: size={result['size']} "
+                        f"time={result['wall_time']:.2f}s "
+                        f"evals/s={result['evaluations_per_sec']:.1f}"
+                    )
+                runs.append(result)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "settings": settings,
+                "runs": runs,
+            },
+            f,
+            indent=2,
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
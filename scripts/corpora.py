@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+"""
+Deterministic synthetic corpora for benchmarking the ordering methods.
+
+Each generator writes a tree of files under a root directory, driven only by
+its seed, so every run of the benchmark sees the same bytes.
+
+  source   - source-like text files drawn from a shared vocabulary
+  neardup  - families of near-duplicate files, each a base file with a few
+             small edits
+  binary   - binary blobs, some random and some built from repeated chunks
+  deep     - source-like files spread over a deeply nested tree
+  flat     - source-like files all in a single directory
+  scatter  - the near-duplicate families of neardup, each file in one of a
+             dozen directories at random, so path order keeps families apart
+"""
+import os
+import random
+import sys
+from typing import Callable, Dict, List
+
+KEYWORDS = [
+    "def", "return", "class", "import", "for", "while", "if", "else", "try",
+    "except", "with", "yield", "lambda", "self", "None", "True", "False",
+]
+
+
+def vocabulary(rng: random.Random, size: int) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz_"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randrange(3, 12))))
+    return sorted(words)
+
+
+def source_text(rng: random.Random, words: List[str], lines: int) -> str:
+    out = []
+    indent = 0
+    for _ in range(lines):
+        line = [rng.choice(KEYWORDS)]
+        line.extend(rng.choice(words) for _ in range(rng.randrange(1, 8)))
+        out.append("    " * indent + " ".join(line) + rng.choice([":", "()", "", ","]))
+        indent = max(0, min(4, indent + rng.choice([-1, 0, 0, 1])))
+    return "\n".join(out) + "\n"
+
+
+def write(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = "wb" if isinstance(data, bytes) else "w"
+    with open(path, mode) as f:
+        f.write(data)
+
+
+def source(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    words = vocabulary(rng, 400)
+    for i in range(files):
+        directory = "pkg" + str(i % 8)
+        write(
+            os.path.join(root, directory, "module" + str(i) + ".py"),
+            source_text(rng, words, rng.randrange(20, 400)),
+        )
+
+
+def neardup(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    words = vocabulary(rng, 400)
+    families = max(1, files // 6)
+    bases = [source_text(rng, words, rng.randrange(50, 300)) for _ in range(families)]
+    for i in range(files):
+        lines = bases[i % families].split("\n")
+        for _ in range(rng.randrange(0, 5)):
+            lines[rng.randrange(len(lines))] = source_text(rng, words, 1).rstrip("\n")
+        write(
+            os.path.join(root, "family" + str(i % families), "copy" + str(i) + ".txt"),
+            "\n".join(lines),
+        )
+
+
+def binary(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    chunks = [bytes(rng.randrange(256) for _ in range(512)) for _ in range(16)]
+    for i in range(files):
+        if i % 2:
+            data = bytes(rng.randrange(256) for _ in range(rng.randrange(256, 8192)))
+        else:
+            data = b"".join(rng.choice(chunks) for _ in range(rng.randrange(1, 32)))
+        write(os.path.join(root, "blobs", "blob" + str(i) + ".bin"), data)
+
+
+def deep(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    words = vocabulary(rng, 400)
+    for i in range(files):
+        parts = ["d" + str(rng.randrange(3)) for _ in range(rng.randrange(3, 10))]
+        write(
+            os.path.join(root, *parts, "file" + str(i) + ".py"),
+            source_text(rng, words, rng.randrange(20, 200)),
+        )
+
+
+def flat(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    words = vocabulary(rng, 400)
+    for i in range(files):
+        write(
+            os.path.join(root, "all", "file" + str(i) + ".py"),
+            source_text(rng, words, rng.randrange(20, 200)),
+        )
+
+
+def scatter(root: str, files: int, seed: int) -> None:
+    rng = random.Random(seed)
+    words = vocabulary(rng, 400)
+    families = max(1, files // 6)
+    bases = [source_text(rng, words, rng.randrange(50, 300)) for _ in range(families)]
+    for i in range(files):
+        lines = bases[i % families].split("\n")
+        for _ in range(rng.randrange(0, 5)):
+            lines[rng.randrange(len(lines))] = source_text(rng, words, 1).rstrip("\n")
+        write(
+            os.path.join(
+                root,
+                "d" + str(rng.randrange(12)),
+                "family" + str(i % families) + "_copy" + str(i) + ".txt",
+            ),
+            "\n".join(lines),
+        )
+
+
+GENERATORS: Dict[str, Callable[[str, int, int], None]] = {
+    "source": source,
+    "neardup": neardup,
+    "binary": binary,
+    "deep": deep,
+    "flat": flat,
+    "scatter": scatter,
+}
+
+
+def generate(kind: str, root: str, files: int, seed: int = 0) -> str:
+    """Generate a corpus of the given kind under root, returning root"""
+    GENERATORS[kind](root, files, seed)
+    return root
+
+
+# usage: corpora.py kind root file_count [seed]
+if __name__ == "__main__":
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    generate(sys.argv[1], sys.argv[2], int(sys.argv[3]), seed)
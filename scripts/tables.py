@@ -2,6 +2,7 @@
 
 from collections import defaultdict
 from itertools import groupby
+import json
 from os.path import getsize
 from pathlib import Path
 import sys
@@ -20,6 +21,8 @@ no_count = [
     "nonnaivesimilarity",
     "nonnaivesimilaritythenswap",
     "swappingwithpermutation",
+    "minhashsimilarity",
+    "compressiondistance",
 ]
 
 class Result:
@@ -114,6 +117,43 @@ def result(file: Path) -> Result:
     return result
 
 
+def make_bench_tables(path: str) -> List[str]:
+    """Tables of the results written by bench.py, one per corpus"""
+    with open(path) as f:
+        runs = json.load(f)["runs"]
+    by_corpus: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for run in runs:
+        # failed runs have an error and no measurements
+        if "error" not in run:
+            by_corpus[run["corpus"]].append(run)
+    tables = []
+    for corpus, corpus_runs in by_corpus.items():
+        header = "*** " + corpus
+        table_header = "| Method | Iterations | Size | Seconds | Evals/s | Peak RSS (MB) "
+        split_line = "|-+-+-+-+-+-|"
+        lines = [header, table_header, split_line]
+        for run in sorted(corpus_runs, key=lambda r: r["size"], reverse=True):
+            count = str(run["count"])
+            if run["method"] in no_count:
+                count = "-"
+            fields = [
+                pad(run["method"], 24),
+                pad(count),
+                pad(str(run["size"])),
+                pad("%.2f" % run["wall_time"]),
+                pad("%.1f" % run["evaluations_per_sec"]),
+                pad("%.1f" % (run["peak_rss_kb"] / 1024)),
+            ]
+            lines.append("|" + "|".join(fields) + "|")
+        tables.append("\n".join(lines))
+    return tables
+
+
+# usage: tables.py srcdir, or tables.py --bench bench.json
 if __name__ == "__main__":
-    for i in make_all_tables(sys.argv[1]):
+    if sys.argv[1] == "--bench":
+        tables = make_bench_tables(sys.argv[2])
+    else:
+        tables = make_all_tables(sys.argv[1])
+    for i in tables:
         print(i)
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+Benchmarks the MCTS tree: the time per update, choose_path and combined_path,
+and the memory the tree takes, for random paths over a number of files.
+
+Random paths share little beyond their first few files, so most of the tree
+is long chains, as it is early in an mcts run. --src imports mcts.py from
+another directory, such as an older checkout, to compare implementations.
+
+usage: treebench.py [--files 2000] [--paths 500] [--src DIR]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import List
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--paths", type=int, default=500)
+    parser.add_argument("--choices", type=int, default=2000)
+    parser.add_argument("--combines", type=int, default=20)
+    parser.add_argument(
+        "--src",
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    sys.path.insert(0, args.src)
+    from mcts import Node
+
+    rng = random.Random(args.seed)
+    files = [os.path.join("src", "dir" + str(i % 40), "file" + str(i)) for i in range(args.files)]
+    paths = []
+    for _ in range(args.paths):
+        path = files[:]
+        # keep a shared prefix, as mcts paths do
+        tail = path[rng.randrange(len(path) // 10) :]
+        rng.shuffle(tail)
+        paths.append(path[: len(path) - len(tail)] + tail)
+    sizes = [rng.randrange(100000, 200000) for _ in paths]
+
+    def build():
+        tree = Node()
+        tree.set_base_order(files)
+        # update prints improvements
+        with contextlib.redirect_stdout(io.StringIO()):
+            for path, size in zip(paths, sizes):
+                tree.update(path, size)
+        return tree
+
+    start = time.perf_counter()
+    tree = build()
+    update_time = time.perf_counter() - start
+
+    # measured separately, as tracing slows allocation down
+    tracemalloc.start()
+    traced = build()
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+
+    random.seed(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.choices):
+        tree.choose_path(5).path()
+    choose_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(args.combines):
+        tree.combined_path(files, tree.choose_path(5).path(), 0)
+    combine_time = time.perf_counter() - start
+
+    nodes = args.paths * args.files
+    print(f"{args.files} files, {args.paths} paths")
+    print(f"update:      {update_time / args.paths * 1e3:.3f} ms per path")
+    print(f"choose_path: {choose_time / args.choices * 1e3:.3f} ms per path")
+    print(f"combined_path: {combine_time / args.combines * 1e3:.3f} ms per path")
+    print(f"memory:      {memory / 2 ** 20:.1f} MiB, at most {memory / nodes:.0f} bytes per node")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+"""
+Writes the final archive for a chosen order.
+
+The tar stream is generated in-process and piped straight into the codec's
+command, or an in-process compressor when the command isn't installed (see
+backends.py), whose output goes to the target file or to stdout. There are no temporary
+files, and memory use is bounded by the pipe buffers (and the content store,
+which maps large files rather than reading them).
+
+The tar stream is the same as GNU tar's for regular files, and the
+compressors run with the same settings as make_archive, so the output is the
+same as make_archive's: zstd is told the size of the stream, as it would know
+the size of a file, and for gzip the header is rewritten to record the name
+and time stamp that gzip stores when compressing a file.
+"""
+import os
+import struct
+import tarfile
+import time
+from typing import BinaryIO, Iterable, List, Optional
+
+from backends import Backend, make_backend
+from evaluator import member_chunks, padding, tar_stream
+
+GZIP_HEADER_LENGTH = 10
+FNAME = 0x08
+
+
+def tar_length(files: Iterable[str], store) -> int:
+    """The length of the tar stream of files"""
+    length = 0
+    for file in files:
+        if store is not None:
+            length += store.member_length(file)
+        else:
+            length += sum(len(chunk) for chunk in member_chunks(None)(file))
+    end = length + 2 * tarfile.BLOCKSIZE
+    return end + len(padding(end, tarfile.RECORDSIZE))
+
+
+class GzipNameWriter:
+    """
+    Rewrites the header of a gzip stream produced with -n, to record name and
+    mtime as gzip does for a file, then passes everything through to out.
+    """
+
+    def __init__(self, out: BinaryIO, name: str, mtime: int):
+        self.out = out
+        self.name = name
+        self.mtime = mtime
+        self.header = b""
+
+    def write(self, data) -> None:
+        if len(self.header) < GZIP_HEADER_LENGTH:
+            needed = GZIP_HEADER_LENGTH - len(self.header)
+            self.header += bytes(data[:needed])
+            data = data[needed:]
+            if len(self.header) == GZIP_HEADER_LENGTH:
+                magic, method = self.header[0:2], self.header[2]
+                extra_flags, os_byte = self.header[8], self.header[9]
+                self.out.write(
+                    magic
+                    + bytes([method, FNAME])
+                    + struct.pack("<I", self.mtime)
+                    + bytes([extra_flags, os_byte])
+                    + self.name.encode("latin-1", "replace")
+                    + b"\0"
+                )
+        if data:
+            self.out.write(data)
+
+
+def write_archive(
+    target: str,
+    files: List[str],
+    extension: str,
+    store=None,
+    output: Optional[BinaryIO] = None,
+    backend: Optional[Backend] = None,
+) -> None:
+    """
+    Write the compressed archive of files to target, a path ending with the
+    extension, or to output if it is given.
+    """
+    if backend is None:
+        backend = make_backend(extension)
+    length = tar_length(files, store)
+    out = output if output is not None else open(target, "wb")
+    try:
+        sink = out
+        if extension == ".gz" and output is None:
+            # the name gzip would have stored, compressing the tar file
+            name = os.path.basename(target)[: -len(extension)]
+            sink = GzipNameWriter(out, name, int(time.time()))
+        writer = backend.output_writer(sink, length)
+        for chunk in tar_stream(files, store):
+            writer.write(chunk)
+        writer.close()
+    finally:
+        if output is None:
+            out.close()
+        else:
+            out.flush()
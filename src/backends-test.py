@@ -0,0 +1,114 @@
+import bz2
+import gzip
+import lzma
+import os
+import tarfile
+import tempfile
+
+import pytest
+
+from backends import BACKENDS, make_backend
+
+DECOMPRESS = {".gz": gzip.decompress, ".xz": lzma.decompress, ".bz2": bz2.decompress}
+
+
+def test_in_process_output_decompresses():
+    data = b"".join(b"line %d of some text\n" % (i % 97) for i in range(20000))
+    for extension, decompress in DECOMPRESS.items():
+        backend = make_backend(extension)
+        out = []
+        writer = backend.writer(type("Sink", (), {"write": lambda self, d: out.append(d)})())
+        for start in range(0, len(data), 4096):
+            writer.write(data[start : start + 4096])
+        writer.close()
+        assert decompress(b"".join(out)) == data, extension
+        assert backend.size([data]) == len(b"".join(out)), extension
+
+
+def test_levels_and_windows():
+    assert make_backend(".gz").window == 1 << 15
+    assert make_backend(".gz", window_log=10).window == 1 << 10
+    assert not make_backend(".gz", window_log=10).expressible()
+    assert make_backend(".zst").window == 1 << 27
+    assert make_backend(".xz", 9).window == 1 << 26
+    assert make_backend(".bz2", 5).window == 500000
+    assert make_backend(".xz").fast().level == 0
+    data = bytes(range(256)) * 50 + os.urandom(1000) + bytes(range(256)) * 50
+    assert make_backend(".gz", 9).size([data]) <= make_backend(".gz", 1).size([data])
+    with pytest.raises(ValueError):
+        make_backend(".rar")
+
+
+@pytest.mark.parametrize("extension", sorted(BACKENDS))
+def test_write_archive_matches_make_archive(extension):
+    from archive import write_archive
+    from tarper import make_archive
+
+    backend = make_backend(extension)
+    if not backend.available():
+        pytest.skip(backend.tool + " is not installed")
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for i in range(10):
+            path = os.path.join(root, "f" + str(i))
+            with open(path, "w") as f:
+                f.write("some text %d\n" % i * (100 * i + 1))
+            files.append(path)
+        made = os.path.join(root, "made")
+        make_archive(made, files, extension)
+        # the tar file is removed, whichever command compressed it
+        assert not os.path.exists(made)
+        written = os.path.join(root, "written" + extension)
+        write_archive(written, files, extension)
+        with open(made + extension, "rb") as f:
+            made_data = f.read()
+        with open(written, "rb") as f:
+            written_data = f.read()
+        if extension == ".gz":
+            # everything but the time stamp and the name
+            assert len(made_data) == len(written_data) - len("written") + len("made")
+        else:
+            assert made_data == written_data
+
+
+def test_compress_file_reports_a_failed_command():
+    backend = make_backend(".gz")
+    if not backend.available():
+        pytest.skip("gzip is not installed")
+    with tempfile.TemporaryDirectory() as root:
+        with pytest.raises(RuntimeError):
+            backend.compress_file(os.path.join(root, "missing"))
+
+
+def test_cli_evaluator_keeps_settings_gzip_cant_express():
+    from evaluator import InProcessEvaluator, make_evaluator
+
+    data = (b"".join(b"%d some words to repeat\n" % (i % 50) for i in range(3000)))
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "file")
+        with open(path, "wb") as f:
+            f.write(data)
+        small = make_evaluator("cli", root, ".gz", None, window_log=9)
+        assert isinstance(small, InProcessEvaluator)
+        large = make_evaluator("inprocess", root, ".gz", None)
+        # a 512 byte window finds fewer matches than gzip's 32KB one
+        assert small.size([path]) > large.size([path])
+
+
+def test_make_archive_keeps_settings_gzip_cant_express():
+    from tarper import make_archive
+
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "file")
+        with open(path, "wb") as f:
+            f.write(b"".join(b"%d some words to repeat\n" % (i % 50) for i in range(3000)))
+        sizes = []
+        for window_log in (9, 15):
+            made = os.path.join(root, "archive" + str(window_log))
+            make_archive(made, [path], ".gz", make_backend(".gz", window_log=window_log))
+            assert not os.path.exists(made)
+            with gzip.open(made + ".gz") as f:
+                assert tarfile.open(fileobj=f).getnames() == [path.lstrip("/")]
+            sizes.append(os.path.getsize(made + ".gz"))
+        # a 512 byte window finds fewer matches than gzip's 32KB one
+        assert sizes[0] > sizes[1]
@@ -0,0 +1,434 @@
+"""
+Compression backends, one for each archive extension.
+
+A backend is a codec at a level and a window size. It can compress a stream
+two ways:
+
+  - for search, writer() compresses in-process where the codec has a binding
+    (zlib, lzma and bz2 in the standard library; zstandard, brotli and lz4
+    when they're installed), and through the codec's command otherwise. Only
+    the size of the output is wanted, so it goes into a counting sink.
+  - for the final archive, output_writer() pipes through the codec's command
+    when it is on the PATH and can express the settings, so the archive is
+    the same as the command makes from a tar file, and compresses in-process
+    otherwise.
+
+compress_file() compresses a tar file on disk, as make_archive does, with
+file_command() when the command can express the settings, and in-process
+otherwise.
+
+The window is how far back the codec looks for matches, in bytes, which
+bounds how far the effect of moving a file reaches: window.py and segments.py
+use it. bzip2 compresses blocks independently, so its window is the block.
+"""
+import bz2
+import lzma
+import os
+import shutil
+import subprocess
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Type
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on the environment
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:  # pragma: no cover - depends on the environment
+    lz4frame = None
+
+
+class CompressingWriter:
+    """Feeds data through a zlib-style compression object into a sink"""
+
+    def __init__(self, compressor, sink):
+        self.compressor = compressor
+        self.sink = sink
+
+    def write(self, data) -> None:
+        out = self.compressor.compress(data)
+        if out:
+            self.sink.write(out)
+
+    def close(self) -> None:
+        self.sink.write(self.compressor.flush())
+
+
+class PipeWriter:
+    """
+    Feeds data through a compression command's stdin, copying its stdout into
+    a sink. Used when no in-process binding is available for the codec.
+    """
+
+    def __init__(self, command: List[str], sink):
+        self.sink = sink
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.reader = threading.Thread(target=self._copy_output, daemon=True)
+        self.reader.start()
+
+    def _copy_output(self) -> None:
+        while True:
+            data = self.process.stdout.read(1 << 16)
+            if not data:
+                return
+            self.sink.write(data)
+
+    def write(self, data) -> None:
+        self.process.stdin.write(data)
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        self.reader.join()
+        if self.process.wait() != 0:
+            raise RuntimeError("compression command failed: " + " ".join(self.process.args))
+
+
+class CountingSink:
+    """A file-like object that discards what is written to it, but counts it"""
+
+    def __init__(self):
+        self.count = 0
+
+    def write(self, data) -> int:
+        self.count += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class BrotliCompressor:
+    """The brotli module's compressor, with the zlib-style interface"""
+
+    def __init__(self, quality: int, lgwin: int):
+        self.compressor = brotli.Compressor(quality=quality, lgwin=lgwin)
+
+    def compress(self, data) -> bytes:
+        return self.compressor.process(bytes(data))
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+class Lz4Compressor:
+    """The lz4 module's frame compressor, with the zlib-style interface"""
+
+    def __init__(self, level: int):
+        self.compressor = lz4frame.LZ4FrameCompressor(compression_level=level)
+        self.header: Optional[bytes] = self.compressor.begin()
+
+    def compress(self, data) -> bytes:
+        out = self.compressor.compress(bytes(data))
+        if self.header is not None:
+            out = self.header + out
+            self.header = None
+        return out
+
+    def flush(self) -> bytes:
+        out = self.compressor.flush()
+        if self.header is not None:
+            out = self.header + out
+            self.header = None
+        return out
+
+
+class Backend:
+    extension = ""
+    # the command line tool
+    tool = ""
+    default_level = 0
+    # the level used for a quick estimate, by fidelity.py
+    fast_level = 0
+    default_window_log: Optional[int] = None
+    # whether the compressor's state can be copied, which the incremental
+    # evaluator needs
+    copyable = False
+
+    def __init__(self, level: Optional[int] = None, window_log: Optional[int] = None):
+        self.level = self.default_level if level is None else level
+        self.window_log = self.default_window_log if window_log is None else window_log
+
+    @property
+    def window(self) -> int:
+        """How far back the codec looks for matches, in bytes"""
+        return 1 << self.window_log
+
+    def compressor(self):
+        """An in-process compressor, or None without a binding for the codec"""
+        return None
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        """A command compressing stdin to stdout, given the length of the input"""
+        raise NotImplementedError
+
+    def file_command(self, path: str) -> List[str]:
+        """A command compressing path to path + extension, removing path"""
+        raise NotImplementedError
+
+    def expressible(self) -> bool:
+        """Whether the command can be run with these settings"""
+        return True
+
+    def available(self) -> bool:
+        return self.expressible() and shutil.which(self.tool) is not None
+
+    def usable(self) -> bool:
+        """Whether there is any way to compress with these settings"""
+        return self.compressor() is not None or self.available()
+
+    def unusable(self) -> RuntimeError:
+        return RuntimeError(
+            "no way to compress " + self.extension + ": install " + self.tool
+        )
+
+    def fast(self) -> "Backend":
+        """The same codec and window at its fast level"""
+        return type(self)(self.fast_level, self.window_log)
+
+    def writer(self, sink):
+        """A writer compressing into sink, for measuring sizes"""
+        compressor = self.compressor()
+        if compressor is not None:
+            return CompressingWriter(compressor, sink)
+        if not self.available():
+            raise self.unusable()
+        return PipeWriter(self.command(), sink)
+
+    def output_writer(self, sink, length: Optional[int] = None):
+        """A writer compressing into sink, for writing the archive"""
+        if self.available():
+            return PipeWriter(self.command(length), sink)
+        compressor = self.compressor()
+        if compressor is None:
+            raise self.unusable()
+        return CompressingWriter(compressor, sink)
+
+    def compress_file(self, path: str) -> None:
+        """Compress path to path + extension, removing path"""
+        if self.available():
+            command = self.file_command(path)
+            if subprocess.run(command, stderr=subprocess.DEVNULL).returncode != 0:
+                raise RuntimeError("compression command failed: " + " ".join(command))
+            return
+        with open(path, "rb") as source, open(path + self.extension, "wb") as target:
+            writer = self.output_writer(target)
+            shutil.copyfileobj(source, writer)
+            writer.close()
+        os.remove(path)
+
+    def size(self, chunks: Iterable) -> int:
+        """The compressed size of chunks"""
+        sink = CountingSink()
+        writer = self.writer(sink)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        return sink.count
+
+
+class Gzip(Backend):
+    extension = ".gz"
+    tool = "gzip"
+    default_level = 6
+    fast_level = 1
+    default_window_log = zlib.MAX_WBITS
+    copyable = True
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + self.window_log)
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        return ["gzip", "-" + str(self.level), "-n", "-c"]
+
+    def file_command(self, path: str) -> List[str]:
+        return ["gzip", "-" + str(self.level), path]
+
+    def expressible(self) -> bool:
+        # gzip always uses the largest window
+        return self.window_log == zlib.MAX_WBITS
+
+
+class Zstd(Backend):
+    extension = ".zst"
+    tool = "zstd"
+    default_level = 19
+    fast_level = 3
+    # zstd --long defaults to a window of 2^27 bytes
+    default_window_log = 27
+
+    def __init__(self, level: Optional[int] = None, window_log: Optional[int] = None):
+        super().__init__(level, window_log)
+        # making a ZstdCompressor takes far longer than compressing a small
+        # archive with one, so each thread keeps its own
+        self.compressors: Dict[int, "zstandard.ZstdCompressor"] = {}
+
+    def __getstate__(self):
+        # compressors can't be pickled, and workers make their own
+        state = dict(self.__dict__)
+        state["compressors"] = {}
+        return state
+
+    def compressor(self):
+        if zstandard is None:
+            return None
+        thread = threading.get_ident()
+        compressor = self.compressors.get(thread)
+        if compressor is None:
+            params = zstandard.ZstdCompressionParameters.from_level(
+                self.level,
+                window_log=self.window_log,
+                enable_ldm=True,
+                write_checksum=True,
+            )
+            compressor = zstandard.ZstdCompressor(compression_params=params)
+            self.compressors[thread] = compressor
+        return compressor.compressobj()
+
+    def options(self) -> List[str]:
+        options = ["-" + str(self.level), "--long=" + str(self.window_log)]
+        if self.level > 19:
+            options.insert(0, "--ultra")
+        return options
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        command = ["zstd"] + self.options() + ["-q", "-c"]
+        if length is not None:
+            # as zstd would know the size of a file
+            command.append("--stream-size=" + str(length))
+        return command
+
+    def file_command(self, path: str) -> List[str]:
+        return ["zstd"] + self.options() + ["-q", "--rm", path]
+
+
+# the dictionary size of each xz preset
+XZ_DICTIONARY_LOGS = [18, 20, 21, 22, 22, 23, 23, 24, 25, 26]
+
+
+class Xz(Backend):
+    extension = ".xz"
+    tool = "xz"
+    default_level = 6
+    fast_level = 0
+
+    def __init__(self, level: Optional[int] = None, window_log: Optional[int] = None):
+        super().__init__(level, window_log)
+        if self.window_log is None:
+            self.window_log = XZ_DICTIONARY_LOGS[self.level]
+
+    def compressor(self):
+        filters = [
+            {
+                "id": lzma.FILTER_LZMA2,
+                "preset": self.level,
+                "dict_size": 1 << self.window_log,
+            }
+        ]
+        return lzma.LZMACompressor(lzma.FORMAT_XZ, filters=filters)
+
+    def options(self) -> List[str]:
+        lzma2 = "--lzma2=preset=" + str(self.level) + ",dict=" + str(1 << self.window_log)
+        # one thread, as lzma does, so the output is the same
+        return ["-T1", lzma2]
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        return ["xz"] + self.options() + ["-q", "-c"]
+
+    def file_command(self, path: str) -> List[str]:
+        return ["xz"] + self.options() + ["-q", path]
+
+
+class Bzip2(Backend):
+    extension = ".bz2"
+    tool = "bzip2"
+    default_level = 9
+    fast_level = 1
+
+    @property
+    def window(self) -> int:
+        # blocks of 100k times the level are compressed independently
+        return self.level * 100000
+
+    def compressor(self):
+        return bz2.BZ2Compressor(self.level)
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        return ["bzip2", "-" + str(self.level), "-c"]
+
+    def file_command(self, path: str) -> List[str]:
+        return ["bzip2", "-" + str(self.level), path]
+
+
+class Brotli(Backend):
+    extension = ".br"
+    tool = "brotli"
+    default_level = 11
+    fast_level = 1
+    default_window_log = 22
+
+    @property
+    def window(self) -> int:
+        return (1 << self.window_log) - 16
+
+    def compressor(self):
+        if brotli is None:
+            return None
+        return BrotliCompressor(self.level, self.window_log)
+
+    def options(self) -> List[str]:
+        return ["-q", str(self.level), "-w", str(self.window_log)]
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        return ["brotli"] + self.options() + ["-c"]
+
+    def file_command(self, path: str) -> List[str]:
+        return ["brotli"] + self.options() + ["-f", "--rm", path]
+
+
+class Lz4(Backend):
+    extension = ".lz4"
+    tool = "lz4"
+    default_level = 9
+    fast_level = 1
+    # the lz4 format's window is fixed
+    default_window_log = 16
+
+    def compressor(self):
+        if lz4frame is None:
+            return None
+        return Lz4Compressor(self.level)
+
+    def command(self, length: Optional[int] = None) -> List[str]:
+        return ["lz4", "-" + str(self.level), "-q", "-c"]
+
+    def file_command(self, path: str) -> List[str]:
+        return ["lz4", "-" + str(self.level), "-q", "-f", "--rm", path, path + self.extension]
+
+    def expressible(self) -> bool:
+        return self.window_log == 16
+
+
+BACKENDS: Dict[str, Type[Backend]] = {
+    backend.extension: backend for backend in [Gzip, Zstd, Xz, Bzip2, Brotli, Lz4]
+}
+
+
+def make_backend(
+    extension: str, level: Optional[int] = None, window_log: Optional[int] = None
+) -> Backend:
+    if extension not in BACKENDS:
+        raise ValueError("Unrecognized choice of compression: " + extension)
+    return BACKENDS[extension](level, window_log)
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+
+from checkpoint import flatten_tree, restore_tree
+from mcts import Node
+from tarper import Runner
+from testtree import write_tree
+
+
+def make_tree(root: str, count: int = 12):
+    write_tree(root, count, longest=1000, directories=3)
+
+
+def shape(node: Node):
+    return (
+        node.key,
+        node.min,
+        node.max,
+        [shape(child) for child in node.children.values()],
+    )
+
+
+def test_tree_round_trip():
+    files = ["a", "b", "c", "d"]
+    node = Node()
+    node.set_base_order(files)
+    node.update(["a", "b", "c", "d"], 10)
+    node.update(["a", "c", "b", "d"], 8)
+    node.update(["d", "c", "b", "a"], 12)
+    ids = {file: i for i, file in enumerate(files)}
+
+    restored = restore_tree(flatten_tree(node, ids), files)
+
+    assert shape(restored) == shape(node)
+    assert restored.children["a"].children["c"].path() == ["a", "c"]
+    assert restored.best_path() == ["a", "c", "b", "d"]
+
+
+def run(src: str, checkpoints: str, method: str, count: int, resume: bool):
+    runner = Runner(
+        os.path.join(checkpoints, "archive"),
+        src,
+        ".gz",
+        count,
+        evaluator="inprocess",
+        seed=3,
+        checkpoint_dir=checkpoints,
+        resume=resume,
+    )
+    try:
+        return runner.options[method].order()
+    finally:
+        runner.close()
+
+
+def test_resumed_search_matches_uninterrupted():
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "src")
+        make_tree(src)
+        for method in ["hillclimb", "counted"]:
+            whole = run(src, os.path.join(root, "whole"), method, 40, False)
+            run(src, os.path.join(root, "parts"), method, 20, False)
+            resumed = run(src, os.path.join(root, "parts"), method, 40, True)
+            assert resumed == whole
+
+
+def test_screened_out_rounds_are_checkpointed():
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "src")
+        make_tree(src)
+        runner = Runner(
+            os.path.join(root, "archive"),
+            src,
+            ".gz",
+            12,
+            evaluator="inprocess",
+            seed=3,
+            checkpoint_dir=root,
+            checkpoint_interval=0,
+        )
+        saved = []
+        save = runner.checkpointer.save
+
+        def recording(method, files, state, orders, tree):
+            saved.append(state["iterations"])
+            save(method, files, state, orders, tree)
+
+        runner.checkpointer.save = recording
+        # as if every candidate were screened out before being compressed
+        runner.screened_sizes = lambda base, size, candidates, *rest: [sys.maxsize] * len(
+            candidates
+        )
+        try:
+            runner.options["hillclimb"].order()
+        finally:
+            runner.close()
+        assert saved == [4, 8, 12, 12]
@@ -0,0 +1,148 @@
+"""
+Checkpoints of long-running searches, so that they can be resumed.
+
+A checkpoint holds the state of one method's search: its orders, sizes and
+iteration counter, the state of the random module, and for mcts the tree.
+Orders are stored as arrays of ids into the list of files the search started
+from, and the tree as flat arrays of parent indices, keys and sizes in
+preorder, so a checkpoint is compact, and both writing and reading it are
+linear and free of recursion, whatever the depth of the tree.
+
+Checkpoints are written to a temporary file that replaces the previous one,
+so a crash while writing leaves the last checkpoint intact. The searches ask
+whether one is due at the end of each round, and only write one every
+interval seconds.
+"""
+import array
+import os
+import pickle
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from mcts import Node
+
+VERSION = 1
+
+
+def encode_order(order: List[str], ids: Dict[str, int]) -> bytes:
+    return array.array("I", [ids[file] for file in order]).tobytes()
+
+
+def decode_order(data: bytes, files: List[str]) -> List[str]:
+    ids = array.array("I")
+    ids.frombytes(data)
+    return [files[i] for i in ids]
+
+
+def flatten_tree(root: Node, ids: Dict[str, int]) -> Dict[str, bytes]:
+    """The tree under root as flat arrays, in preorder"""
+    parents = array.array("i")
+    keys = array.array("i")
+    mins = array.array("q")
+    maxes = array.array("q")
+    stack = [(root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        index = len(parents)
+        parents.append(parent)
+        keys.append(-1 if node.parent is None else ids[node.key])
+        mins.append(node.min)
+        maxes.append(node.max)
+        # reversed, so that children are visited, and restored, in order
+        for child in reversed(node.nodes or ()):
+            stack.append((child, index))
+    return {
+        "parents": parents.tobytes(),
+        "keys": keys.tobytes(),
+        "mins": mins.tobytes(),
+        "maxes": maxes.tobytes(),
+    }
+
+
+def restore_tree(flat: Dict[str, bytes], files: List[str]) -> Node:
+    arrays = {}
+    for name, typecode in [("parents", "i"), ("keys", "i"), ("mins", "q"), ("maxes", "q")]:
+        arrays[name] = array.array(typecode)
+        arrays[name].frombytes(flat[name])
+    nodes: List[Node] = []
+    for parent, key, low, high in zip(
+        arrays["parents"], arrays["keys"], arrays["mins"], arrays["maxes"]
+    ):
+        if parent < 0:
+            node = Node()
+            node.set_base_order(files)
+        else:
+            node = nodes[parent].child(files[key])
+        node.min = low
+        node.max = high
+        nodes.append(node)
+    return nodes[0]
+
+
+class Checkpointer:
+    """Writes and reads the checkpoints of a run, one file per method"""
+
+    def __init__(self, directory: str, interval: float = 30.0, resume: bool = False):
+        self.directory = directory
+        self.interval = interval
+        self.resume = resume
+        self.last = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, method: str) -> str:
+        return os.path.join(self.directory, method + ".ckpt")
+
+    def due(self) -> bool:
+        return time.monotonic() - self.last >= self.interval
+
+    def save(
+        self,
+        method: str,
+        files: List[str],
+        state: Dict[str, Any],
+        orders: Dict[str, List[str]],
+        tree: Optional[Node] = None,
+    ) -> None:
+        """
+        Save the state of method, which started from files. state holds plain
+        values, orders holds orders of files, and tree is the mcts tree.
+        """
+        ids = {file: i for i, file in enumerate(files)}
+        checkpoint = {
+            "version": VERSION,
+            "method": method,
+            "files": files,
+            "random": random.getstate(),
+            "state": state,
+            "orders": {name: encode_order(order, ids) for name, order in orders.items()},
+            "tree": None if tree is None else flatten_tree(tree, ids),
+        }
+        path = self.path(method)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+        self.last = time.monotonic()
+
+    def load(self, method: str, files: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        When resuming, the last checkpoint of method, if it was for the same
+        set of files. Restores the state of the random module, and returns the
+        state, with the orders and tree decoded.
+        """
+        if not self.resume or not os.path.exists(self.path(method)):
+            return None
+        with open(self.path(method), "rb") as f:
+            checkpoint = pickle.load(f)
+        if checkpoint["version"] != VERSION or sorted(checkpoint["files"]) != sorted(files):
+            print(f"{method}: ignoring checkpoint for a different set of files")
+            return None
+        saved = checkpoint["files"]
+        random.setstate(checkpoint["random"])
+        state = dict(checkpoint["state"])
+        for name, data in checkpoint["orders"].items():
+            state[name] = decode_order(data, saved)
+        if checkpoint["tree"] is not None:
+            state["tree"] = restore_tree(checkpoint["tree"], saved)
+        print(f"{method}: resuming from checkpoint")
+        return state
@@ -0,0 +1,40 @@
+import random
+
+from crossover import CROSSOVERS, follow_merge, prefix_fill, successors
+
+
+def test_successors_uses_first_occurrence():
+    assert successors(["a", "b", "a", "c"]) == {"a": "b", "b": "a"}
+
+
+def test_follow_merge_keeps_neighbours_from_second():
+    merged = follow_merge(["a", "b", "c", "d", "e"], ["e", "c", "a", "d", "b"])
+    assert merged == ["a", "d", "b", "c", "e"]
+    assert follow_merge([0, 1, 2], [2, 1, 0], lambda: False) == [0, 1, 2]
+
+
+def test_prefix_fill_is_a_permutation():
+    files = [str(i) for i in range(50)]
+    order = list(reversed(files))
+    filled = prefix_fill(files, order, 10, random.Random(1).shuffle)
+    assert filled[:10] == order[:10]
+    assert sorted(filled) == sorted(files)
+
+
+def test_crossovers_are_permutations():
+    rng = random.Random(2)
+    for length in (1, 2, 3, 10, 200):
+        first = list(range(length))
+        second = list(first)
+        rng.shuffle(second)
+        for name, cross in CROSSOVERS.items():
+            for _ in range(20):
+                child = cross(first, second, rng)
+                assert sorted(child) == first, name
+
+
+def test_crossovers_of_equal_parents_are_the_parent():
+    order = [str(i) for i in range(30)]
+    random.Random(3).shuffle(order)
+    for name, cross in CROSSOVERS.items():
+        assert cross(order, order, random.Random(4)) == order, name
@@ -0,0 +1,166 @@
+"""
+Recombination operators on orders, in time linear in their length.
+
+Orders are lists of distinct items, files or ids. The operators look items up
+in indexes, such as a dict from each item to its successor in an order, and
+track the items already placed in a set, so nothing is searched for in a list.
+Randomness is passed in, so the operators can be driven by the random module,
+as mcts does, or by a seeded generator of their own.
+
+Besides the operators mcts uses, there are the classic order-preserving
+crossovers, OX, PMX and edge recombination, used by the genetic search.
+"""
+import random
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+def successors(order: Sequence[T]) -> Dict[T, T]:
+    """The item following each item of order, for its first occurrence"""
+    following: Dict[T, T] = {}
+    for i in range(len(order) - 1):
+        following.setdefault(order[i], order[i + 1])
+    return following
+
+
+def prefix_fill(
+    items: Sequence[T],
+    order: Sequence[T],
+    keep: int,
+    shuffle: Callable[[List[T]], None] = random.shuffle,
+) -> List[T]:
+    """
+    The first keep items of order, followed by the rest of items, in the order
+    that shuffle leaves them.
+    """
+    prefix = list(order[:keep])
+    placed = set(prefix)
+    rest = [item for item in items if item not in placed]
+    shuffle(rest)
+    prefix.extend(rest)
+    return prefix
+
+
+def follow_merge(
+    first: Sequence[T],
+    second: Sequence[T],
+    follow: Callable[[], bool] = lambda: True,
+) -> List[T]:
+    """
+    Walk first, placing each item not yet placed. After each one, when follow()
+    is true, also place the item that follows it in second, if that hasn't been
+    placed, so that pairs of neighbours in second survive into the child.
+    """
+    following = successors(second)
+    merged: List[T] = []
+    placed = set()
+    for item in first:
+        if item in placed:
+            continue
+        merged.append(item)
+        placed.add(item)
+        if follow():
+            follower: Optional[T] = following.get(item)
+            if follower is not None and follower not in placed:
+                placed.add(follower)
+                merged.append(follower)
+    return merged
+
+
+def cut_points(length: int, rng=random) -> Tuple[int, int]:
+    """Two positions i < j, bounding the slice [i, j) of a parent to keep"""
+    i = rng.randrange(length)
+    j = rng.randrange(length)
+    if i > j:
+        i, j = j, i
+    return i, j + 1
+
+
+def order_crossover(first: Sequence[T], second: Sequence[T], rng=random) -> List[T]:
+    """
+    OX: keep a slice of first in place, and fill the other positions with the
+    rest of the items in the order they follow the slice in second.
+    """
+    n = len(first)
+    i, j = cut_points(n, rng)
+    kept = set(first[i:j])
+    child: List[T] = list(first)
+    position = j % n
+    for k in range(n):
+        item = second[(j + k) % n]
+        if item not in kept:
+            child[position] = item
+            position = (position + 1) % n
+            if position == i:
+                break
+    return child
+
+
+def partially_mapped_crossover(
+    first: Sequence[T], second: Sequence[T], rng=random
+) -> List[T]:
+    """
+    PMX: keep a slice of first in place, and take the other positions from
+    second, following the mapping between the slices when an item of second
+    is already in the kept slice.
+    """
+    i, j = cut_points(len(first), rng)
+    mapping = {first[k]: second[k] for k in range(i, j)}
+    child: List[T] = list(second)
+    child[i:j] = first[i:j]
+    for k in list(range(i)) + list(range(j, len(first))):
+        item = second[k]
+        while item in mapping:
+            item = mapping[item]
+        child[k] = item
+    return child
+
+
+def edge_recombination(first: Sequence[T], second: Sequence[T], rng=random) -> List[T]:
+    """
+    ERX: build the child from the neighbours items have in either parent,
+    always moving to the neighbour with the fewest neighbours left, and to a
+    random unplaced item when there are none.
+    """
+    neighbours: Dict[T, set] = {item: set() for item in first}
+    for order in (first, second):
+        for k in range(len(order) - 1):
+            neighbours[order[k]].add(order[k + 1])
+            neighbours[order[k + 1]].add(order[k])
+    # unplaced items, with their positions in the list, for O(1) removal
+    unplaced = list(first)
+    index = {item: k for k, item in enumerate(unplaced)}
+
+    def place(item: T) -> None:
+        k = index.pop(item)
+        last = unplaced.pop()
+        if k < len(unplaced):
+            unplaced[k] = last
+            index[last] = k
+        for other in neighbours[item]:
+            neighbours[other].discard(item)
+
+    current = first[0]
+    child = [current]
+    place(current)
+    while unplaced:
+        options = neighbours[current]
+        if options:
+            fewest = min(len(neighbours[item]) for item in options)
+            candidates = [item for item in options if len(neighbours[item]) == fewest]
+            # sorted, so that a seeded rng chooses the same way every run
+            candidates.sort(key=index.__getitem__)
+            current = rng.choice(candidates)
+        else:
+            current = unplaced[rng.randrange(len(unplaced))]
+        child.append(current)
+        place(current)
+    return child
+
+
+CROSSOVERS: Dict[str, Callable[..., List]] = {
+    "ox": order_crossover,
+    "pmx": partially_mapped_crossover,
+    "erx": edge_recombination,
+}
@@ -0,0 +1,94 @@
+import os
+import random
+import tempfile
+
+from dedup import DedupIndex, chunk_hashes, expand, units
+from evaluator import make_evaluator
+from store import ContentStore
+from tarper import Runner
+
+
+def test_chunks_survive_an_insertion():
+    rng = random.Random(1)
+    data = bytes(rng.randrange(256) for _ in range(20000))
+    edited = data[:100] + b"inserted" + data[100:]
+    before = chunk_hashes(data)
+    after = chunk_hashes(edited)
+    assert len(before & after) >= len(before) - 2
+
+
+def test_expand_and_units():
+    groups = {"a": ["a", "c", "d"]}
+    assert expand(["b", "a", "e"], groups) == ["b", "a", "c", "d", "e"]
+    # a full order keeps each file once, with the rest of a unit pulled to it
+    assert expand(["c", "b", "a", "d"], groups) == ["c", "b", "a", "d"]
+    assert units(["a", "b", "c", "d", "e"], groups) == ["a", "b", "e"]
+
+
+def test_index_glues_copies_and_near_copies():
+    rng = random.Random(2)
+    base = bytes(rng.randrange(256) for _ in range(8000))
+    other = bytes(rng.randrange(256) for _ in range(8000))
+    contents = {
+        "x/1": base,
+        "y/2": other,
+        "y/3": base,
+        "z/4": base[:4000] + b"edit" + base[4000:],
+        "z/5": b"small",
+        "z/6": b"small",
+    }
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for name, data in contents.items():
+            path = os.path.join(root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            files.append(path)
+        store = ContentStore()
+        x1, y2, y3, z4, z5, z6 = files
+        assert DedupIndex(files, store, near=False).groups == {
+            x1: [x1, y3],
+            z5: [z5, z6],
+        }
+        index = DedupIndex(files, store)
+        assert index.groups == {x1: [x1, y3, z4], z5: [z5, z6]}
+        assert (index.identical, index.near) == (2, 1)
+        evaluator = make_evaluator("inprocess", root, ".gz", store, groups=index.groups)
+        plain = make_evaluator("inprocess", root, ".gz", store)
+        assert evaluator.size([y2, x1, z5]) == plain.size([y2, x1, y3, z4, z5, z6])
+
+
+def test_runner_searches_units():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        for d in range(3):
+            os.makedirs(os.path.join(source, str(d)))
+            for i in range(4):
+                with open(os.path.join(source, str(d), str(i)), "w") as f:
+                    f.write("file %d\n" % i * (50 + i))
+        runner = Runner(
+            os.path.join(root, "archive"),
+            source,
+            ".gz",
+            20,
+            evaluator="inprocess",
+            seed=1,
+            dedup="exact",
+        )
+        try:
+            assert len(runner.files()) == 4
+            for search in (
+                runner.by_swapping_with_permutation,
+                runner.by_permute_within_directory,
+                runner.by_size,
+                runner.by_naive_similarity,
+            ):
+                assert sorted(search()) == sorted(runner.files())
+            order = runner.options["counted"].order()
+        finally:
+            runner.close()
+        assert len(order) == 12
+        # the copies of each file are adjacent
+        names = [os.path.basename(file) for file in order]
+        assert names == [n for n in names[::3] for _ in range(3)]
@@ -0,0 +1,210 @@
+"""
+A content-hash index that glues duplicate files into single search units.
+
+Trees with many duplicates waste the search's effort: every method treats
+copies of a file as unrelated, and has to rediscover that they compress best
+next to each other. DedupIndex is built once per run, from the files the
+Runner walks:
+
+  - identical files, found by size and a hash of their contents, become one
+    unit, which stands for the files in walk order
+  - with near set, files are also cut into chunks at content-defined
+    boundaries, found with a gear rolling hash over the start of each file,
+    so an edit only changes the chunks around it. Files whose sets of chunk
+    hashes mostly overlap are glued into a cluster of at most MAX_CLUSTER
+    files, most similar pairs first.
+
+The rolling hash is computed with numpy when it is installed, and a byte at a
+time in Python otherwise, which is much slower.
+
+Each unit is represented by its first file in walk order. The methods search
+orders of representatives, and expand() puts each unit's files back, as an
+adjacent run, wherever its representative is. GroupedEvaluator does the same
+before scoring, so every evaluator sees whole archives.
+"""
+import hashlib
+import random
+from typing import Dict, Iterable, List, Sequence, Set
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+# the bytes at the start of each file that are cut into chunks
+SAMPLE = 1 << 15
+# chunk boundaries fall where the low bits of the rolling hash are zero, for
+# chunks of about 512 bytes, within these bounds
+CHUNK_MASK = (1 << 9) - 1
+MIN_CHUNK = 64
+MAX_CHUNK = 4096
+# files with fewer chunks than this are only deduplicated exactly
+MIN_CHUNKS = 4
+# the Jaccard similarity of chunk sets at which files are glued together
+NEAR = 0.6
+# the most files in a near-duplicate cluster
+MAX_CLUSTER = 32
+# chunks shared by more files than this are boilerplate, and not compared
+POPULAR = 64
+
+_rng = random.Random(0)
+GEAR = [_rng.getrandbits(32) for _ in range(256)]
+
+
+def chunk_hashes(data: bytes) -> Set[bytes]:
+    """The hashes of the content-defined chunks of data"""
+    hashes = set()
+    start = 0
+    for end in chunk_ends(data):
+        hashes.add(hashlib.blake2b(data[start:end], digest_size=8).digest())
+        start = end
+    return hashes
+
+
+def chunk_ends(data: bytes) -> List[int]:
+    """Where each content-defined chunk of data ends"""
+    ends = []
+    start = 0
+    for i in cut_points(data):
+        # chunks that reach MAX_CHUNK are cut before the next cut point
+        while i + 1 - start > MAX_CHUNK:
+            start += MAX_CHUNK
+            ends.append(start)
+        if i + 1 - start >= MIN_CHUNK:
+            start = i + 1
+            ends.append(start)
+    while len(data) - start >= MAX_CHUNK:
+        start += MAX_CHUNK
+        ends.append(start)
+    if start < len(data):
+        ends.append(len(data))
+    return ends
+
+
+def cut_points(data: bytes) -> Iterable[int]:
+    """The positions at which the low bits of the rolling hash are zero"""
+    if np is None:
+        return _cut_points(data)
+    gear = np.array(GEAR, dtype=np.uint32)[np.frombuffer(data, dtype=np.uint8)]
+    # each step shifts the hash left, so only the last few bytes reach the
+    # bits under the mask
+    h = gear.copy()
+    for k in range(1, CHUNK_MASK.bit_length()):
+        h[k:] += gear[:-k] << np.uint32(k)
+    return np.flatnonzero((h & np.uint32(CHUNK_MASK)) == 0).tolist()
+
+
+def _cut_points(data: bytes) -> Iterable[int]:
+    gear = GEAR
+    h = 0
+    for i, byte in enumerate(data):
+        h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+        if not h & CHUNK_MASK:
+            yield i
+
+
+def expand(order: Iterable[str], groups: Dict[str, List[str]]) -> List[str]:
+    """
+    order with each representative replaced by the files of its unit, and
+    each file kept only the first time it appears
+    """
+    seen: Set[str] = set()
+    result = []
+    for file in order:
+        for member in groups.get(file, (file,)):
+            if member not in seen:
+                seen.add(member)
+                result.append(member)
+    return result
+
+
+def units(files: Iterable[str], groups: Dict[str, List[str]]) -> List[str]:
+    """files without the ones represented by another file"""
+    members = {file for group in groups.values() for file in group[1:]}
+    return [file for file in files if file not in members]
+
+
+class DedupIndex:
+    def __init__(self, files: Sequence[str], store, near: bool = True):
+        self.store = store
+        position = {file: i for i, file in enumerate(files)}
+        exact: Dict[bytes, List[str]] = {}
+        for file in files:
+            data = store.data(file)
+            key = hashlib.blake2b(data, digest_size=16)
+            key.update(len(data).to_bytes(8, "little"))
+            exact.setdefault(key.digest(), []).append(file)
+        # the files each exact representative stands for
+        copies = {group[0]: group for group in exact.values()}
+        self.identical = sum(len(group) - 1 for group in copies.values())
+        clusters = [[file] for file in copies]
+        if near:
+            clusters = self.cluster(list(copies))
+        self.near = sum(len(cluster) - 1 for cluster in clusters)
+        self.groups: Dict[str, List[str]] = {}
+        for cluster in clusters:
+            cluster.sort(key=position.__getitem__)
+            members = [file for rep in cluster for file in copies[rep]]
+            if len(members) > 1:
+                self.groups[cluster[0]] = members
+
+    def cluster(self, files: List[str]) -> List[List[str]]:
+        """Files grouped into clusters of near-duplicates"""
+        chunks: Dict[str, Set[bytes]] = {}
+        holders: Dict[bytes, List[str]] = {}
+        for file in files:
+            hashes = chunk_hashes(bytes(self.store.data(file)[:SAMPLE]))
+            if len(hashes) < MIN_CHUNKS:
+                continue
+            chunks[file] = hashes
+            for h in hashes:
+                holders.setdefault(h, []).append(file)
+        shared: Dict[tuple, int] = {}
+        for group in holders.values():
+            if len(group) < 2 or len(group) > POPULAR:
+                continue
+            for i, left in enumerate(group):
+                for right in group[i + 1 :]:
+                    shared[left, right] = shared.get((left, right), 0) + 1
+        pairs = []
+        for (left, right), count in shared.items():
+            similarity = count / (len(chunks[left]) + len(chunks[right]) - count)
+            if similarity >= NEAR:
+                pairs.append((similarity, left, right))
+        # union-find, joining the most similar pairs first
+        parent = {file: file for file in files}
+        members = {file: [file] for file in files}
+
+        def root(file: str) -> str:
+            while parent[file] != file:
+                parent[file] = parent[parent[file]]
+                file = parent[file]
+            return file
+
+        for _, left, right in sorted(pairs, reverse=True):
+            a, b = root(left), root(right)
+            if a == b or len(members[a]) + len(members[b]) > MAX_CLUSTER:
+                continue
+            parent[b] = a
+            members[a].extend(members.pop(b))
+        return list(members.values())
+
+    def summary(self) -> str:
+        return (
+            f"dedup: {len(self.groups)} units glue {self.identical} identical and "
+            f"{self.near} near-identical files to others"
+        )
+
+
+class GroupedEvaluator:
+    """Expands units into their files before scoring them with evaluator"""
+
+    def __init__(self, evaluator, groups: Dict[str, List[str]]):
+        self.evaluator = evaluator
+        self.groups = groups
+
+    def size(self, files: List[str]) -> int:
+        return self.evaluator.size(expand(files, self.groups))
+
+    def accept(self, files: List[str]) -> None:
+        self.evaluator.accept(expand(files, self.groups))
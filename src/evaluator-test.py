@@ -0,0 +1,95 @@
+import io
+import os
+import random
+import tarfile
+import tempfile
+
+from evaluator import (
+    CliEvaluator,
+    InProcessEvaluator,
+    IN_PROCESS_TOLERANCE,
+    PrefixCacheEvaluator,
+    tar_stream,
+)
+from store import ContentStore
+from testtree import write_tree
+
+
+def make_tree(root: str, count: int = 20):
+    return write_tree(root, count, longest=2000, directories=3)
+
+
+def test_tar_stream_is_readable():
+    with tempfile.TemporaryDirectory() as root:
+        files = make_tree(root)
+        data = b"".join(tar_stream(files))
+        assert len(data) % tarfile.RECORDSIZE == 0
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            members = archive.getmembers()
+            assert [m.name for m in members] == [f.lstrip("/") for f in files]
+            with open(files[3], "rb") as f:
+                assert archive.extractfile(members[3]).read() == f.read()
+
+
+def test_in_process_matches_cli():
+    with tempfile.TemporaryDirectory() as root:
+        files = make_tree(root)
+        with tempfile.TemporaryDirectory() as workdir:
+            expected = CliEvaluator(workdir, ".gz").size(files)
+        actual = InProcessEvaluator(".gz").size(files)
+        assert abs(actual - expected) <= expected * IN_PROCESS_TOLERANCE
+
+
+def test_prefix_cache_matches_full_compression():
+    with tempfile.TemporaryDirectory() as root:
+        files = make_tree(root, 30)
+        full = InProcessEvaluator(".gz")
+        # small enough that the stride has to grow
+        cached = PrefixCacheEvaluator(".gz", PrefixCacheEvaluator.SNAPSHOT_COST * 4)
+        assert cached.size(files) == full.size(files)
+        rng = random.Random(2)
+        for _ in range(20):
+            candidate = list(files)
+            i = rng.randrange(len(files) - 1)
+            candidate[i], candidate[i + 1] = candidate[i + 1], candidate[i]
+            assert cached.size(candidate) == full.size(candidate)
+            if rng.random() < 0.5:
+                cached.accept(candidate)
+                files = candidate
+        assert len(cached.snapshots) <= cached.max_snapshots
+
+
+def test_store_matches_filesystem():
+    with tempfile.TemporaryDirectory() as root:
+        files = make_tree(root)
+        # map some of the files
+        store = ContentStore(mmap_threshold=4096)
+        assert b"".join(tar_stream(files, store)) == b"".join(tar_stream(files))
+        assert InProcessEvaluator(".gz", store).size(files) == InProcessEvaluator(
+            ".gz"
+        ).size(files)
+        store.close()
+
+
+def test_write_archive_matches_make_archive():
+    from archive import write_archive
+    from tarper import make_archive
+
+    with tempfile.TemporaryDirectory() as root:
+        files = make_tree(os.path.join(root, "tree"))
+        os.makedirs(os.path.join(root, "made"))
+        os.makedirs(os.path.join(root, "written"))
+        for extension in [".gz", ".zst"]:
+            make_archive(os.path.join(root, "made", "archive"), files, extension)
+            write_archive(
+                os.path.join(root, "written", "archive" + extension), files, extension
+            )
+            with open(os.path.join(root, "made", "archive" + extension), "rb") as f:
+                made = f.read()
+            with open(os.path.join(root, "written", "archive" + extension), "rb") as f:
+                written = f.read()
+            if extension == ".gz":
+                # everything but the time stamp
+                assert made[:4] + made[8:] == written[:4] + written[8:]
+            else:
+                assert made == written
@@ -0,0 +1,328 @@
+"""
+Evaluators compute the compressed size of an archive for a given file order.
+
+The Runner scores every candidate ordering with an evaluator. The "cli"
+evaluator builds the archive with tar and the codec's command on disk, as
+make_archive does; when the command is missing or can't express the
+backend's settings, it falls back to in-process compression. The
+"inprocess" evaluator generates the tar stream with the tarfile module and
+feeds it through a streaming compressor into a byte counting sink, so no
+processes are spawned and nothing touches the disk.
+
+The codec, its level and its window come from a backend (see backends.py),
+made from the extension and the level and window_log options.
+
+The in-process sizes track the cli sizes closely but not exactly: the tar
+headers are generated by Python rather than GNU tar, zlib's deflate is not
+byte for byte the same as gzip's, and gzip stores the name of the file it
+compressed in its header. On source trees the two agree to within
+IN_PROCESS_TOLERANCE (relative), which is far less than the differences
+between orderings that the search methods care about.
+"""
+import grp
+import os
+import pwd
+import stat
+import tarfile
+import threading
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from backends import Backend, make_backend
+from dedup import GroupedEvaluator
+
+IN_PROCESS_TOLERANCE = 0.005
+
+NUL = b"\0"
+
+
+_unames: Dict[int, str] = {}
+_gnames: Dict[int, str] = {}
+
+
+def _uname(uid: int) -> str:
+    if uid not in _unames:
+        try:
+            _unames[uid] = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            _unames[uid] = ""
+    return _unames[uid]
+
+
+def _gname(gid: int) -> str:
+    if gid not in _gnames:
+        try:
+            _gnames[gid] = grp.getgrgid(gid).gr_name
+        except KeyError:
+            _gnames[gid] = ""
+    return _gnames[gid]
+
+
+def tar_info(path: str) -> tarfile.TarInfo:
+    """Build the TarInfo that tar would record for path"""
+    st = os.lstat(path)
+    info = tarfile.TarInfo(path.replace(os.sep, "/").lstrip("/"))
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    info.uname = _uname(st.st_uid)
+    info.gname = _gname(st.st_gid)
+    info.mtime = int(st.st_mtime)
+    if stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(path)
+    else:
+        info.size = st.st_size
+    return info
+
+
+def tar_header(info: tarfile.TarInfo) -> bytes:
+    return info.tobuf(tarfile.GNU_FORMAT, "utf-8", "surrogateescape")
+
+
+def padding(length: int, boundary: int = tarfile.BLOCKSIZE) -> bytes:
+    """The zero bytes needed to pad length up to a multiple of boundary"""
+    remainder = length % boundary
+    if remainder:
+        return NUL * (boundary - remainder)
+    return b""
+
+
+def tar_member(path: str) -> Iterator[bytes]:
+    """Yield the header, data and padding of a single tar member"""
+    info = tar_info(path)
+    yield tar_header(info)
+    if info.size:
+        with open(path, "rb") as f:
+            data = f.read()
+        yield data
+        yield padding(len(data))
+
+
+def tar_trailer(length: int) -> bytes:
+    """
+    The end of archive marker, padded out to a full record, for an archive
+    whose members take up length bytes.
+    """
+    end = length + 2 * tarfile.BLOCKSIZE
+    return NUL * (2 * tarfile.BLOCKSIZE) + padding(end, tarfile.RECORDSIZE)
+
+
+def member_chunks(store) -> Callable[[str], Iterable]:
+    """The function producing tar members, from the store if there is one"""
+    if store is None:
+        return tar_member
+    return store.member
+
+
+def tar_stream(files: Iterable[str], store=None) -> Iterator[bytes]:
+    """
+    Yield the bytes of an uncompressed tar archive of files, in order. The
+    contents are taken from store, a ContentStore, if it is given.
+    """
+    member = member_chunks(store)
+    length = 0
+    for file in files:
+        for chunk in member(file):
+            length += len(chunk)
+            yield chunk
+    yield tar_trailer(length)
+
+
+class CliEvaluator:
+    """Builds the archive on disk with tar and the codec's command, then measures it"""
+
+    def __init__(self, workdir: str, extension: str, backend: Optional[Backend] = None):
+        self.workdir = workdir
+        self.extension = extension
+        self.backend = backend or make_backend(extension)
+
+    def size(self, files: List[str]) -> int:
+        # imported here, as tarper imports this module
+        from tarper import make_archive
+
+        # one file per thread, so that threads can share an evaluator
+        target = self.workdir + "/tmpfile" + str(threading.get_ident()) + ".tar"
+        make_archive(target, files, self.extension, self.backend)
+        file_name = target + self.extension
+        size = os.path.getsize(file_name)
+        os.remove(file_name)
+        return size
+
+    def accept(self, files: List[str]) -> None:
+        pass
+
+
+class InProcessEvaluator:
+    """Streams the archive through an in-process compressor into a counter"""
+
+    def __init__(self, extension: str, store=None, backend: Optional[Backend] = None):
+        self.extension = extension
+        self.store = store
+        self.backend = backend or make_backend(extension)
+
+    def size(self, files: List[str]) -> int:
+        return self.backend.size(tar_stream(files, self.store))
+
+    def accept(self, files: List[str]) -> None:
+        pass
+
+
+class Snapshot:
+    """The state of the compressor after the first index files of an order"""
+
+    def __init__(self, index: int, compressor, compressed: int, length: int):
+        self.index = index
+        self.compressor = compressor
+        # bytes of compressed output produced so far
+        self.compressed = compressed
+        # bytes of uncompressed tar fed in so far
+        self.length = length
+
+
+class PrefixCacheEvaluator:
+    """
+    An in-process evaluator that avoids recompressing the unchanged prefix of
+    an order.
+
+    It keeps snapshots of the compressor state at file boundaries along the
+    accepted order. A candidate is scored by resuming from the last snapshot
+    at or before the first position where it differs from the accepted order.
+    Snapshots are taken every `stride` files. When there are more than fit in
+    memory_limit, the stride is doubled and the snapshots off the new stride
+    are evicted. Calling accept with a new order drops the snapshots after the
+    first position where it differs from the old one.
+
+    Only codecs whose compressor state can be copied (zlib, so .gz) benefit.
+    For other codecs this behaves like InProcessEvaluator. Snapshots are
+    costed at the default window, so smaller windows only use less memory.
+    """
+
+    # deflate state at the default memLevel and window, plus bookkeeping
+    SNAPSHOT_COST = (1 << (zlib.MAX_WBITS + 2)) + (1 << (8 + 9)) + 8192
+
+    def __init__(
+        self,
+        extension: str,
+        memory_limit: int = 256 << 20,
+        store=None,
+        backend: Optional[Backend] = None,
+    ):
+        self.extension = extension
+        self.backend = backend or make_backend(extension)
+        self.member = member_chunks(store)
+        self.copyable = self.backend.copyable
+        self.max_snapshots = max(2, memory_limit // self.SNAPSHOT_COST)
+        self.base: Optional[List[str]] = None
+        self.snapshots: Dict[int, Snapshot] = {}
+        self.stride = 1
+        self.fallback = InProcessEvaluator(extension, store, self.backend)
+        # guards snapshots when the evaluator is shared between threads
+        self.lock = threading.Lock()
+
+    def size(self, files: List[str]) -> int:
+        if not self.copyable:
+            return self.fallback.size(files)
+        if self.base is None:
+            self.accept(files)
+        first = first_difference(self.base, files)
+        with self.lock:
+            snapshot = self.resume_point(first)
+        compressor = snapshot.compressor.copy()
+        compressed = snapshot.compressed
+        length = snapshot.length
+        for i in range(snapshot.index, len(files)):
+            # everything before first is shared with the accepted order
+            if i <= first and i % self.stride == 0 and i not in self.snapshots:
+                self.record(Snapshot(i, compressor.copy(), compressed, length))
+            for chunk in self.member(files[i]):
+                length += len(chunk)
+                compressed += len(compressor.compress(chunk))
+        compressed += len(compressor.compress(tar_trailer(length)))
+        return compressed + len(compressor.flush())
+
+    def resume_point(self, first: int) -> Snapshot:
+        index = first - first % self.stride
+        while index > 0 and index not in self.snapshots:
+            index -= self.stride
+        return self.snapshots[index]
+
+    def record(self, snapshot: Snapshot) -> None:
+        with self.lock:
+            self.snapshots[snapshot.index] = snapshot
+            if len(self.snapshots) > self.max_snapshots:
+                self.stride *= 2
+                self.snapshots = {
+                    k: v for k, v in self.snapshots.items() if k % self.stride == 0
+                }
+
+    def accept(self, files: List[str]) -> None:
+        """Make files the order that snapshots are kept along"""
+        if not self.copyable:
+            return
+        if self.base is None:
+            first = 0
+        else:
+            first = first_difference(self.base, files)
+        with self.lock:
+            self.snapshots = {k: v for k, v in self.snapshots.items() if k <= first}
+            if 0 not in self.snapshots:
+                self.snapshots[0] = Snapshot(0, self.backend.compressor(), 0, 0)
+            self.base = list(files)
+
+
+def first_difference(left: List[str], right: List[str]) -> int:
+    """The first index at which the two orders differ"""
+    for i, (l, r) in enumerate(zip(left, right)):
+        if l != r:
+            return i
+    return min(len(left), len(right))
+
+
+def options_backend(extension: str, options: Dict) -> Backend:
+    """The backend for extension, at the level and window_log in options"""
+    return make_backend(extension, options.get("level"), options.get("window_log"))
+
+
+def cli_evaluator(workdir: str, extension: str, store, backend: Backend):
+    """
+    The cli evaluator, or the in-process one when the codec's command isn't
+    installed or can't express the backend's settings, so that candidates
+    are scored with the settings the archive is written with
+    """
+    if not backend.available():
+        return InProcessEvaluator(extension, store, backend)
+    return CliEvaluator(workdir, extension, backend)
+
+
+EVALUATORS: Dict[str, Callable] = {
+    "cli": lambda workdir, extension, store, **options: cli_evaluator(
+        workdir, extension, store, options_backend(extension, options)
+    ),
+    "inprocess": lambda workdir, extension, store, **options: InProcessEvaluator(
+        extension, store, options_backend(extension, options)
+    ),
+    "incremental": lambda workdir, extension, store, **options: PrefixCacheEvaluator(
+        extension,
+        options.get("memory_limit", 256 << 20),
+        store,
+        options_backend(extension, options),
+    ),
+}
+
+
+def make_evaluator(kind: str, workdir: str, extension: str, store=None, **options):
+    """
+    Create an evaluator. The in-process evaluators read file contents from
+    store, a ContentStore, if it is given. Options are passed on to evaluators
+    that take them (memory_limit for "incremental", level and window_log for
+    all) and ignored by the rest. With groups, a dict from the representative
+    of each unit of duplicates to its files (see dedup.py), orders are
+    expanded before they are scored.
+    """
+    if kind not in EVALUATORS:
+        raise ValueError("Unrecognized evaluator: " + kind)
+    evaluator = EVALUATORS[kind](workdir, extension, store, **options)
+    if options.get("groups"):
+        return GroupedEvaluator(evaluator, options["groups"])
+    return evaluator
@@ -0,0 +1,43 @@
+import random
+import tempfile
+
+from fidelity import MultiFidelity, rank_correlation, ranks
+from testtree import write_tree
+
+
+def test_rank_correlation():
+    assert ranks([3, 1, 2, 1]) == [3, 0.5, 2, 0.5]
+    assert rank_correlation([1, 2, 3], [10, 20, 40]) == 1.0
+    assert rank_correlation([1, 2, 3], [3, 2, 1]) == -1.0
+    assert rank_correlation([1, 1, 1], [1, 2, 3]) is None
+
+
+def test_promotion_follows_the_proxy():
+    random.seed(7)
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        files = write_tree(root, 12, name="{}")
+        fidelity = MultiFidelity(0.25, ".gz")
+        scored = []
+
+        def exact(candidates):
+            scored.extend(candidates)
+            return [fidelity.proxy.size(c) for c in candidates]
+
+        base_size = fidelity.proxy.size(files)
+        for _ in range(30):
+            candidates = []
+            for _ in range(8):
+                candidate = list(files)
+                i, j = rng.randrange(12), rng.randrange(12)
+                candidate[i], candidate[j] = candidate[j], candidate[i]
+                candidates.append(candidate)
+            sizes, promoted = fidelity.sizes(files, base_size, candidates, exact)
+            assert len(sizes) == len(candidates)
+            # a proxy that is the target estimates sizes exactly
+            for candidate, size in zip(candidates, sizes):
+                assert size == fidelity.proxy.size(candidate)
+        assert fidelity.promoted == len(scored)
+        assert fidelity.promoted < fidelity.candidates / 2
+        assert fidelity.correlation == 1.0
+        assert fidelity.fraction == 0.25
@@ -0,0 +1,185 @@
+"""
+Multi-fidelity scoring: a fast proxy compressor screens candidates for the
+target codec.
+
+The target codec can be slow: zstd -19 --long takes far longer per candidate
+than the search takes to make one. ProxyEvaluator compresses the same tar
+stream in-process with the backend's fast level and the same window: deflate
+level 1 for .gz, zstd level 3 for .zst, xz preset 0 and so on, or deflate
+level 1 when there is no binding for the codec. MultiFidelity scores every candidate with
+the proxy, and only promotes those whose proxy delta, against the order they
+were made from, is among the best `fraction` of recent candidates to a score
+with the target. A few others are promoted anyway, to sample the proxy where
+it isn't trusted.
+
+The rank correlation of proxy and target deltas over recent promotions is
+tracked as the run goes. When it is poor, the proxy is a poor guide, and more
+candidates are promoted; when it is good, fewer are, down to the fraction
+asked for. The sizes of the candidates that aren't promoted are estimated
+from their proxy deltas, scaled by a fit of target deltas to proxy deltas.
+"""
+import random
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from backends import Backend, Gzip, make_backend
+from dedup import expand
+from evaluator import tar_stream
+from memo import SizeMemo
+
+# the chance that a candidate is promoted whatever its proxy delta
+EXPLORE = 0.05
+# the number of recent proxy deltas the promotion threshold is taken from
+RECENT = 256
+# the number of recent promotions the correlation is measured over
+PAIRS = 100
+# promotions needed before the correlation is trusted
+MIN_PAIRS = 20
+# below this rank correlation more candidates are promoted, above GOOD fewer
+POOR = 0.5
+GOOD = 0.8
+STEP = 1.25
+
+
+def proxy_backend(backend: Backend) -> Backend:
+    fast = backend.fast()
+    if fast.compressor() is None:
+        return Gzip(Gzip.fast_level)
+    return fast
+
+
+class ProxyEvaluator:
+    """Streams the archive through a fast setting of the codec into a counter"""
+
+    def __init__(
+        self,
+        extension: str,
+        store=None,
+        backend: Optional[Backend] = None,
+        groups: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.extension = extension
+        self.store = store
+        self.backend = proxy_backend(backend or make_backend(extension))
+        self.groups = groups or {}
+
+    def size(self, files: List[str]) -> int:
+        return self.backend.size(tar_stream(expand(files, self.groups), self.store))
+
+
+def ranks(values: Sequence[float]) -> List[float]:
+    """The rank of each value, averaged over ties"""
+    order = sorted(range(len(values)), key=values.__getitem__)
+    result = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            result[order[k]] = (i + j) / 2
+        i = j + 1
+    return result
+
+
+def rank_correlation(xs: Sequence[float], ys: Sequence[float]) -> Optional[float]:
+    """Spearman's rank correlation, or None when either side is constant"""
+    rx = ranks(xs)
+    ry = ranks(ys)
+    n = len(rx)
+    if n < 2:
+        return None
+    mean = (n - 1) / 2
+    covariance = sum((a - mean) * (b - mean) for a, b in zip(rx, ry))
+    vx = sum((a - mean) ** 2 for a in rx)
+    vy = sum((b - mean) ** 2 for b in ry)
+    if not vx or not vy:
+        return None
+    return covariance / (vx * vy) ** 0.5
+
+
+class MultiFidelity:
+    def __init__(
+        self,
+        fraction: float,
+        extension: str,
+        store=None,
+        backend: Optional[Backend] = None,
+        groups: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.minimum = fraction
+        self.fraction = fraction
+        self.proxy = ProxyEvaluator(extension, store, backend, groups)
+        self.memo = SizeMemo(10000)
+        self.recent: List[int] = []
+        self.pairs: List[Tuple[int, int]] = []
+        self.correlation: Optional[float] = None
+        self.candidates = 0
+        self.promoted = 0
+
+    def proxy_size(self, files: List[str]) -> int:
+        key = self.memo.key(files)
+        size = self.memo.get(key)
+        if size is None:
+            size = self.proxy.size(files)
+            self.memo.put(key, size)
+        return size
+
+    def slope(self) -> float:
+        """Target bytes per proxy byte, fitted through the origin"""
+        xx = sum(p * p for p, _ in self.pairs)
+        if not xx:
+            return 1.0
+        return sum(p * t for p, t in self.pairs) / xx
+
+    def sizes(
+        self,
+        base: List[str],
+        base_size: int,
+        candidates: List[List[str]],
+        exact: Callable[[List[List[str]]], List[int]],
+    ) -> Tuple[List[int], List[bool]]:
+        """
+        The sizes of candidates made from base, whose size is base_size, and
+        whether each was promoted and scored by exact; the rest are estimates
+        """
+        base_proxy = self.proxy_size(base)
+        deltas = [self.proxy_size(candidate) - base_proxy for candidate in candidates]
+        ranked = sorted(self.recent + deltas)
+        threshold = ranked[min(len(ranked) - 1, int(self.fraction * len(ranked)))]
+        promoted = [d <= threshold or random.random() < EXPLORE for d in deltas]
+        self.recent.extend(deltas)
+        del self.recent[:-RECENT]
+        chosen = [c for c, p in zip(candidates, promoted) if p]
+        found = iter(exact(chosen) if chosen else [])
+        slope = self.slope()
+        sizes = []
+        for delta, was_promoted in zip(deltas, promoted):
+            if was_promoted:
+                size = next(found)
+                self.pairs.append((delta, size - base_size))
+            else:
+                size = base_size + round(slope * delta)
+            sizes.append(size)
+        del self.pairs[:-PAIRS]
+        self.candidates += len(candidates)
+        self.promoted += len(chosen)
+        self.adapt()
+        return sizes, promoted
+
+    def adapt(self) -> None:
+        if len(self.pairs) < MIN_PAIRS:
+            return
+        self.correlation = rank_correlation(*zip(*self.pairs))
+        if self.correlation is None:
+            return
+        if self.correlation < POOR:
+            self.fraction = min(1.0, self.fraction * STEP)
+        elif self.correlation > GOOD:
+            self.fraction = max(self.minimum, self.fraction / STEP)
+
+    def summary(self) -> str:
+        correlation = "n/a" if self.correlation is None else f"{self.correlation:.2f}"
+        return (
+            f"promoted {self.promoted} of {self.candidates} candidates to the target codec, "
+            f"proxy rank correlation {correlation}, promoting {100 * self.fraction:.0f}%"
+        )
@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from tarper import Runner
+from testtree import write_tree
+
+
+def run(src: str, crossover: str) -> Runner:
+    return Runner(
+        os.path.join(src, "archive"),
+        src,
+        ".gz",
+        64,
+        evaluator="inprocess",
+        seed=5,
+        islands=1,
+        population=8,
+        migration=2,
+        crossover=crossover,
+    )
+
+
+def test_genetic_is_repeatable_with_one_island():
+    with tempfile.TemporaryDirectory() as src:
+        write_tree(src, 10)
+        for crossover in ("ox", "pmx", "erx"):
+            orders = []
+            for _ in range(2):
+                runner = run(src, crossover)
+                try:
+                    files = runner.files()
+                    order = runner.options["genetic"].order()
+                    default_size = runner.compute_size(files)
+                    assert sorted(order) == sorted(files)
+                    assert runner.compute_size(order) <= default_size
+                    orders.append(order)
+                finally:
+                    runner.close()
+            assert orders[0] == orders[1], crossover
+
+
+def test_islands_stop_once_nothing_new_is_bred():
+    with tempfile.TemporaryDirectory() as src:
+        write_tree(src, 3)
+        runner = run(src, "ox")
+        try:
+            order = runner.options["genetic"].order()
+            # three files have six orders, and only new ones are counted
+            assert runner.telemetry.summary()["evaluations"] <= 6
+            assert sorted(order) == sorted(runner.files())
+        finally:
+            runner.close()
@@ -0,0 +1,197 @@
+"""
+An island-model genetic search.
+
+Each island is a process that evolves its own population of orders, with its
+own evaluator, content store and memo, and its own random state, seeded
+from the run's. Every generation, it breeds as many
+children as its population with one of the crossovers in crossover.py, from
+parents picked by tournament, mutates some of them with a swap, and keeps the
+best distinct orders of parents and children. Every `migration` generations,
+it sends copies of its best orders to the next island in a ring, and keeps
+the best distinct orders of its population and the ones sent to it.
+
+Islands only exchange a few orders now and then, and those go through queues
+as arrays of file ids, so the islands scale with the number of cores. Each
+island runs its share of the evaluations, counting only the orders its memo
+hasn't seen, until the deadline, or until a generation breeds nothing new.
+With more than one island, when migrants arrive depends on timing, so seeded
+runs are only repeatable with a single island, which doesn't migrate.
+"""
+import array
+import multiprocessing
+import os
+import queue
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from crossover import CROSSOVERS
+from evaluator import make_evaluator
+from memo import SizeMemo
+from store import ContentStore
+
+# the chance that a child is mutated with a swap
+MUTATION = 0.5
+# the number of orders sent to the next island when migrating
+ELITES = 2
+
+
+def encode(order: List[str], ids: Dict[str, int]) -> bytes:
+    return array.array("I", [ids[file] for file in order]).tobytes()
+
+
+def decode(data: bytes, files: List[str]) -> List[str]:
+    ids = array.array("I")
+    ids.frombytes(data)
+    return [files[i] for i in ids]
+
+
+def tournament(population: List[List[str]], sizes: List[int]) -> List[str]:
+    """The smaller of two orders picked at random"""
+    i = random.randrange(len(population))
+    j = random.randrange(len(population))
+    return population[i] if sizes[i] <= sizes[j] else population[j]
+
+
+def select(
+    orders: List[List[str]], sizes: List[int], count: int, memo: SizeMemo
+) -> Tuple[List[List[str]], List[int]]:
+    """The count smallest distinct orders"""
+    ranked = sorted(range(len(orders)), key=sizes.__getitem__)
+    seen = set()
+    kept: List[List[str]] = []
+    kept_sizes: List[int] = []
+    for i in ranked:
+        key = memo.key(orders[i])
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(orders[i])
+        kept_sizes.append(sizes[i])
+        if len(kept) == count:
+            break
+    return kept, kept_sizes
+
+
+def island(
+    index: int,
+    files: List[str],
+    settings: Dict,
+    inbox: "multiprocessing.Queue",
+    outbox: Optional["multiprocessing.Queue"],
+    results: "multiprocessing.Queue",
+) -> None:
+    """
+    Evolve one island, putting its best order and size on results. Without an
+    outbox, the island is alone, and there is no migration.
+    """
+    # imported here, as tarper imports this module
+    from tarper import swap
+
+    random.seed(settings["seed"] + index)
+    if outbox is not None:
+        # migrants that are never taken in mustn't keep the island from exiting
+        outbox.cancel_join_thread()
+    workdir = os.path.join(settings["workdir"], "island" + str(index))
+    os.makedirs(workdir, exist_ok=True)
+    store = ContentStore()
+    evaluator = make_evaluator(
+        settings["evaluator"], workdir, settings["extension"], store, **settings["options"]
+    )
+    memo = SizeMemo()
+    evaluations = 0
+
+    def score(order: List[str]) -> int:
+        nonlocal evaluations
+        key = memo.key(order)
+        size = memo.get(key)
+        if size is None:
+            evaluations += 1
+            size = evaluator.size(order)
+            memo.put(key, size)
+        return size
+
+    def out_of_time() -> bool:
+        deadline = settings["deadline"]
+        return deadline is not None and time.monotonic() >= deadline
+
+    ids = {file: i for i, file in enumerate(files)}
+    cross = CROSSOVERS[settings["crossover"]]
+    size = settings["population"]
+    population = [list(files)]
+    while len(population) < size:
+        order = list(files)
+        for _ in range(random.randrange(1, 6)):
+            swap(order)
+        population.append(order)
+    sizes = [score(order) for order in population]
+    generation = 0
+    while evaluations < settings["budget"] and not out_of_time():
+        children = []
+        for _ in range(min(size, settings["budget"] - evaluations)):
+            child = cross(tournament(population, sizes), tournament(population, sizes))
+            if random.random() < MUTATION:
+                swap(child)
+            children.append(child)
+        before = evaluations
+        child_sizes = [score(child) for child in children]
+        population, sizes = select(
+            population + children, sizes + child_sizes, size, memo
+        )
+        generation += 1
+        if evaluations == before:
+            # every child was bred before, so the island has converged
+            break
+        if outbox is not None and generation % settings["migration"] == 0:
+            outbox.put([encode(order, ids) for order in population[:ELITES]])
+            migrants = []
+            while True:
+                try:
+                    migrants.extend(decode(data, files) for data in inbox.get_nowait())
+                except queue.Empty:
+                    break
+            if migrants:
+                population, sizes = select(
+                    population + migrants,
+                    sizes + [score(order) for order in migrants],
+                    size,
+                    memo,
+                )
+    store.close()
+    results.put((index, encode(population[0], ids), sizes[0], evaluations, generation))
+
+
+def evolve(
+    files: List[str],
+    islands: int,
+    settings: Dict,
+) -> List[Tuple[int, List[str], int, int, int]]:
+    """
+    Run islands, returning (index, best order, size, evaluations, generations)
+    for each of them.
+    """
+    inboxes = [multiprocessing.Queue() for _ in range(islands)]
+    # a lone island would only send migrants to itself
+    outboxes = [inboxes[(i + 1) % islands] if islands > 1 else None for i in range(islands)]
+    results: "multiprocessing.Queue" = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=island,
+            args=(i, files, settings, inboxes[i], outboxes[i], results),
+        )
+        for i in range(islands)
+    ]
+    for process in processes:
+        process.start()
+    found = []
+    while len(found) < islands:
+        try:
+            index, data, size, evaluations, generations = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes) and results.empty():
+                raise RuntimeError("an island exited without a result")
+            continue
+        found.append((index, decode(data, files), size, evaluations, generations))
+    for process in processes:
+        process.join()
+    return sorted(found)
@@ -0,0 +1,56 @@
+import os
+import random
+import tempfile
+
+from evaluator import make_evaluator
+from hierarchy import directory_blocks, improve_block, improve_blocks, order_blocks
+
+
+def test_directory_blocks():
+    files = ["a/1", "a/2", "b/1", "c/1", "c/2", "c/3", "c/4", "c/5", "d/1"]
+    assert directory_blocks(files, 3, 4) == [
+        ["a/1", "a/2", "b/1"],
+        ["c/1", "c/2", "c/3", "c/4"],
+        ["c/5", "d/1"],
+    ]
+    assert directory_blocks([], 3, 4) == []
+
+
+def test_blocks_are_ordered_and_improved():
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for d in range(6):
+            os.makedirs(os.path.join(root, str(d)))
+            words = ["topic%d_%d" % (d % 3, k) for k in range(20)]
+            for i in range(5):
+                name = os.path.join(root, str(d), str(i))
+                with open(name, "w") as f:
+                    f.write(" ".join(rng.choice(words) for _ in range(300)))
+                files.append(name)
+        blocks = order_blocks(directory_blocks(files, 1))
+        assert sorted(f for block in blocks for f in block) == sorted(files)
+        # blocks with the same topic are chained together
+        topics = [int(os.path.basename(os.path.dirname(block[0]))) % 3 for block in blocks]
+        assert sum(a != b for a, b in zip(topics, topics[1:])) == 2
+        evaluator = make_evaluator("inprocess", root, ".gz", None)
+        results = improve_blocks(
+            blocks, [30] * len(blocks), list(range(len(blocks))), None, 1, evaluator, None
+        )
+        for block, (order, size, start_size, evaluations) in zip(blocks, results):
+            assert sorted(order) == sorted(block)
+            assert size <= start_size
+            assert 1 < evaluations <= 30
+
+
+def test_improve_block_counts_only_compressions():
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for i in range(2):
+            files.append(os.path.join(root, str(i)))
+            with open(files[-1], "w") as f:
+                f.write(str(i) * 100)
+        evaluator = make_evaluator("inprocess", root, ".gz", None)
+        order, size, start_size, evaluations = improve_block(files, 30, 1, None, evaluator)
+        # there are only two orders to compress
+        assert evaluations == 2
@@ -0,0 +1,176 @@
+"""
+Hierarchical optimization for trees too large to search as one permutation.
+
+Files are first grouped into blocks: the files of a directory, in walk order,
+with small neighbouring directories clustered together until a block has
+MIN_BLOCK files, and directories larger than MAX_BLOCK split into several
+blocks. Blocks are ordered as units with minhash_order, on signatures of the
+union of the tokens of their files (see tokens.py), so blocks with similar
+contents end up together. Without a token cache, only the start of each file
+is tokenized.
+
+Then the order of the files within each block is improved by a hill climb of
+random swaps, scoring the block alone. Each block has a bounded budget of
+evaluations, and the searches are independent, so they run in parallel, each
+seeded from the run's random state. As both the block size and the budget
+are bounded, the time taken grows linearly with the number of files, rather
+than with the size of the permutation space.
+"""
+import os
+import random
+import time
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from memo import SizeMemo
+from minhash import minhash_order
+from parallel import worker_evaluator
+from tokens import TokenCache, tokenize
+
+# blocks are built up from directories until they have this many files
+MIN_BLOCK = 8
+# and directories with more files than this are split
+MAX_BLOCK = 256
+# the bytes at the start of each file whose tokens make up a block's
+# signature, without a token cache
+SAMPLE = 1 << 12
+# tokens this long or shorter are left out of signatures
+MIN_LENGTH = 3
+
+
+def directory_blocks(
+    files: Sequence[str], min_block: int = MIN_BLOCK, max_block: int = MAX_BLOCK
+) -> List[List[str]]:
+    """Files grouped into blocks by directory, in the order they're given"""
+    directories: List[List[str]] = []
+    for file in files:
+        directory = os.path.dirname(file)
+        if directories and os.path.dirname(directories[-1][0]) == directory:
+            directories[-1].append(file)
+        else:
+            directories.append([file])
+    blocks: List[List[str]] = []
+    current: List[str] = []
+    for directory in directories:
+        for start in range(0, len(directory), max_block):
+            current.extend(directory[start : start + max_block])
+            if len(current) >= min_block:
+                blocks.append(current)
+                current = []
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def sample(file: str, store=None) -> bytes:
+    if store is not None:
+        return bytes(store.data(file)[:SAMPLE])
+    with open(file, "rb") as f:
+        return f.read(SAMPLE)
+
+
+def block_words(
+    block: Sequence[str], store=None, tokens: Optional[TokenCache] = None
+) -> Iterator[str]:
+    for file in block:
+        if tokens is not None:
+            yield from tokens.words(file, MIN_LENGTH, store)
+        else:
+            yield from tokenize(sample(file, store), MIN_LENGTH)
+
+
+def order_blocks(
+    blocks: List[List[str]],
+    store=None,
+    num_perm: int = 64,
+    bands: int = 16,
+    tokens: Optional[TokenCache] = None,
+) -> List[List[str]]:
+    """Blocks in a greedy chain of similar blocks"""
+    keys = [str(i) for i in range(len(blocks))]
+    ordered = minhash_order(
+        keys, lambda key: block_words(blocks[int(key)], store, tokens), num_perm, bands
+    )
+    return [blocks[int(key)] for key in ordered]
+
+
+def improve_block(
+    block: List[str],
+    budget: int,
+    seed: int,
+    deadline: Optional[float],
+    evaluator,
+) -> Tuple[List[str], int, int, int]:
+    """
+    Hill climb on budget swaps within block, returning the best order found,
+    its size, the size of block as given, and the number of orders compressed,
+    which leaves out the ones remembered
+    """
+    rng = random.Random(seed)
+    memo = SizeMemo(budget)
+    best = list(block)
+    evaluator.accept(best)
+    start_size = best_size = evaluator.size(best)
+    memo.put(memo.key(best), best_size)
+    evaluations = 1
+    if len(block) < 2:
+        return best, best_size, start_size, evaluations
+    for _ in range(budget - 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        candidate = list(best)
+        i = rng.randrange(len(candidate))
+        j = rng.randrange(len(candidate))
+        candidate[i], candidate[j] = candidate[j], candidate[i]
+        key = memo.key(candidate)
+        size = memo.get(key)
+        if size is None:
+            size = evaluator.size(candidate)
+            evaluations += 1
+            memo.put(key, size)
+        # as elsewhere, improvements of a byte may be noise
+        if size + 1 < best_size:
+            best = candidate
+            best_size = size
+            evaluator.accept(best)
+    return best, best_size, start_size, evaluations
+
+
+def _improve_in_worker(
+    args: Tuple[List[str], int, int, Optional[float]]
+) -> Tuple[List[str], int, int, int]:
+    block, budget, seed, deadline = args
+    return improve_block(block, budget, seed, deadline, worker_evaluator())
+
+
+def improve_blocks(
+    blocks: List[List[str]],
+    budgets: List[int],
+    seeds: List[int],
+    deadline: Optional[float],
+    workers: int,
+    evaluator,
+    pool: Callable,
+) -> List[Tuple[List[str], int, int, int]]:
+    """
+    Improve every block, in a pool of processes made by pool(workers) when
+    there is more than one worker, and with evaluator otherwise
+    """
+    work = [
+        (block, budget, seed, deadline)
+        for block, budget, seed in zip(blocks, budgets, seeds)
+    ]
+    if workers <= 1:
+        return [improve_block(*args, evaluator) for args in work]
+    executor = pool(workers)
+    try:
+        return list(executor.map(_improve_in_worker, work))
+    finally:
+        executor.shutdown()
+
+
+def block_budgets(blocks: List[List[str]], count: int, block_budget: int) -> List[int]:
+    """The count shared between blocks by their number of files, up to block_budget each"""
+    total = sum(len(block) for block in blocks) or 1
+    return [
+        max(1, min(block_budget, count * len(block) // total)) for block in blocks
+    ]
@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import history
+from history import History, order_key
+from tarper import Runner
+from testtree import write_tree
+
+
+def make_tree(root: str) -> str:
+    source = os.path.join(root, "source")
+    write_tree(source, 8, seed=4, name="{}")
+    return source
+
+
+def test_sizes_are_batched_and_kept():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "history.sqlite")
+        batch = history.BATCH
+        history.BATCH = 3
+        try:
+            saved = History(path, b"corpus", "codec")
+            for i in range(4):
+                saved.record(order_key([str(i)]), 100 - i, [str(i)])
+            # the first three are written, the last is waiting
+            assert len(saved.pending) == 1
+            assert saved.sizes([order_key(["3"])]) == {order_key(["3"]): 97}
+            saved.close()
+        finally:
+            history.BATCH = batch
+        saved = History(path, b"corpus", "codec")
+        keys = [order_key([str(i)]) for i in range(5)]
+        assert saved.sizes(keys) == {keys[i]: 100 - i for i in range(4)}
+        assert saved.best() == (["3"], 97)
+        saved.close()
+        other = History(path, b"corpus", "other codec")
+        assert other.sizes(keys) == {}
+        assert other.best() is None
+        other.close()
+
+
+def test_runs_reuse_sizes_and_start_from_the_best():
+    with tempfile.TemporaryDirectory() as root:
+        source = make_tree(root)
+        path = os.path.join(root, "history.sqlite")
+
+        def runner():
+            return Runner(
+                os.path.join(root, "archive"),
+                source,
+                ".gz",
+                30,
+                evaluator="inprocess",
+                seed=1,
+                history=path,
+            )
+
+        first = runner()
+        try:
+            order = first.options["counted"].order()
+            best = first.history.best()
+            # the history keeps the smallest order scored, which may not be
+            # the one the method ends on
+            assert best[1] <= first.compute_size(order)
+        finally:
+            first.close()
+        order = best[0]
+
+        second = runner()
+        try:
+            second.method = "counted"
+            assert second.start() == order
+            calls = []
+            size = second.evaluator.size
+            second.evaluator.size = lambda files: calls.append(files) or size(files)
+            assert second.compute_size(order) == best[1]
+            assert calls == []
+        finally:
+            second.close()
@@ -0,0 +1,140 @@
+"""
+A record of the sizes of orders across runs.
+
+Every run starts from scratch, and the sizes measured by earlier runs on the
+same tree are lost. History keeps them in SQLite, keyed by a fingerprint of
+the corpus, the codec settings and a hash of the order, along with the best
+order recorded for each corpus and codec. Runs look up the orders they are
+about to score before compressing them, and the search methods can start
+from the best recorded order.
+
+The fingerprint covers the tar header and a hash of the contents of every
+file, as the compressed size depends on both: touching a file changes its
+header, and starts a new record. Orders are hashed as the sequence of their
+paths, so the hash doesn't depend on the ids a run gives files.
+
+Sizes are written in batches of BATCH, in one transaction each, and when the
+history is closed. Lookups see the sizes waiting to be written.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# sizes recorded between writes
+BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sizes (
+    corpus BLOB, codec TEXT, hash BLOB, size INTEGER,
+    PRIMARY KEY (corpus, codec, hash)
+);
+CREATE TABLE IF NOT EXISTS best (
+    corpus BLOB, codec TEXT, size INTEGER, files TEXT,
+    PRIMARY KEY (corpus, codec)
+);
+"""
+
+
+def corpus_fingerprint(files: Sequence[str], store) -> bytes:
+    """A hash of the headers and contents of files, in any order"""
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for file in sorted(files):
+        fingerprint.update(store.header(file))
+        fingerprint.update(hashlib.blake2b(store.data(file), digest_size=16).digest())
+    return fingerprint.digest()
+
+
+def order_key(order: Sequence[str]) -> bytes:
+    data = "\0".join(order).encode("utf-8", "surrogateescape")
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class History:
+    def __init__(self, path: str, corpus: bytes, codec: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # runs on the same tree may share the history
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.executescript(SCHEMA)
+        self.corpus = corpus
+        self.codec = codec
+        self.pending: Dict[bytes, int] = {}
+        row = self.connection.execute(
+            "SELECT size, files FROM best WHERE corpus = ? AND codec = ?",
+            (corpus, codec),
+        ).fetchone()
+        self.best_size: Optional[int] = None
+        self.best_order: Optional[List[str]] = None
+        if row is not None:
+            self.best_size = row[0]
+            self.best_order = json.loads(row[1])
+        self.best_changed = False
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.recorded = 0
+
+    def sizes(self, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        """The recorded sizes of the orders with the given keys"""
+        found = {key: self.pending[key] for key in keys if key in self.pending}
+        wanted = [key for key in set(keys) if key not in found]
+        # within SQLite's limit on the number of parameters
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start : start + 500]
+            rows = self.connection.execute(
+                "SELECT hash, size FROM sizes WHERE corpus = ? AND codec = ? "
+                "AND hash IN (" + ",".join("?" * len(chunk)) + ")",
+                [self.corpus, self.codec] + chunk,
+            )
+            found.update(rows)
+        self.hits += sum(1 for key in keys if key in found)
+        return found
+
+    def record(self, key: bytes, size: int, order: List[str]) -> None:
+        """Record the size of order, whose key is key"""
+        self.pending[key] = size
+        self.recorded += 1
+        if self.best_size is None or size < self.best_size:
+            self.best_size = size
+            self.best_order = list(order)
+            self.best_changed = True
+        if len(self.pending) >= BATCH:
+            self.flush()
+
+    def best(self) -> Optional[Tuple[List[str], int]]:
+        """The best order recorded, and its size"""
+        if self.best_order is None or self.best_size is None:
+            return None
+        return self.best_order, self.best_size
+
+    def flush(self) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?)",
+                [
+                    (self.corpus, self.codec, key, size)
+                    for key, size in self.pending.items()
+                ],
+            )
+            if self.best_changed:
+                # another run may have found a better one meanwhile
+                self.connection.execute(
+                    "INSERT INTO best VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (corpus, codec) DO UPDATE SET "
+                    "size = excluded.size, files = excluded.files "
+                    "WHERE excluded.size < best.size",
+                    (self.corpus, self.codec, self.best_size, json.dumps(self.best_order)),
+                )
+        self.pending = {}
+        self.best_changed = False
+
+    def summary(self) -> str:
+        return f"history: {self.hits} sizes from earlier runs, {self.recorded} recorded"
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
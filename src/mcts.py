@@ -1,9 +1,58 @@
 import random
 import sys
 
-from collections import defaultdict
+from collections.abc import Mapping
 from math import sqrt
-from typing import List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from crossover import follow_merge, prefix_fill
+
+
+class Names:
+    """
+    The files of a tree, interned to integer ids. Shared by every node of the
+    tree, so that nodes only store their file's id.
+    """
+
+    __slots__ = ("ids", "files", "base_order")
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.files: List[str] = []
+        self.base_order: Dict[str, int] = {}
+
+    def intern(self, file: str) -> int:
+        i = self.ids.get(file)
+        if i is None:
+            i = self.ids[file] = len(self.files)
+            self.files.append(file)
+        return i
+
+
+class Children(Mapping):
+    """A read-only view of the children of a node, keyed by file"""
+
+    __slots__ = ("node",)
+
+    def __init__(self, node: "Node"):
+        self.node = node
+
+    def __getitem__(self, key: str) -> "Node":
+        i = self.node.names.ids.get(key)
+        for child in self.node.nodes or ():
+            if child.id == i:
+                return child
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        files = self.node.names.files
+        return (files[child.id] for child in self.node.nodes or ())
+
+    def __len__(self) -> int:
+        return len(self.node.nodes or ())
+
+    def values(self):
+        return list(self.node.nodes or ())
 
 
 class Node:
@@ -11,48 +60,106 @@ class Node:
     Stores data about a subtree of the full mcts tree. The Runner class
     is responsible for doing the actual computations, files manipulation,
     etc.
+
+    Nodes use slots, and refer to their file by an integer id, interned in
+    the Names shared by the tree. Children are in a list in the order they
+    were added, which is only created when a node gets its first child. Most
+    nodes are on a single path and have at most one child, and few have more
+    than a handful after pruning, so a list is both smaller and as quick to
+    search as a dict. Nodes know their depth, so paths are built without
+    reversing.
     """
 
-    def __init__(self):
+    __slots__ = ("min", "max", "id", "depth", "parent", "nodes", "names")
+
+    def __init__(self, parent: Optional["Node"] = None, id: int = -1):
         self.max = 0
         self.min = -1
-        self.key = None
-        self.base_order = {}
-        self.parent = None
-        self.children: DefaultDict[str, Node] = defaultdict(Node)
+        self.id = id
+        self.parent = parent
+        # None until there is a child
+        self.nodes: Optional[List[Node]] = None
+        if parent is None:
+            self.depth = 0
+            self.names = Names()
+        else:
+            self.depth = parent.depth + 1
+            self.names = parent.names
+
+    @property
+    def key(self) -> Optional[str]:
+        if self.id < 0:
+            return None
+        return self.names.files[self.id]
+
+    @property
+    def children(self) -> Children:
+        return Children(self)
+
+    @property
+    def base_order(self) -> Dict[str, int]:
+        return self.names.base_order
+
+    def child(self, key: str) -> "Node":
+        """The child for key, which is created if it doesn't exist"""
+        i = self.names.intern(key)
+        if self.nodes is None:
+            self.nodes = []
+        for child in self.nodes:
+            if child.id == i:
+                return child
+        child = Node(self, i)
+        self.nodes.append(child)
+        return child
 
     def size(self) -> int:
         size = 0
-        if len(self.children) == 0:
-            return 1
-        for child in self.children.values():
-            size += child.size()
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.nodes:
+                stack.extend(node.nodes)
+            else:
+                size += 1
         return size
 
     def set_base_order(self, path: List[str]) -> None:
         for i, key in enumerate(path):
-            self.base_order[key] = i
+            self.names.intern(key)
+            self.names.base_order[key] = i
 
     def print_order(self, path: List[str], size) -> None:
         order = [self.base_order[key] for key in path]
         print(str(order) + ": " + str(size))
-    
+
     def update(self, path: List[str], value) -> None:
         """
         Update the tree for a particular path, and value
         """
+        intern = self.names.intern
         current = self
         had_update = False
         for i, key in enumerate(path):
-            updated = current.update_value(value)
-            if updated and not had_update:
-                had_update = True
-                print(f"updating #{i} to {value}")
-            child = current.children[key]
-            # initialize the child as it may be created from the default dict
-            if not child.parent:
-                child.parent = current
-                child.key = key
+            # update_value, inlined as this is the hottest loop of mcts
+            if current.max < value:
+                current.max = value
+            if current.min > value:
+                current.min = value
+                if not had_update:
+                    had_update = True
+                    print(f"updating #{i} to {value}")
+            elif current.min == -1:
+                current.min = value
+            j = intern(key)
+            nodes = current.nodes
+            if nodes is None:
+                nodes = current.nodes = []
+            for child in nodes:
+                if child.id == j:
+                    break
+            else:
+                child = Node(current, j)
+                nodes.append(child)
             current = child
         current.update_value(value)
 
@@ -77,8 +184,13 @@ class Node:
             if child is None:
                 return current
             current = child
-        while current.children:
-            current = current.choose_child(ratio)
+        while current.nodes:
+            if len(current.nodes) == 1:
+                # as choose_child would, drawing the random number it draws
+                random.random()
+                current = current.nodes[0]
+            else:
+                current = current.choose_child(ratio)
         return current
 
     def best_path(self) -> List[str]:
@@ -90,19 +202,18 @@ class Node:
             else:
                 current = child
 
-    def best_child(self):  # -> Optional[Tuple[str, Node]]:
-        children = [elem for elem in self.children.values() if elem.min == self.min]
+    def best_child(self):  # -> Optional[Node]:
+        if not self.nodes:
+            return None
+        children = [elem for elem in self.nodes if elem.min == self.min]
         if children:
             return random.choice(children)
         return None
 
     def choose_child(self, ratio: float):  # -> Node:
-        max_prob = 0
-        best_child = None
-        weights = [self.weight(child, ratio) for child in self.children.values()]
-
-        best_child = random.choices(list(self.children.values()), weights)
-        return best_child[0]
+        children = self.nodes
+        weights = [self.weight(child, ratio) for child in children]
+        return random.choices(children, weights)[0]
 
     def weight(self, child, ratio: float) -> int:
         # quality in [0, 1]
@@ -115,67 +226,49 @@ class Node:
 
     def path(self) -> List[str]:
         """
-        Return the path from the current node to the root of the tree.
+        Return the path from the root of the tree to the current node.
         """
-        path = []
+        files = self.names.files
+        path: List[str] = [None] * self.depth  # type: ignore
         current = self
-        while current:
-            if current.key:
-                path.append(current.key)
+        while current.parent is not None:
+            path[current.depth - 1] = files[current.id]
             current = current.parent
-        return list(reversed(path))
-
-    def prune_tree(self, count, depth = 0) -> None:
-        values = sorted([v.min for (k, v) in self.children.items()])[:count]
-        if values:
-            boundary = values[-1]
-            new_children = {
-                k: v for (k, v) in self.children.items() if v.min <= boundary
-            }
-            self.children = defaultdict(Node)
-            for k, v in new_children.items():
-                self.children[k] = v
-            for v in self.children.values():
+        return path
+
+    def prune_tree(self, count, depth=0) -> None:
+        """
+        Keep the count children with the smallest minimums, or more when they
+        tie, and prune their subtrees in turn. Below depth, the first child
+        keeps count children, and each later one, one fewer.
+        """
+        stack = [(self, count, depth)]
+        while stack:
+            node, count, depth = stack.pop()
+            if not node.nodes:
+                continue
+            boundary = sorted([child.min for child in node.nodes])[:count][-1]
+            node.nodes = [child for child in node.nodes if child.min <= boundary]
+            for child in node.nodes:
+                stack.append((child, max(count, 1), depth - 1))
                 if depth <= 0:
                     count = count - 1
-                v.prune_tree(max(count, 1), depth - 1)
 
     def new_path(
         self, files: List[str], path: List[str], forced_depth: int
     ) -> List[str]:
         keep = random.randrange(max(forced_depth, 1), len(files) - 1)
-        path_prefix = path[0:keep]
-        trailing = [file for file in files if file not in path_prefix]
-        random.shuffle(trailing)
-        path_prefix.extend(trailing)
-        return path_prefix
+        return prefix_fill(files, path, keep)
 
     def combined_path(
         self, files: List[str], path: List[str], forced_depth: int
     ) -> List[str]:
         second_path = self.choose_path(5, forced_depth=forced_depth).path()
-        combined_path = []
-        chosen = set()
-        for i, file in enumerate(path):
-            if file in chosen:
-                continue
-            next_file = file
-            combined_path.append(next_file)
-            chosen.add(next_file)
-            if random.randrange(0, 1) < 0.1:
-                follower = self.choose_follower(second_path, chosen, file)
-                if follower and follower not in chosen:
-                    chosen.add(follower)
-                    combined_path.append(follower)
+        # randrange(0, 1) is always 0, so this always follows, but it draws
+        # random bits, which seeded runs depend on
+        combined_path = follow_merge(
+            path, second_path, lambda: random.randrange(0, 1) < 0.1
+        )
         if len(combined_path) != len(files):
             raise ValueError()
         return combined_path
-
-    def choose_follower(
-        self, second_path: List[str], chosen: set[str], file: str
-    ) -> Optional[str]:
-        for j, second_file in enumerate(second_path):
-            if second_file == file:
-                if j + 1 < len(second_path):
-                    return second_path[j + 1]
-        return None
@@ -0,0 +1,30 @@
+from memo import SizeMemo
+
+
+def test_least_recently_used_sizes_are_evicted():
+    memo = SizeMemo(2)
+    a, b, c = (memo.key(order) for order in (["x", "y"], ["y", "x"], ["x"]))
+    assert len({a, b, c}) == 3
+    assert memo.key(["x", "y"]) == a
+    memo.put(a, 10, 1.0)
+    memo.put(b, 20, 3.0)
+    # using a makes b the least recently used
+    assert memo.get(a) == 10
+    memo.put(c, 30)
+    assert memo.get(b) is None
+    assert memo.get(a) == 10
+    assert memo.get(c) == 30
+
+
+def test_hits_and_misses_are_counted():
+    memo = SizeMemo()
+    key = memo.key(["x"])
+    assert memo.get(key) is None
+    memo.put(key, 5, 2.0)
+    assert memo.get(key) == 5
+    assert memo.get(key) == 5
+    assert (memo.hits, memo.misses) == (2, 1)
+    assert memo.saved_time() == 4.0
+    assert memo.summary() == "memo hits=2, misses=1, hit rate=66.7%, saved about 4.0s"
+    memo.reset_stats()
+    assert (memo.hits, memo.misses, memo.saved_time()) == (0, 0, 0.0)
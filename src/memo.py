@@ -0,0 +1,72 @@
+"""
+A memo of the sizes of orderings that have already been scored.
+
+The search methods often come back to an order they have already scored:
+random swaps undo each other, and combined_path frequently returns the
+parent path. SizeMemo remembers the sizes of recently scored orders, keyed
+by a hash of the order expressed as integer file ids, and evicts the least
+recently used entries beyond its capacity. It counts hits and misses, and the
+time spent computing the misses, which gives an estimate of the compression
+time the hits saved.
+"""
+import array
+import collections
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+
+class SizeMemo:
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self.ids: Dict[str, int] = {}
+        self.sizes: "collections.OrderedDict[bytes, int]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.miss_time = 0.0
+
+    def key(self, files: List[str]) -> bytes:
+        ids = array.array("I")
+        for file in files:
+            i = self.ids.get(file)
+            if i is None:
+                i = self.ids.setdefault(file, len(self.ids))
+            ids.append(i)
+        return hashlib.blake2b(ids.tobytes(), digest_size=16).digest()
+
+    def get(self, key: bytes) -> Optional[int]:
+        with self.lock:
+            size = self.sizes.get(key)
+            if size is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.sizes.move_to_end(key)
+            return size
+
+    def put(self, key: bytes, size: int, elapsed: float = 0.0) -> None:
+        """Remember size, which took elapsed seconds to compute"""
+        with self.lock:
+            self.miss_time += elapsed
+            self.sizes[key] = size
+            self.sizes.move_to_end(key)
+            while len(self.sizes) > self.capacity:
+                self.sizes.popitem(last=False)
+
+    def saved_time(self) -> float:
+        """An estimate of the time the hits saved"""
+        if not self.misses:
+            return 0.0
+        return self.hits * self.miss_time / self.misses
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+        return (
+            f"memo hits={self.hits}, misses={self.misses}, hit rate={rate:.1%}, "
+            f"saved about {self.saved_time():.1f}s"
+        )
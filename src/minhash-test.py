@@ -0,0 +1,27 @@
+from minhash import estimated_similarity, minhash_order, signature
+
+
+def test_identical_sets_have_identical_signatures():
+    assert signature(["a", "b", "c"], 32) == signature(["c", "b", "a", "a"], 32)
+
+
+def test_estimated_similarity():
+    left = [str(i) for i in range(1000)]
+    right = [str(i) for i in range(500, 1500)]
+    # the Jaccard similarity is 1/3
+    estimate = estimated_similarity(signature(left, 128), signature(right, 128))
+    assert 0.2 < estimate < 0.45
+
+
+def test_order_is_a_permutation_and_groups_similar_files():
+    contents = {
+        "a1": ["x" + str(i) for i in range(100)],
+        "b1": ["y" + str(i) for i in range(100)],
+        "a2": ["x" + str(i) for i in range(5, 105)],
+        "b2": ["y" + str(i) for i in range(5, 105)],
+        "empty": [],
+    }
+    order = minhash_order(list(contents), lambda f: contents[f], 64, 32)
+    assert sorted(order) == sorted(contents)
+    assert abs(order.index("a1") - order.index("a2")) == 1
+    assert abs(order.index("b1") - order.index("b2")) == 1
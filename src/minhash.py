@@ -0,0 +1,167 @@
+"""
+Approximate similarity ordering with MinHash signatures and LSH.
+
+order_by_similarity compares every pair of files, which is quadratic in the
+number of files. Here each file gets a MinHash signature of its set of
+tokens, computed with one permutation hashing: every token is hashed once,
+the hash picks one of num_perm buckets, and each bucket keeps its smallest
+value. The fraction of positions in which two signatures agree estimates the
+Jaccard similarity of the token sets.
+
+Signatures are split into bands, and files whose signatures agree on a whole
+band land in the same LSH bucket. The greedy chain only compares the current
+file with the files it shares a bucket with, so building the order is close
+to linear in the number of files. More bands (of fewer rows each) find more
+neighbours, and cost more time.
+"""
+import hashlib
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+MAX_HASH = (1 << 64) - 1
+# a bucket no token landed in. Larger than any hash, and filled in by
+# densify before it is used
+EMPTY = MAX_HASH + 1
+
+
+class TokenHasher:
+    """Hashes tokens to 64 bit ints, remembering tokens it has seen"""
+
+    def __init__(self):
+        self.hashes: Dict[str, int] = {}
+
+    def __call__(self, token: str) -> int:
+        h = self.hashes.get(token)
+        if h is None:
+            digest = hashlib.blake2b(
+                token.encode("utf-8", "surrogateescape"), digest_size=8
+            ).digest()
+            h = int.from_bytes(digest, "little")
+            self.hashes[token] = h
+        return h
+
+
+def signature(
+    tokens: Iterable[str], num_perm: int, hasher: Optional[TokenHasher] = None
+) -> Tuple[int, ...]:
+    """The one permutation MinHash signature of a set of tokens"""
+    if hasher is None:
+        hasher = TokenHasher()
+    mins = [EMPTY] * num_perm
+    for token in set(tokens):
+        h = hasher(token)
+        bucket = h % num_perm
+        value = h // num_perm
+        if value < mins[bucket]:
+            mins[bucket] = value
+    return densify(mins)
+
+
+def densify(mins: List[int]) -> Tuple[int, ...]:
+    """
+    Fill empty buckets from the next non-empty bucket (circularly), so that
+    two similar sets agree on the empty buckets too. An empty set keeps an
+    all-empty signature.
+    """
+    n = len(mins)
+    if all(m == EMPTY for m in mins):
+        return tuple(mins)
+    result = list(mins)
+    for i in range(n):
+        j = i
+        distance = 0
+        while mins[j] == EMPTY:
+            j = (j + 1) % n
+            distance += 1
+        if distance:
+            # offset by the distance, so that borrowed values differ from
+            # the originals
+            result[i] = mins[j] + distance * (MAX_HASH // n)
+    return tuple(result)
+
+
+def estimated_similarity(left: Sequence[int], right: Sequence[int]) -> float:
+    matches = sum(1 for l, r in zip(left, right) if l == r)
+    return matches / len(left)
+
+
+class LSHIndex:
+    def __init__(self, signatures: List[Tuple[int, ...]], bands: int):
+        self.signatures = signatures
+        num_perm = len(signatures[0]) if signatures else 0
+        self.bands = max(1, min(bands, num_perm))
+        self.rows = max(1, num_perm // self.bands)
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        for i, sig in enumerate(signatures):
+            for key in self.keys(sig):
+                self.buckets.setdefault(key, []).append(i)
+
+    def keys(self, sig: Tuple[int, ...]) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        for band in range(self.bands):
+            yield band, sig[band * self.rows : (band + 1) * self.rows]
+
+    def neighbours(self, i: int, used: Set[int], limit: int) -> Set[int]:
+        """
+        Up to limit unused files sharing a bucket with i. Used files are
+        removed from the buckets as they're found, so each is skipped once.
+        """
+        found: Set[int] = set()
+        for key in self.keys(self.signatures[i]):
+            bucket = self.buckets[key]
+            remaining = [j for j in bucket if j not in used]
+            if len(remaining) != len(bucket):
+                self.buckets[key] = remaining
+            for j in remaining:
+                if j != i:
+                    found.add(j)
+                    if len(found) >= limit:
+                        return found
+        return found
+
+
+def minhash_order(
+    files: List[str],
+    tokens: Optional[Callable[[str], Iterable[str]]],
+    num_perm: int = 64,
+    bands: int = 16,
+    limit: int = 256,
+    signature_of: Optional[Callable[[str], Tuple[int, ...]]] = None,
+) -> List[str]:
+    """
+    Order files in a greedy chain, each followed by the most similar unused
+    file among its LSH neighbours. tokens is a function from a file to its
+    tokens. When a file has no unused neighbours, the chain continues from
+    the next unused file in signature order, which keeps files sharing their
+    first minimums together. limit bounds the neighbours compared at each
+    step. signature_of, if given, is a function from a file to its signature,
+    in place of making them from tokens, which may then be None.
+    """
+    if not files:
+        return []
+    if signature_of is None:
+        hasher = TokenHasher()
+        signature_of = lambda file: signature(tokens(file), num_perm, hasher)
+    signatures = [signature_of(file) for file in files]
+    index = LSHIndex(signatures, bands)
+    fallback = sorted(range(len(files)), key=lambda i: signatures[i])
+    fallback_position = 0
+
+    used: Set[int] = set()
+    current = fallback[0]
+    order = []
+    while True:
+        used.add(current)
+        order.append(files[current])
+        if len(order) == len(files):
+            return order
+        best = None
+        best_similarity = -1.0
+        for j in index.neighbours(current, used, limit):
+            s = estimated_similarity(signatures[current], signatures[j])
+            if s > best_similarity or (s == best_similarity and j < best):
+                best = j
+                best_similarity = s
+        if best is None:
+            while fallback[fallback_position] in used:
+                fallback_position += 1
+            best = fallback[fallback_position]
+        current = best
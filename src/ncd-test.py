@@ -0,0 +1,67 @@
+import array
+import random
+import tempfile
+
+from backends import Gzip
+from ncd import CostCache, Path, compression_distance_order, solve
+
+
+def random_costs(rng: random.Random, n: int):
+    start = array.array("i", (rng.randrange(100, 1000) for _ in range(n)))
+    costs = [array.array("i", (rng.randrange(1, 1000) for _ in range(n))) for _ in range(n)]
+    return start, costs
+
+
+def test_solve_returns_a_permutation():
+    rng = random.Random(1)
+    for n in (0, 1, 2, 5, 40):
+        start, costs = random_costs(rng, n)
+        assert sorted(solve(start, costs)) == list(range(n))
+
+
+def test_moves_never_increase_the_cost():
+    rng = random.Random(2)
+    for _ in range(20):
+        n = rng.randrange(2, 30)
+        start, costs = random_costs(rng, n)
+        order = list(range(n))
+        rng.shuffle(order)
+        path = Path(order, start, costs, 5)
+        for move in (path.or_opt, path.two_opt) * 3:
+            cost = path.cost()
+            move()
+            assert path.cost() <= cost
+            assert sorted(path.order) == list(range(n))
+            assert all(path.order[path.positions[node]] == node for node in range(n))
+
+
+def test_cost_cache_round_trips():
+    rng = random.Random(3)
+    start, costs = random_costs(rng, 6)
+    hashes = [bytes([i]) * 32 for i in range(6)]
+    assert CostCache(None).load("gz6w15", hashes) is None
+    with tempfile.TemporaryDirectory() as root:
+        cache = CostCache(root)
+        assert cache.load("gz6w15", hashes) is None
+        cache.store("gz6w15", hashes, start, costs)
+        assert cache.load("gz6w15", hashes) == (start, costs)
+        assert cache.load("gz9w15", hashes) is None
+
+
+def test_duplicates_are_kept_together():
+    rng = random.Random(4)
+    words = [b"alpha", b"beta", b"gamma", b"delta", b"return", b"import", b"class"]
+    contents = {}
+    for i in range(8):
+        text = b" ".join(rng.choice(words) for _ in range(rng.randrange(50, 300)))
+        contents["f" + str(i)] = text
+        contents["copy" + str(i)] = text
+    files = sorted(contents)
+    with tempfile.TemporaryDirectory() as root:
+        for _ in range(2):
+            # the second time, from the cache
+            order = compression_distance_order(files, Gzip(), contents.get, root)
+            assert sorted(order) == files
+            for i in range(8):
+                position = order.index("f" + str(i))
+                assert "copy" + str(i) in order[position - 1 : position + 2]
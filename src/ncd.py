@@ -0,0 +1,420 @@
+"""
+Ordering by compression distance.
+
+What matters when ordering a tar archive is how well file B compresses when
+file A comes just before it. pair_costs measures exactly that, the marginal
+compressed bytes of B after A, for every pair of files, with the compressor
+the archive will use. The ordering is then an asymmetric travelling salesman
+problem over those costs, which solve() handles with a nearest neighbour
+tour improved by Or-opt and 2-opt moves.
+
+The costs depend only on the contents of the files, so the matrix is cached
+on disk, keyed by the content hashes of the files and the codec.
+"""
+import array
+import concurrent.futures
+import hashlib
+import heapq
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from backends import Backend, Gzip
+
+Costs = List[array.array]
+
+# the smallest window every codec takes
+MIN_WINDOW_LOG = 12
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "tarper")
+
+
+def codec(backend: Backend) -> Backend:
+    """
+    The backend the costs are measured with: the archive's, at its level and
+    window, when it has an in-process binding, and deflate as a stand in
+    when it doesn't.
+    """
+    if backend.compressor() is None:
+        return Gzip()
+    return backend
+
+
+def codec_name(backend: Backend) -> str:
+    """The name the costs of backend are cached under"""
+    return f"{backend.extension[1:]}{backend.level}w{backend.window_log}"
+
+
+def fitted(backend: Backend, length: int) -> Backend:
+    """
+    backend with its window cut down to length, if it is longer: a window
+    longer than the data compresses it the same, but takes longer to set up
+    """
+    window_log = backend.window_log
+    if window_log is None or length.bit_length() >= window_log:
+        return backend
+    return type(backend)(backend.level, max(MIN_WINDOW_LOG, length.bit_length()))
+
+
+def compressed_size(backend: Backend, data: Sequence[bytes]) -> int:
+    compressor = backend.compressor()
+    size = 0
+    for chunk in data:
+        size += len(compressor.compress(chunk))
+    return size + len(compressor.flush())
+
+
+def row_costs(
+    backend: Backend, contents: Sequence[bytes], i: int
+) -> Tuple[int, array.array]:
+    """
+    The compressed size of contents[i] on its own, and the marginal cost of
+    each of contents following it.
+    """
+    row = array.array("i", [0] * len(contents))
+    backend = fitted(backend, len(contents[i]) + max(map(len, contents)))
+    if backend.copyable:
+        # compress the first file once, and resume from a copy for each pair
+        compressor = backend.compressor()
+        prefix = len(compressor.compress(contents[i]))
+        alone = prefix + len(compressor.copy().flush())
+        for j, content in enumerate(contents):
+            pair = compressor.copy()
+            both = prefix + len(pair.compress(content)) + len(pair.flush())
+            row[j] = both - alone
+    else:
+        alone = compressed_size(backend, [contents[i]])
+        for j, content in enumerate(contents):
+            row[j] = compressed_size(backend, [contents[i], content]) - alone
+    return alone, row
+
+
+# the contents a worker process computes rows for, set by _init_worker
+_worker_contents: Sequence[bytes] = []
+
+
+def _init_worker(contents: Sequence[bytes]) -> None:
+    global _worker_contents
+    _worker_contents = contents
+
+
+def _worker_row(args: Tuple[Backend, int]) -> Tuple[int, array.array]:
+    backend, i = args
+    return row_costs(backend, _worker_contents, i)
+
+
+def pair_costs(
+    backend: Backend, contents: Sequence[bytes], executor: str = "serial", workers: int = 1
+) -> Tuple[array.array, Costs]:
+    """
+    The compressed size of each of contents alone, and the matrix of marginal
+    costs of each following each other, computed on threads or processes.
+    """
+    n = len(contents)
+    if workers > 1 and executor == "process":
+        pool = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(list(contents),)
+        )
+        rows = pool.map(_worker_row, [(backend, i) for i in range(n)], chunksize=8)
+    elif workers > 1:
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+        rows = pool.map(lambda i: row_costs(backend, contents, i), range(n))
+    else:
+        pool = None
+        rows = (row_costs(backend, contents, i) for i in range(n))
+    alone = array.array("i")
+    costs: Costs = []
+    for size, row in rows:
+        alone.append(size)
+        costs.append(row)
+    if pool is not None:
+        pool.shutdown()
+    return alone, costs
+
+
+class CostCache:
+    """
+    Cost matrices on disk. A matrix is stored for the sorted distinct content
+    hashes of a corpus, so it is found again however the files are named or
+    ordered.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+
+    def path(self, name: str, hashes: Sequence[bytes]) -> str:
+        key = hashlib.sha256(name.encode() + b"".join(hashes)).hexdigest()
+        return os.path.join(self.directory, "ncd-" + key + ".bin")
+
+    def load(
+        self, name: str, hashes: Sequence[bytes]
+    ) -> Optional[Tuple[array.array, Costs]]:
+        if self.directory is None:
+            return None
+        path = self.path(name, hashes)
+        if not os.path.exists(path):
+            return None
+        n = len(hashes)
+        values = array.array("i")
+        with open(path, "rb") as f:
+            values.fromfile(f, n * (n + 1))
+        return values[:n], [values[n * (i + 1) : n * (i + 2)] for i in range(n)]
+
+    def store(
+        self, name: str, hashes: Sequence[bytes], alone: array.array, costs: Costs
+    ) -> None:
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name, hashes)
+        # write and rename, so that a crash never leaves a partial matrix
+        with open(path + ".tmp", "wb") as f:
+            alone.tofile(f)
+            for row in costs:
+                row.tofile(f)
+        os.replace(path + ".tmp", path)
+
+
+def content_costs(
+    backend: Backend,
+    data: Callable[[str], bytes],
+    files: List[str],
+    cache: CostCache,
+    executor: str = "serial",
+    workers: int = 1,
+) -> Tuple[List[int], array.array, Costs]:
+    """
+    Costs for the distinct contents of files. Returns the index of each file's
+    contents in the matrix, along with the matrix.
+    """
+    backend = codec(backend)
+    name = codec_name(backend)
+    by_hash: Dict[bytes, bytes] = {}
+    file_hashes = []
+    for file in files:
+        content = bytes(data(file))
+        digest = hashlib.sha256(content).digest()
+        by_hash[digest] = content
+        file_hashes.append(digest)
+    hashes = sorted(by_hash)
+    index = {h: i for i, h in enumerate(hashes)}
+    cached = cache.load(name, hashes)
+    if cached is None:
+        contents = [by_hash[h] for h in hashes]
+        alone, costs = pair_costs(backend, contents, executor, workers)
+        cache.store(name, hashes, alone, costs)
+    else:
+        alone, costs = cached
+    return [index[h] for h in file_hashes], alone, costs
+
+
+def nearest_neighbour(start: Sequence[int], costs: Costs) -> List[int]:
+    n = len(start)
+    unused = set(range(n))
+    current = min(unused, key=lambda i: start[i])
+    tour = []
+    while True:
+        unused.discard(current)
+        tour.append(current)
+        if not unused:
+            return tour
+        row = costs[current]
+        current = min(unused, key=lambda j: row[j])
+
+
+def neighbours(costs: Costs, k: int) -> Tuple[List[List[int]], List[List[int]]]:
+    """
+    For each node, the k nodes that are cheapest to follow it, and the k
+    nodes it is cheapest to follow.
+    """
+    n = len(costs)
+    successors = [
+        heapq.nsmallest(k, (j for j in range(n) if j != i), key=costs[i].__getitem__)
+        for i in range(n)
+    ]
+    predecessors = [
+        heapq.nsmallest(k, (i for i in range(n) if i != j), key=lambda i: costs[i][j])
+        for j in range(n)
+    ]
+    return successors, predecessors
+
+
+class Path:
+    """
+    An open path through the nodes. Its cost is the start cost of the first
+    node plus the cost of each edge. Moves only consider the k nearest
+    neighbours of each node.
+    """
+
+    def __init__(self, order: List[int], start: Sequence[int], costs: Costs, k: int):
+        self.order = order
+        self.start = start
+        self.costs = costs
+        self.successors, self.predecessors = neighbours(costs, k)
+        self.positions: List[int] = []
+        self.moved()
+
+    def moved(self) -> None:
+        self.positions = [0] * len(self.order)
+        for i, node in enumerate(self.order):
+            self.positions[node] = i
+
+    def cost(self) -> int:
+        order = self.order
+        total = self.start[order[0]]
+        for a, b in zip(order, order[1:]):
+            total += self.costs[a][b]
+        return total
+
+    def edge(self, a: Optional[int], b: Optional[int]) -> int:
+        """The cost of a followed by b, where None is either end of the path"""
+        if b is None:
+            return 0
+        if a is None:
+            return self.start[b]
+        return self.costs[a][b]
+
+    def at(self, i: int) -> Optional[int]:
+        if 0 <= i < len(self.order):
+            return self.order[i]
+        return None
+
+    def or_opt(self, max_segment: int = 3) -> bool:
+        """
+        Move segments of up to max_segment nodes, keeping their direction, to
+        just after one of the nodes cheapest to precede them (or to the
+        front). Returns True if any moved.
+        """
+        improved = False
+        i = 0
+        while i < len(self.order):
+            for length in range(1, max_segment + 1):
+                if i + length > len(self.order):
+                    break
+                if self.move_segment(i, length):
+                    improved = True
+                    break
+            i += 1
+        return improved
+
+    def move_segment(self, i: int, length: int) -> bool:
+        order = self.order
+        first, last = order[i], order[i + length - 1]
+        before, after = self.at(i - 1), self.at(i + length)
+        removed = self.edge(before, first) + self.edge(last, after) - self.edge(before, after)
+        for x in [None] + self.predecessors[first]:
+            if x is None:
+                k = -1
+            else:
+                k = self.positions[x]
+                if i <= k < i + length:
+                    continue
+            if x == before:
+                continue
+            y = self.at(k + 1)
+            added = self.edge(x, first) + self.edge(last, y) - self.edge(x, y)
+            if added < removed:
+                segment = order[i : i + length]
+                rest = order[:i] + order[i + length :]
+                k = k if k < i else k - length
+                self.order = rest[: k + 1] + segment + rest[k + 1 :]
+                self.moved()
+                return True
+        return False
+
+    def two_opt(self) -> bool:
+        """
+        Reverse segments that start just after a node and end with one of the
+        nodes cheapest to follow it. Returns True if any was reversed.
+        """
+        improved = False
+        forward: List[int] = []
+        backward: List[int] = []
+
+        def sums() -> None:
+            # forward[k] and backward[k] are the costs of the edges before k,
+            # in the path's direction and against it
+            forward[:] = [0] * len(self.order)
+            backward[:] = [0] * len(self.order)
+            order = self.order
+            for k in range(1, len(order)):
+                forward[k] = forward[k - 1] + self.costs[order[k - 1]][order[k]]
+                backward[k] = backward[k - 1] + self.costs[order[k]][order[k - 1]]
+
+        sums()
+        for i in range(len(self.order)):
+            before = self.at(i - 1)
+            candidates = self.successors[before] if before is not None else []
+            for node in candidates:
+                j = self.positions[node]
+                if j <= i:
+                    continue
+                order = self.order
+                after = self.at(j + 1)
+                old = (
+                    self.edge(before, order[i])
+                    + forward[j]
+                    - forward[i]
+                    + self.edge(order[j], after)
+                )
+                new = (
+                    self.edge(before, order[j])
+                    + backward[j]
+                    - backward[i]
+                    + self.edge(order[i], after)
+                )
+                if new < old:
+                    self.order = order[:i] + order[i : j + 1][::-1] + order[j + 1 :]
+                    self.moved()
+                    sums()
+                    improved = True
+                    break
+        return improved
+
+
+def solve(
+    start: Sequence[int], costs: Costs, rounds: int = 100, k: int = 8
+) -> List[int]:
+    """
+    A short path through every node: nearest neighbour, then sweeps of Or-opt
+    and 2-opt moves over the k nearest neighbours of each node, until a
+    sweep finds no improvement, or after rounds sweeps.
+    """
+    if not start:
+        return []
+    path = Path(nearest_neighbour(start, costs), start, costs, k)
+    for _ in range(rounds):
+        moved = path.or_opt()
+        flipped = path.two_opt()
+        if not (moved or flipped):
+            break
+    return path.order
+
+
+def compression_distance_order(
+    files: List[str],
+    backend: Backend,
+    data: Callable[[str], bytes],
+    cache_dir: Optional[str] = None,
+    executor: str = "serial",
+    workers: int = 1,
+    rounds: int = 100,
+) -> List[str]:
+    """
+    Order files by solving a path through the marginal compression costs of
+    their contents. Files with identical contents are kept together.
+    """
+    indexes, alone, costs = content_costs(
+        backend, data, files, CostCache(cache_dir), executor, workers
+    )
+    by_content: Dict[int, List[str]] = {}
+    for file, i in zip(files, indexes):
+        by_content.setdefault(i, []).append(file)
+    order = []
+    for i in solve(alone, costs, rounds):
+        order.extend(by_content[i])
+    return order
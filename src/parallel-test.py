@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+import parallel
+from tarper import Runner
+from testtree import write_tree
+
+
+class Recording:
+    def __init__(self):
+        self.accepted = []
+
+    def size(self, files):
+        return len(files)
+
+    def accept(self, files):
+        self.accepted.append(list(files))
+
+
+def test_workers_accept_each_order_once():
+    evaluator = parallel._worker_evaluator
+    version = parallel._worker_accepted
+    parallel._worker_evaluator = Recording()
+    parallel._worker_accepted = 0
+    try:
+        assert parallel._worker_size((0, None, ["a", "b"])) == 2
+        assert parallel._worker_evaluator.accepted == []
+        for files in (["b", "a"], ["a", "c"]):
+            assert parallel._worker_size((1, ["b", "a"], files)) == 2
+        assert parallel._worker_size((2, ["c", "a"], ["c"])) == 1
+        assert parallel._worker_evaluator.accepted == [["b", "a"], ["c", "a"]]
+    finally:
+        parallel._worker_evaluator = evaluator
+        parallel._worker_accepted = version
+
+
+def test_executors_agree_under_one_seed():
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "source")
+        write_tree(src, 10, seed=3)
+        results = {}
+        for executor in parallel.EXECUTORS:
+            runner = Runner(
+                os.path.join(root, "archive"),
+                src,
+                ".gz",
+                40,
+                evaluator="incremental",
+                executor=executor,
+                workers=2,
+                seed=3,
+            )
+            try:
+                order = runner.options["counted"].order()
+                results[executor] = (order, runner.compute_size(order))
+            finally:
+                runner.close()
+        assert results["thread"] == results["serial"]
+        assert results["process"] == results["serial"]
+
+
+def test_stochastic_methods_repeat_under_one_seed():
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "source")
+        write_tree(src, 10, seed=4)
+        for method in ("hillclimb", "counted", "mcts"):
+            orders = []
+            for _ in range(2):
+                runner = Runner(
+                    os.path.join(root, "archive"),
+                    src,
+                    ".gz",
+                    30,
+                    evaluator="inprocess",
+                    executor="thread",
+                    workers=2,
+                    seed=5,
+                )
+                try:
+                    orders.append(runner.options[method].order())
+                finally:
+                    runner.close()
+            assert orders[0] == orders[1], method
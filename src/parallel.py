@@ -0,0 +1,148 @@
+"""
+Executors that score batches of candidate orderings.
+
+The search methods generate candidates in the main process, with the main
+process' random state, and hand them to an executor as a batch. Executors
+return sizes in the order of the candidates, so a seeded run gives the same
+result whichever executor is used.
+
+"serial" scores candidates one after another with the Runner's evaluator.
+"thread" shares the Runner's evaluator between threads; zlib and zstandard
+release the GIL while compressing, so this scales for the in-process
+evaluators. "process" gives each worker process its own evaluator and
+content store. Each batch carries the order the Runner last accepted, so
+the workers' evaluators cache work along the same order as the Runner's.
+"""
+import concurrent.futures
+import os
+from typing import Dict, List, Optional, Tuple
+
+from evaluator import make_evaluator
+from store import ContentStore
+
+EXECUTORS = ["serial", "thread", "process"]
+
+
+def cpu_count() -> int:
+    return os.cpu_count() or 1
+
+
+class SerialExecutor:
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+    def sizes(self, candidates: List[List[str]]) -> List[int]:
+        return [self.evaluator.size(candidate) for candidate in candidates]
+
+    def accept(self, files: List[str]) -> None:
+        # the Runner accepts files with the evaluator it shares
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ThreadExecutor:
+    def __init__(self, evaluator, workers: int):
+        self.evaluator = evaluator
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+
+    def sizes(self, candidates: List[List[str]]) -> List[int]:
+        if len(candidates) == 1:
+            return [self.evaluator.size(candidates[0])]
+        return list(self.pool.map(self.evaluator.size, candidates))
+
+    def accept(self, files: List[str]) -> None:
+        # the Runner accepts files with the evaluator it shares
+        pass
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+
+# the evaluator of a worker process, created by _init_worker
+_worker_evaluator = None
+# the version of the accepted order the worker's evaluator last accepted
+_worker_accepted = 0
+
+
+def _init_worker(kind: str, workdir: str, extension: str, options: Dict) -> None:
+    global _worker_evaluator
+    # the cli evaluator names its temporary files by thread ident, which
+    # forked workers share, so each worker writes into a directory of its own
+    workdir = os.path.join(workdir, "worker" + str(os.getpid()))
+    os.makedirs(workdir, exist_ok=True)
+    # stores hold mmaps, which can't be shared, so each worker has its own
+    _worker_evaluator = make_evaluator(
+        kind, workdir, extension, ContentStore(), **options
+    )
+
+
+def worker_evaluator():
+    """The evaluator of this worker process"""
+    return _worker_evaluator
+
+
+def process_pool(
+    kind: str, workdir: str, extension: str, options: Dict, workers: int
+) -> concurrent.futures.ProcessPoolExecutor:
+    """A pool of processes, each with an evaluator of its own"""
+    return concurrent.futures.ProcessPoolExecutor(
+        workers,
+        initializer=_init_worker,
+        initargs=(kind, workdir, extension, options),
+    )
+
+
+def _worker_size(task: Tuple[int, Optional[List[str]], List[str]]) -> int:
+    global _worker_accepted
+    version, accepted, files = task
+    if version != _worker_accepted:
+        _worker_evaluator.accept(accepted)
+        _worker_accepted = version
+    return _worker_evaluator.size(files)
+
+
+class ProcessExecutor:
+    def __init__(
+        self, kind: str, workdir: str, extension: str, options: Dict, workers: int
+    ):
+        self.pool = process_pool(kind, workdir, extension, options, workers)
+        self.workers = workers
+        self.accepted: Optional[List[str]] = None
+        self.version = 0
+
+    def sizes(self, candidates: List[List[str]]) -> List[int]:
+        # each chunk is pickled once, with one copy of the accepted order
+        chunksize = -(-len(candidates) // self.workers)
+        tasks = [(self.version, self.accepted, files) for files in candidates]
+        return list(self.pool.map(_worker_size, tasks, chunksize=chunksize))
+
+    def accept(self, files: List[str]) -> None:
+        """Have the workers accept files before scoring the next batch"""
+        self.accepted = list(files)
+        self.version += 1
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+
+def make_executor(
+    kind: str,
+    workers: int,
+    evaluator,
+    evaluator_kind: str,
+    workdir: str,
+    extension: str,
+    options: Optional[Dict] = None,
+):
+    if kind == "serial" or workers <= 1:
+        return SerialExecutor(evaluator)
+    elif kind == "thread":
+        return ThreadExecutor(evaluator, workers)
+    elif kind == "process":
+        return ProcessExecutor(
+            evaluator_kind, workdir, extension, options or {}, workers
+        )
+    else:
+        raise ValueError("Unrecognized executor: " + kind)
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+from segments import boundaries
+from tarper import Runner
+from testtree import write_tree
+
+
+def test_boundaries():
+    lengths = [10] * 20
+    assert boundaries(lengths, 4, 30) == [(0, 5), (5, 10), (10, 15), (15, 20)]
+    # no segment shorter than the minimum
+    assert boundaries(lengths, 4, 60) == [(0, 6), (6, 13), (13, 20)]
+    assert boundaries(lengths, 4, 300) == [(0, 20)]
+    # shifted by half a segment, dropping a first segment that's too short
+    assert boundaries(lengths, 2, 60, True) == [(0, 20)]
+    assert boundaries(lengths, 4, 20, True) == [(0, 2), (2, 7), (7, 12), (12, 20)]
+    assert boundaries([], 4, 20) == [(0, 0)]
+
+
+def test_segmented_keeps_every_file():
+    with tempfile.TemporaryDirectory() as src:
+        write_tree(src, 12, name="f{}")
+        runner = Runner(
+            os.path.join(src, "archive"), src, ".gz", 40, evaluator="inprocess", seed=2
+        )
+        try:
+            files = runner.files()
+            order = runner.options["segmented"].order()
+            assert sorted(order) == sorted(files)
+            assert runner.compute_size(order) <= runner.compute_size(files)
+        finally:
+            runner.close()
@@ -0,0 +1,84 @@
+"""
+Segment-parallel optimization.
+
+Compressors only look back a bounded window (see window.py), so reordering
+files in one part of a large archive barely changes how well a part far away
+compresses. The order is cut into segments, each at least SEGMENT_WINDOWS
+windows of tar stream long, and each segment is searched on its own, in a
+worker process, by one of the local search methods, scoring the segment
+alone. The segments are then put back together, and the whole order is
+compressed to check the total, which is kept only if it improved.
+
+Each round shares the count between the segments. On every other round the
+boundaries are shifted by half a segment, so files near a boundary can move
+across it.
+"""
+import concurrent.futures
+from typing import Any, Dict, List, Sequence, Tuple
+
+# methods that can search a segment
+SEGMENT_METHODS = ["counted", "hillclimb"]
+# the least length of a segment, in compressor windows
+SEGMENT_WINDOWS = 8
+
+
+def boundaries(
+    lengths: Sequence[int], segments: int, minimum: int, shift: bool = False
+) -> List[Tuple[int, int]]:
+    """
+    Cut items with the given lengths into at most segments runs, of similar
+    total length and each at least minimum long, as (start, end) pairs. With
+    shift, the cuts are moved by half a segment.
+    """
+    total = sum(lengths)
+    count = max(1, min(segments, total // max(1, minimum)))
+    target = total / count
+    if shift:
+        cuts = [target * (k + 0.5) for k in range(count - 1)]
+        # the first segment is only half as long, and may be too short
+        cuts = [cut for cut in cuts if cut >= minimum]
+    else:
+        cuts = [target * k for k in range(1, count)]
+    result = []
+    start = 0
+    offset = 0
+    position = 0
+    for cut in cuts:
+        while position < len(lengths) and offset + lengths[position] <= cut:
+            offset += lengths[position]
+            position += 1
+        if position > start:
+            result.append((start, position))
+            start = position
+    result.append((start, len(lengths)))
+    return result
+
+
+def _search_segment(args: Tuple[List[str], Dict[str, Any], str]) -> Tuple[List[str], int]:
+    segment, settings, method = args
+    # imported here, as tarper imports this module
+    from tarper import Runner
+
+    runner = Runner(**settings)
+    try:
+        runner.subset = segment
+        order = runner.options[method].order()
+        return order, runner.telemetry.evaluations
+    finally:
+        runner.close()
+
+
+def search_segments(
+    segments: List[List[str]],
+    settings: List[Dict[str, Any]],
+    method: str,
+    workers: int,
+) -> List[Tuple[List[str], int]]:
+    """
+    Search each segment with method, in a Runner made from its settings, in
+    a pool of worker processes, returning the order found for each and the
+    number of orders compressed to find it
+    """
+    work = [(segment, s, method) for segment, s in zip(segments, settings)]
+    with concurrent.futures.ProcessPoolExecutor(max(1, workers)) as pool:
+        return list(pool.map(_search_segment, work))
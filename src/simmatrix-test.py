@@ -0,0 +1,48 @@
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+import simmatrix
+from tarper import similarity
+
+
+def test_similarity_array_matches_similarity():
+    counters = [
+        Counter({"alpha": 3, "beta": 1}),
+        Counter({"alpha": 1, "gamma": 7, "beta": 2}),
+        Counter({"gamma": 2}),
+        Counter(),
+    ]
+    similarities = simmatrix.similarity_array(counters, block_size=3, workers=2)
+    for i, left in enumerate(counters):
+        for j, right in enumerate(counters):
+            assert similarities[i, j] == pytest.approx(similarity(left, right))
+
+
+def test_greedy_order():
+    counters = [
+        Counter({"aaaa": 1}),
+        Counter({"bbbb": 5}),
+        Counter({"aaaa": 1, "cccc": 1}),
+        Counter({"bbbb": 4}),
+    ]
+    order = simmatrix.greedy_order(simmatrix.similarity_array(counters))
+    # every file is most similar to itself, so the walk starts at the first,
+    # and moves to the last unused file when nothing similar is left
+    assert order == [0, 2, 3, 1]
+
+
+def test_large_counts_are_exact():
+    counters = [
+        Counter({"alpha": count, "beta": 5000 - count, "gamma": count % 40})
+        for count in range(1, 5000, 37)
+    ]
+    counters.append(Counter({"alpha": 1, "delta": 900}))
+    similarities = simmatrix.similarity_array(counters, block_size=16)
+    assert similarities.dtype == simmatrix.np.float32
+    for i, left in enumerate(counters):
+        for j, right in enumerate(counters):
+            assert similarities[i, j] == pytest.approx(similarity(left, right), rel=1e-6)
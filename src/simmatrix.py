@@ -0,0 +1,185 @@
+"""
+A vectorized engine for the exact similarity ordering.
+
+similarity() is the sum over shared tokens of min(count1, count2) *
+len(token), divided by the total token counts of both files. Here the token
+counters are encoded as a sparse document-term matrix, and the overlaps are
+computed with sparse matrix products, using
+
+    min(a, b) = sum over levels v of (v - previous v) * [a >= v] * [b >= v]
+
+where the levels are the distinct counts up to EXACT_LEVELS. Each level is a
+binary matrix, so that part of the overlap of every pair is a sum of weighted
+binary matrix products. What is left over is
+
+    min(a, b) - min(a, b, EXACT_LEVELS) = min(a - EXACT_LEVELS, b - EXACT_LEVELS)
+
+for tokens both files use more than EXACT_LEVELS times. Few entries are that
+large, so this is added exactly from each token's column of the excess
+counts. However many distinct counts a corpus has, the number of products
+stays bounded, and the overlaps are exact.
+
+Rows are processed in blocks, optionally on several threads. Each block of
+overlaps is normalized in place and written into the one float32 array of
+similarities, so no other n by n array is made, here or in greedy_order.
+
+This needs numpy and scipy. Without them, available() is False and
+order_by_similarity falls back to the pure Python implementation.
+"""
+import concurrent.futures
+from typing import Dict, List, Sequence
+
+try:
+    import numpy as np
+    import scipy.sparse as sparse
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+    sparse = None
+
+BLOCK_SIZE = 512
+# counts that are levels of their own; the excess over this is added per token
+EXACT_LEVELS = 8
+
+
+def available() -> bool:
+    return np is not None
+
+
+def token_matrix(counters: Sequence[Dict[str, int]]):
+    """
+    Encode counters as a csr matrix of counts (files by tokens), along with
+    the length of each token and the total count of each file.
+    """
+    vocabulary: Dict[str, int] = {}
+    indptr = [0]
+    indices: List[int] = []
+    data: List[int] = []
+    for counter in counters:
+        for token, count in counter.items():
+            if count <= 0:
+                continue
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+    counts = sparse.csr_matrix(
+        (
+            np.array(data, dtype=np.int64),
+            np.array(indices, dtype=np.int64),
+            np.array(indptr, dtype=np.int64),
+        ),
+        shape=(len(counters), len(vocabulary)),
+    )
+    weights = np.zeros(len(vocabulary), dtype=np.float64)
+    for token, i in vocabulary.items():
+        weights[i] = len(token)
+    sizes = np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+    return counts, weights, sizes
+
+
+def clipped(counts):
+    """
+    counts clipped to EXACT_LEVELS, and the excess over it as a csc matrix
+    holding only the larger counts
+    """
+    low = counts.copy()
+    low.data = np.minimum(low.data, EXACT_LEVELS)
+    excess = counts.copy()
+    excess.data = np.maximum(excess.data - EXACT_LEVELS, 0)
+    excess.eliminate_zeros()
+    return low, excess.tocsc()
+
+
+def levels(counts):
+    """The binary matrix of each distinct count level, with its step"""
+    previous = 0
+    for value in np.unique(counts.data):
+        above = counts >= value
+        yield above.astype(np.float64), value - previous
+        previous = value
+
+
+def similarity_array(
+    counters: Sequence[Dict[str, int]], block_size: int = BLOCK_SIZE, workers: int = 1
+):
+    """The similarity of every pair of files, as a float32 array indexed by file id"""
+    counts, weights, sizes = token_matrix(counters)
+    n = counts.shape[0]
+    result = np.zeros((n, n), dtype=np.float32)
+    scale = sparse.diags(weights)
+    low, excess = clipped(counts)
+    # every level side by side, so a block takes one product
+    layers = list(levels(low))
+    weighted = sparse.hstack([level @ scale * step for level, step in layers], format="csr")
+    transposed = sparse.vstack([level.T for level, _ in layers], format="csr")
+    # the tokens some file uses more than EXACT_LEVELS times, with those files
+    columns = [
+        (
+            weights[token],
+            excess.indices[excess.indptr[token] : excess.indptr[token + 1]],
+            excess.data[excess.indptr[token] : excess.indptr[token + 1]],
+        )
+        for token in range(excess.shape[1])
+        if excess.indptr[token + 1] > excess.indptr[token]
+    ]
+
+    def block(start: int) -> None:
+        end = min(n, start + block_size)
+        overlaps = (weighted[start:end] @ transposed).toarray()
+        for weight, rows, excesses in columns:
+            inside = (rows >= start) & (rows < end)
+            if inside.any():
+                overlaps[np.ix_(rows[inside] - start, rows)] += weight * np.minimum.outer(
+                    excesses[inside], excesses
+                )
+        totals = sizes[start:end, None] + sizes[None, :]
+        # where both files have no tokens, the overlap is already 0
+        np.divide(overlaps, totals, out=overlaps, where=totals > 0)
+        result[start:end] = overlaps
+
+    starts = range(0, n, block_size)
+    if workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            list(pool.map(block, starts))
+    else:
+        for start in starts:
+            block(start)
+    return result
+
+
+def greedy_order(similarities) -> List[int]:
+    """
+    Walk from the file in the most similar pair, repeatedly moving to the
+    most similar unused file. This makes the same choices as
+    order_by_similarity and select_next: the walk starts from the first most
+    similar pair (i, j) with j <= i, and when no unused file has a positive
+    similarity, it moves to the last unused one.
+    """
+    n = similarities.shape[0]
+    if n == 0:
+        return []
+    current = first_pair(similarities)
+    unused = np.ones(n, dtype=bool)
+    order = []
+    while True:
+        unused[current] = False
+        order.append(current)
+        if len(order) == n:
+            return order
+        row = np.where(unused, similarities[current], -np.inf)
+        best = int(np.argmax(row))
+        if row[best] <= 0:
+            best = int(np.flatnonzero(unused)[-1])
+        current = best
+
+
+def first_pair(similarities, block_size: int = BLOCK_SIZE) -> int:
+    """The row of the first most similar pair (i, j) with j <= i"""
+    best, row = -1.0, 0
+    for start in range(0, similarities.shape[0], block_size):
+        # similarities are non-negative, so zeroing the upper triangle leaves
+        # the first maximum in row major order where it was
+        block = np.tril(similarities[start : start + block_size], start)
+        index = int(np.argmax(block))
+        if block.flat[index] > best:
+            best, row = block.flat[index], start + index // block.shape[1]
+    return row
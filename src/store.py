@@ -0,0 +1,81 @@
+"""
+A load-once store of the contents of the files being archived.
+
+Every evaluation of an ordering needs the contents of every file, and the
+similarity methods tokenize them too. The store reads each file once, maps
+large files with mmap and keeps small ones as bytes, and hands out
+memoryviews of the contents, so repeated evaluations never touch the
+filesystem. The Runner keeps a single store, which is shared by all of its
+ArchiveMethods.
+
+The store assumes the files don't change while it is in use.
+"""
+import mmap
+from typing import Dict, Iterator, Union
+
+from evaluator import padding, tar_header, tar_info
+
+MMAP_THRESHOLD = 1 << 20
+
+
+class Entry:
+    def __init__(self, header: bytes, size: int, data: Union[bytes, mmap.mmap]):
+        self.header = header
+        self.size = size
+        self.data = data
+
+
+class ContentStore:
+    def __init__(self, mmap_threshold: int = MMAP_THRESHOLD):
+        self.mmap_threshold = mmap_threshold
+        self.entries: Dict[str, Entry] = {}
+
+    def entry(self, path: str) -> Entry:
+        entry = self.entries.get(path)
+        if entry is None:
+            entry = self.load(path)
+            self.entries[path] = entry
+        return entry
+
+    def load(self, path: str) -> Entry:
+        info = tar_info(path)
+        data: Union[bytes, mmap.mmap] = b""
+        if info.size >= self.mmap_threshold:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        elif info.size:
+            with open(path, "rb") as f:
+                data = f.read()
+        return Entry(tar_header(info), info.size, data)
+
+    def data(self, path: str) -> memoryview:
+        return memoryview(self.entry(path).data)
+
+    def size(self, path: str) -> int:
+        return self.entry(path).size
+
+    def header(self, path: str) -> bytes:
+        return self.entry(path).header
+
+    def member_length(self, path: str) -> int:
+        """The number of bytes path takes up in a tar stream"""
+        entry = self.entry(path)
+        return len(entry.header) + entry.size + len(padding(entry.size))
+
+    def member(self, path: str) -> Iterator[Union[bytes, memoryview]]:
+        """Yield the header, data and padding of path as a tar member"""
+        entry = self.entry(path)
+        yield entry.header
+        if entry.size:
+            yield memoryview(entry.data)
+            yield padding(entry.size)
+
+    def close(self) -> None:
+        for entry in self.entries.values():
+            if isinstance(entry.data, mmap.mmap):
+                try:
+                    entry.data.close()
+                except BufferError:
+                    # still in use, it will be unmapped when released
+                    pass
+        self.entries = {}
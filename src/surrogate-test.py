@@ -0,0 +1,55 @@
+import os
+import random
+import tempfile
+
+from surrogate import Surrogate, changed_pairs
+
+
+def test_changed_pairs():
+    base = ["a", "b", "c", "d", "e"]
+    assert changed_pairs(base, ["a", "d", "c", "b", "e"], (1, 3)) == (
+        [("a", "d"), ("d", "c"), ("c", "b"), ("b", "e")],
+        [("a", "b"), ("b", "c"), ("c", "d"), ("d", "e")],
+    )
+    # adjacent, and at the ends
+    assert changed_pairs(base, ["b", "a", "c", "d", "e"], (0, 1)) == (
+        [("b", "a"), ("a", "c")],
+        [("a", "b"), ("b", "c")],
+    )
+    assert changed_pairs(base, list(base), (2, 2)) == ([], [])
+
+
+def test_screen_learns_which_moves_help():
+    random.seed(6)
+    with tempfile.TemporaryDirectory() as root:
+        files = []
+        for i in range(40):
+            name = os.path.join(root, "f" + str(i) + (".txt" if i % 2 else ".bin"))
+            with open(name, "w") as f:
+                f.write("word" * (i + 1))
+            files.append(name)
+        random.shuffle(files)
+
+        def cost(order):
+            # neighbours with different extensions cost 100 bytes
+            return sum(
+                100
+                for left, right in zip(order, order[1:])
+                if os.path.splitext(left)[1] != os.path.splitext(right)[1]
+            )
+
+        surrogate = Surrogate(0.25)
+        for _ in range(100):
+            candidates = []
+            changes = []
+            for _ in range(8):
+                candidate = list(files)
+                i = random.randrange(len(files))
+                j = random.randrange(len(files))
+                candidate[i], candidate[j] = candidate[j], candidate[i]
+                candidates.append(candidate)
+                changes.append((i, j))
+            for k in surrogate.screen(files, candidates, changes):
+                surrogate.learn(k, cost(candidates[k]) - cost(files))
+        assert surrogate.saved() > 400
+        assert surrogate.precision() > 2 * surrogate.base_rate()
@@ -0,0 +1,264 @@
+"""
+A learned cost model that screens candidate orders before they're compressed.
+
+Most random swaps make the archive larger, and are only found to after a full
+compression. A move only changes which files are adjacent, so Surrogate
+predicts the change in size from the pairs of adjacent files it breaks and
+the ones it makes. Each pair has features:
+
+  - whether the files share an extension, and a directory
+  - the overlap of their tokens, as the Jaccard similarity of the sets of
+    tokens (see tokens.py) in each file, or in the start of each file
+    without a token cache
+  - the ratio of their sizes, and their combined size, on a log scale
+
+and a move's features are the sum of them over the pairs it makes, less the
+sum over the pairs it breaks. One more feature comes from the deltas already
+measured: every pair has a learned cost, the part of the measured deltas of
+moves that made or broke it that isn't explained by its other pairs.
+
+The model is a linear regression on these, fitted online by recursive least
+squares to the evaluations the run makes anyway, with old evaluations slowly
+forgotten, as the order they were made from moves on. Deltas vary over orders
+of magnitude, so the model predicts asinh(delta), which is only used to rank.
+
+After a warm up, only the candidates predicted to be among the best `keep`
+fraction of recent candidates are compressed. A few others are compressed
+anyway, to keep the model honest and to estimate how many improvements the
+screen throws away.
+"""
+import math
+import os
+import random
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from tokens import TokenCache, tokenize
+
+# evaluations the model learns from before it screens anything
+WARMUP = 32
+# the chance that a screened out candidate is compressed anyway
+EXPLORE = 0.05
+# the number of recent predictions the screening threshold is taken from
+RECENT = 256
+# how much each evaluation discounts the ones before it
+FORGET = 0.999
+# the initial uncertainty of the weights
+PRIOR = 1e4
+# the rate at which the costs of pairs follow measured deltas
+PAIR_RATE = 0.5
+# the bytes at the start of each file whose tokens are compared, without a
+# token cache
+SAMPLE = 1 << 14
+# tokens this long or shorter aren't compared
+MIN_LENGTH = 3
+
+Pair = Tuple[str, str]
+
+
+def changed_pairs(
+    base: Sequence[str], candidate: Sequence[str], changed: Sequence[int]
+) -> Tuple[List[Pair], List[Pair]]:
+    """
+    The adjacent pairs that candidate makes and that it breaks, relative to
+    base, given the positions at which they differ
+    """
+    starts = set()
+    for position in changed:
+        for start in (position - 1, position):
+            if 0 <= start < len(base) - 1:
+                starts.add(start)
+    made = [(candidate[k], candidate[k + 1]) for k in sorted(starts)]
+    broken = [(base[k], base[k + 1]) for k in sorted(starts)]
+    # a pair both made and broken somewhere else is no change
+    remaining = list(broken)
+    kept = []
+    for pair in made:
+        if pair in remaining:
+            remaining.remove(pair)
+        else:
+            kept.append(pair)
+    return kept, remaining
+
+
+class Move:
+    __slots__ = ("made", "broken", "features", "prediction")
+
+    def __init__(self, made: List[Pair], broken: List[Pair]):
+        self.made = made
+        self.broken = broken
+        self.features: List[float] = []
+        self.prediction = 0.0
+
+
+class Surrogate:
+    def __init__(self, keep: float, store=None, tokens: Optional[TokenCache] = None):
+        self.keep = keep
+        self.store = store
+        self.tokens = tokens
+        self.words: Dict[str, Set[str]] = {}
+        self.pair_features: Dict[Pair, List[float]] = {}
+        self.pair_costs: Dict[Pair, float] = {}
+        self.dimension = 7
+        self.weights = [0.0] * self.dimension
+        self.covariance = [
+            [PRIOR if i == j else 0.0 for j in range(self.dimension)]
+            for i in range(self.dimension)
+        ]
+        self.recent: List[float] = []
+        self.moves: List[Move] = []
+        self.passed: Set[int] = set()
+        self.trained = 0
+        self.candidates = 0
+        self.compressed = 0
+        self.passed_count = 0
+        self.passed_improved = 0
+        self.explored = 0
+        self.explored_improved = 0
+
+    def file_words(self, file: str) -> Set[str]:
+        found = self.words.get(file)
+        if found is None:
+            if self.tokens is not None:
+                found = set(self.tokens.words(file, MIN_LENGTH, self.store))
+            elif self.store is not None:
+                found = set(tokenize(self.store.data(file)[:SAMPLE], MIN_LENGTH))
+            else:
+                with open(file, "rb") as f:
+                    found = set(tokenize(f.read(SAMPLE), MIN_LENGTH))
+            self.words[file] = found
+        return found
+
+    def file_size(self, file: str) -> int:
+        if self.store is not None:
+            return self.store.size(file)
+        return os.path.getsize(file)
+
+    def features_of(self, pair: Pair) -> List[float]:
+        features = self.pair_features.get(pair)
+        if features is None:
+            left, right = pair
+            left_words = self.file_words(left)
+            right_words = self.file_words(right)
+            union = len(left_words | right_words)
+            overlap = len(left_words & right_words) / union if union else 0.0
+            left_size = self.file_size(left)
+            right_size = self.file_size(right)
+            larger = max(left_size, right_size)
+            features = [
+                float(os.path.splitext(left)[1] == os.path.splitext(right)[1]),
+                float(os.path.dirname(left) == os.path.dirname(right)),
+                overlap,
+                min(left_size, right_size) / larger if larger else 1.0,
+                math.log1p(left_size + right_size),
+            ]
+            self.pair_features[pair] = features
+        return features
+
+    def pair_cost(self, move: Move) -> float:
+        """The delta in bytes predicted by the costs of the pairs alone"""
+        costs = self.pair_costs
+        made = sum(costs.get(pair, 0.0) for pair in move.made)
+        return made - sum(costs.get(pair, 0.0) for pair in move.broken)
+
+    def move(self, base: Sequence[str], candidate: Sequence[str], changed) -> Move:
+        move = Move(*changed_pairs(base, candidate, changed))
+        features = [0.0] * (self.dimension - 2)
+        for pairs, sign in ((move.made, 1.0), (move.broken, -1.0)):
+            for pair in pairs:
+                for i, value in enumerate(self.features_of(pair)):
+                    features[i] += sign * value
+        features.append(math.asinh(self.pair_cost(move)))
+        features.append(1.0)
+        move.features = features
+        move.prediction = sum(w * x for w, x in zip(self.weights, features))
+        return move
+
+    def screen(
+        self,
+        base: Sequence[str],
+        candidates: List[List[str]],
+        changes: List[Sequence[int]],
+    ) -> List[int]:
+        """
+        The indexes of the candidates, made from base by changing the given
+        positions, that are worth compressing
+        """
+        self.moves = [self.move(base, c, m) for c, m in zip(candidates, changes)]
+        self.candidates += len(candidates)
+        predictions = [move.prediction for move in self.moves]
+        if self.trained < WARMUP:
+            self.passed = set(range(len(candidates)))
+            chosen = list(range(len(candidates)))
+        else:
+            ranked = sorted(self.recent + predictions)
+            threshold = ranked[min(len(ranked) - 1, int(self.keep * len(ranked)))]
+            self.passed = {k for k, p in enumerate(predictions) if p <= threshold}
+            chosen = [
+                k
+                for k in range(len(candidates))
+                if k in self.passed or random.random() < EXPLORE
+            ]
+        self.recent.extend(predictions)
+        del self.recent[:-RECENT]
+        self.compressed += len(chosen)
+        return chosen
+
+    def learn(self, index: int, delta: int) -> None:
+        """Learn from the measured delta of candidate index of the last screen"""
+        move = self.moves[index]
+        improved = delta < -1
+        if self.trained >= WARMUP:
+            if index in self.passed:
+                self.passed_count += 1
+                self.passed_improved += improved
+            else:
+                self.explored += 1
+                self.explored_improved += improved
+        self.fit(move.features, math.asinh(delta))
+        changes = len(move.made) + len(move.broken)
+        if changes:
+            error = PAIR_RATE * (delta - self.pair_cost(move)) / changes
+            costs = self.pair_costs
+            for pair in move.made:
+                costs[pair] = costs.get(pair, 0.0) + error
+            for pair in move.broken:
+                costs[pair] = costs.get(pair, 0.0) - error
+        self.trained += 1
+
+    def fit(self, x: List[float], y: float) -> None:
+        """A step of recursive least squares"""
+        p = self.covariance
+        px = [sum(row[j] * x[j] for j in range(len(x))) for row in p]
+        gain_denominator = FORGET + sum(a * b for a, b in zip(x, px))
+        gain = [value / gain_denominator for value in px]
+        error = y - sum(w * value for w, value in zip(self.weights, x))
+        self.weights = [w + g * error for w, g in zip(self.weights, gain)]
+        self.covariance = [
+            [(p[i][j] - gain[i] * px[j]) / FORGET for j in range(len(x))]
+            for i in range(len(x))
+        ]
+
+    def saved(self) -> int:
+        return self.candidates - self.compressed
+
+    def precision(self) -> Optional[float]:
+        """The fraction of candidates passed by the screen that improved"""
+        if not self.passed_count:
+            return None
+        return self.passed_improved / self.passed_count
+
+    def base_rate(self) -> Optional[float]:
+        """The fraction of screened out candidates that improved, when sampled"""
+        if not self.explored:
+            return None
+        return self.explored_improved / self.explored
+
+    def summary(self) -> str:
+        def percent(value: Optional[float]) -> str:
+            return "n/a" if value is None else f"{100 * value:.1f}%"
+
+        return (
+            f"surrogate compressed {self.compressed} of {self.candidates} candidates, "
+            f"saving {self.saved()}; precision {percent(self.precision())}, "
+            f"{percent(self.base_rate())} of sampled rejects improved"
+        )
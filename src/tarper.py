@@ -1,5 +1,6 @@
+import argparse
 import collections
-import datetime
+import contextlib
 import itertools
 import os
 import random
@@ -7,9 +8,31 @@ import subprocess
 import sys
 import tempfile
 import time
-from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
-
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from archive import write_archive
+from backends import BACKENDS, Backend, make_backend
+from checkpoint import Checkpointer
+from crossover import CROSSOVERS
+from dedup import DedupIndex, expand, units
+from evaluator import EVALUATORS, make_evaluator
+from fidelity import MultiFidelity
+from history import History, corpus_fingerprint, order_key
+import genetic
+import hierarchy
+import segments
 from mcts import Node
+from memo import SizeMemo
+from minhash import minhash_order
+import ncd
+import simmatrix
+from store import ContentStore
+from surrogate import Surrogate
+from tokens import TokenCache, read_file, tokenize
+import telemetry
+from telemetry import Telemetry
+from window import WindowEstimator
+from parallel import EXECUTORS, cpu_count, make_executor, process_pool
 import pdb
 
 
@@ -23,32 +46,31 @@ def to_files(pairs: Iterable[Tuple[str, str]]) -> List[str]:
     return [os.path.join(fp[0], fp[1]) for fp in pairs]
 
 
-def make_archive(name: str, files: Iterable[str], extension: str):
+def make_archive(
+    name: str, files: Iterable[str], extension: str, backend: Optional[Backend] = None
+):
     """Make an archive from the files passed
 
     name - the full path of the archive
     files - the files to be included
-    extension - determines the type of archive, either ".gz" or ".zst"
+    extension - determines the type of archive, one of the backends' extensions
+    backend - the codec settings, which default to the extension's
     """
-
-    with open("output", "a") as f:
-        if extension == ".gz":
-            make_tar(name, files)
-            subprocess.run(["gzip", name])
-        elif extension == ".zst":
-            make_tar(name, files)
-            subprocess.run(["zstd", "-19", "--long", name])
-        else:
-            raise ValueError("Unrecognized choice of compression: " + runner.extension)
+    if backend is None:
+        backend = make_backend(extension)
+    make_tar(name, files)
+    with telemetry.phase("compress"):
+        backend.compress_file(name)
 
 
 def make_tar(name, files):
-    first, *rest = files
-    subprocess.call(["tar", "-cf", name, first], stderr=subprocess.DEVNULL)
-    for chunk in [files[x : x + 100] for x in range(0, len(files), 100)]:
-        args = ["tar", "-rf", name]
-        args.extend(chunk)
-    subprocess.call(args, stderr=subprocess.DEVNULL)
+    with telemetry.phase("tar"):
+        first, *rest = files
+        subprocess.call(["tar", "-cf", name, first], stderr=subprocess.DEVNULL)
+        for chunk in [rest[x : x + 100] for x in range(0, len(rest), 100)]:
+            args = ["tar", "-rf", name]
+            args.extend(chunk)
+            subprocess.call(args, stderr=subprocess.DEVNULL)
 
 
 def permute_within_directory(path: str) -> Iterable[Tuple[str, str]]:
@@ -61,13 +83,20 @@ def permute_within_directory(path: str) -> Iterable[Tuple[str, str]]:
             yield elem
 
 
-def order_by_similarity(files: List[str]) -> List[str]:
-    similarities = similarity_matrix(files)
+def order_by_similarity(
+    files: List[str], store=None, workers: int = 1, cache: Optional[TokenCache] = None
+) -> List[str]:
+    if simmatrix.available():
+        counters = [word_counts(file, 4, store, cache) for file in files]
+        similarities = simmatrix.similarity_array(counters, workers=workers)
+        return [files[i] for i in simmatrix.greedy_order(similarities)]
+    similarities = similarity_matrix(files, store, cache)
     pairs = [(k, v) for k, v in similarities.items()]
     pairs.sort(key=lambda f: f[1], reverse=True)
     order = []
     used: Set[str] = set()
     current = pairs[0][0][0]
+    used.add(current)
     order.append(current)
     next_file = select_next(files, current, used, similarities)
     while next_file:
@@ -98,10 +127,12 @@ def select_next(
     return best
 
 
-def similarity_matrix(files: List[str]) -> Dict[Tuple[str, str], float]:
+def similarity_matrix(
+    files: List[str], store=None, cache: Optional[TokenCache] = None
+) -> Dict[Tuple[str, str], float]:
     similarities = {}
     tokenized: List[Tuple[str, Any]] = [
-        (file, collections.Counter(words(file, 4))) for file in files
+        (file, word_counts(file, 4, store, cache)) for file in files
     ]
     for i, file_pair1 in enumerate(tokenized):
         for j, file_pair2 in enumerate(tokenized):
@@ -112,32 +143,44 @@ def similarity_matrix(files: List[str]) -> Dict[Tuple[str, str], float]:
     return similarities
 
 
-def most_common(file: str):
-    return collections.Counter(words(file)).most_common()
+def most_common(file: str, store=None, cache: Optional[TokenCache] = None):
+    return word_counts(file, 0, store, cache).most_common()
 
 
 def similarity(words1, words2):
     overlap = 0
     for k, v in words1.items():
         overlap += min(v, words2[k]) * len(k)
-    return overlap / (counter_size(words1) + counter_size(words2))
+    total = counter_size(words1) + counter_size(words2)
+    if total == 0:
+        return 0
+    return overlap / total
 
 
 def counter_size(counter):
     return sum((item[1] for item in counter.items()))
 
 
-def words(file: str, min_length=0):
-    with open(file, "r") as f:
-        for line in f.readlines():
-            for word in line.split(" .;\(\){}[]"):
-                if len(word) > min_length:
-                    yield word
+def words(file: str, min_length=0, store=None):
+    return tokenize(read_file(file, store), min_length)
+
+
+def word_counts(
+    file: str, min_length=0, store=None, cache: Optional[TokenCache] = None
+) -> collections.Counter:
+    """The count of each word of file, from cache if there is one"""
+    if cache is None:
+        return collections.Counter(words(file, min_length, store))
+    return cache.words(file, min_length, store)
 
 
-def sort_by_size(path: str) -> Iterable[Tuple[str, str]]:
+def sort_by_size(path: str, store=None) -> Iterable[Tuple[str, str]]:
     files = candidate_files(path)
-    return sorted(list(files), key=lambda f: os.path.getsize(os.path.join(f[0], f[1])))
+    if store is None:
+        size = os.path.getsize
+    else:
+        size = store.size
+    return sorted(list(files), key=lambda f: size(os.path.join(f[0], f[1])))
 
 
 def swap(files):
@@ -147,16 +190,145 @@ def swap(files):
     right_file = files[right]
     files[left] = right_file
     files[right] = left_file
+    return left, right
 
 
 class Runner:
-    def __init__(self, target_archive, src, extension, count, debug=False):
+    def __init__(
+        self,
+        target_archive,
+        src,
+        extension,
+        count,
+        debug=False,
+        evaluator="cli",
+        cache_memory=256 << 20,
+        executor="serial",
+        workers=1,
+        candidates=None,
+        seed=None,
+        approximate=0,
+        minhash_perm=64,
+        minhash_bands=16,
+        ncd_cache=None,
+        memo_size=100000,
+        time_budget=None,
+        telemetry_path=None,
+        profile_dir=None,
+        checkpoint_dir=None,
+        checkpoint_interval=30.0,
+        resume=False,
+        islands=0,
+        population=16,
+        migration=5,
+        crossover="ox",
+        surrogate=0.0,
+        block_budget=200,
+        segment_count=0,
+        segment_method="counted",
+        segment_rounds=2,
+        fidelity=0.0,
+        level=None,
+        window_log=None,
+        dedup="off",
+        groups=None,
+        token_cache=None,
+        history=None,
+    ):
         self.target_archive = target_archive
         self.src = src
         self.extension = extension
         self.dir = tempfile.TemporaryDirectory()
+        # where the archive is written when target_archive is "-"
+        self.output = None
         self.count = count
         self.debug = debug
+        self.evaluator_kind = evaluator
+        # shared by every method, so that files are only read once per run
+        self.store = ContentStore()
+        # the codec, at its level and window
+        self.backend = make_backend(extension, level, window_log)
+        self.evaluator_options = {
+            "memory_limit": cache_memory,
+            "level": level,
+            "window_log": window_log,
+        }
+        self.executor_kind = executor
+        self.workers = workers if workers > 0 else cpu_count()
+        self.executor = None
+        # the candidates scored by an evaluator, rather than found in the
+        # memo or the history
+        self.scored = 0
+        # the order last accepted, for executors made later
+        self.accepted: Optional[List[str]] = None
+        self.candidates = candidates
+        self.approximate = approximate
+        self.minhash_perm = minhash_perm
+        self.minhash_bands = minhash_bands
+        self.ncd_cache = ncd_cache
+        # the tokens of files, kept across runs when token_cache is a path
+        self.tokens = TokenCache(token_cache)
+        self.memo = SizeMemo(memo_size) if memo_size > 0 else None
+        # seconds each method may search for, on top of the iteration count
+        self.time_budget = time_budget
+        self.deadline: Optional[float] = None
+        # with debug, progress goes to the output file, as it always has
+        if telemetry_path is None and debug:
+            telemetry_path = "output"
+        self.telemetry = Telemetry(telemetry_path, profile_dir)
+        telemetry.install(self.telemetry)
+        # duplicate files glued into units, which methods order in their
+        # place: "exact" for identical files, "near" for near-duplicates too
+        self.dedup = dedup
+        self.index: Optional[DedupIndex] = None
+        if groups is None and dedup != "off":
+            with self.telemetry.phase("dedup"):
+                self.index = DedupIndex(
+                    to_files(candidate_files(src)), self.store, dedup == "near"
+                )
+            groups = self.index.groups
+            print(self.index.summary())
+        if groups:
+            self.evaluator_options["groups"] = groups
+        self.evaluator = make_evaluator(
+            evaluator, self.workdir(), extension, self.store, **self.evaluator_options
+        )
+        # sizes and the best order, kept across runs when history is a path
+        self.history: Optional[History] = None
+        if history is not None:
+            with self.telemetry.phase("fingerprint"):
+                corpus = corpus_fingerprint(
+                    to_files(candidate_files(src)), self.store
+                )
+            codec = f"{evaluator} {extension} {self.backend.level} {self.backend.window_log}"
+            self.history = History(history, corpus, codec)
+        self.checkpointer = None
+        if checkpoint_dir is not None:
+            self.checkpointer = Checkpointer(checkpoint_dir, checkpoint_interval, resume)
+        # the suffix of the method running
+        self.method: Optional[str] = None
+        # islands of the genetic search, 0 for one per core
+        self.islands = islands if islands > 0 else cpu_count()
+        self.population = population
+        self.migration = migration
+        self.crossover = crossover
+        # the fraction of candidates hillclimb and counted compress, 0 to
+        # compress them all
+        self.surrogate = surrogate
+        # evaluations hierarchical may spend on each block
+        self.block_budget = block_budget
+        # segments searched at once by segmented, 0 for one per worker
+        self.segment_count = segment_count if segment_count > 0 else self.workers
+        self.segment_method = segment_method
+        self.segment_rounds = segment_rounds
+        # the fraction of candidates promoted from the proxy codec to the
+        # target, 0 to score them all with the target
+        self.fidelity = fidelity
+        self.multifidelity: Optional[MultiFidelity] = None
+        # when set, the files methods order, in place of the source directory
+        self.subset: Optional[List[str]] = None
+        if seed is not None:
+            random.seed(seed)
         self.options = {
             "swapping": ArchiveMethod(self, "swapping", self.by_swapping),
             "swappingwithpermutation": ArchiveMethod(
@@ -179,34 +351,86 @@ class Runner:
                 "nonnaivesimilaritythenswap",
                 self.by_non_naive_similarity_with_swap,
             ),
+            "minhashsimilarity": ArchiveMethod(
+                self, "minhashsimilarity", self.by_minhash_similarity
+            ),
+            "compressiondistance": ArchiveMethod(
+                self, "compressiondistance", self.by_compression_distance
+            ),
             "by_size": ArchiveMethod(self, "size", self.by_size),
             "binsort": ArchiveMethod(self, "binsort", self.by_binsort),
             "hillclimb": ArchiveMethod(self, "hillclimb", self.by_hill_climbing),
             "counted": ArchiveMethod(self, "counted", self.by_counted_iterations),
+            "genetic": ArchiveMethod(self, "genetic", self.by_genetic),
+            "hierarchical": ArchiveMethod(self, "hierarchical", self.by_hierarchical),
+            "segmented": ArchiveMethod(self, "segmented", self.by_segmented),
         }
 
     def workdir(self):
         return self.dir.name
 
+    def files(self) -> List[str]:
+        if self.subset is not None:
+            return list(self.subset)
+        with self.telemetry.phase("walk"):
+            return self.units(to_files(candidate_files(self.src)))
+
+    def groups(self) -> Dict[str, List[str]]:
+        """The files each unit of duplicates stands for, by its representative"""
+        return self.evaluator_options.get("groups", {})
+
+    def units(self, files: List[str]) -> List[str]:
+        """files without the ones a unit of duplicates stands for"""
+        return units(files, self.groups())
+
+    def expand(self, order: List[str]) -> List[str]:
+        """order with each unit of duplicates replaced by its files"""
+        return expand(order, self.groups())
+
+    def start(self) -> List[str]:
+        """
+        The order searches start from: the best one recorded by an earlier
+        run, if there is one, and otherwise the files in walk order
+        """
+        files = self.files()
+        if self.history is None or self.subset is not None:
+            return files
+        best = self.history.best()
+        if best is None or sorted(best[0]) != sorted(self.expand(files)):
+            return files
+        print(f"{self.method}: starting from the best recorded order, {best[1]} bytes")
+        return self.units(best[0])
+
+    def progress(self, iteration: int, best_size: Optional[int] = None, **fields) -> None:
+        self.telemetry.event(
+            "progress",
+            time=self.telemetry.elapsed(),
+            iteration=iteration,
+            best_size=best_size,
+            **fields,
+        )
+
     def by_swapping(self) -> List[str]:
-        files = to_files(candidate_files(self.src))
-        return self.by_swapping_files(files)
+        return self.by_swapping_files(self.start())
 
     def by_swapping_with_permutation(self) -> List[str]:
-        file_pairs = list(permute_within_directory(self.src))
-        return self.by_swapping_files(to_files(file_pairs))
+        with self.telemetry.phase("walk"):
+            file_pairs = list(permute_within_directory(self.src))
+        return self.by_swapping_files(self.units(to_files(file_pairs)))
 
     def by_permute_within_directory(self) -> List[str]:
-        return to_files(list(permute_within_directory(self.src)))
+        with self.telemetry.phase("walk"):
+            return self.units(to_files(list(permute_within_directory(self.src))))
 
     def by_default(self) -> List[str]:
-        return to_files(list(candidate_files(self.src)))
+        return self.files()
 
     def by_size(self) -> List[str]:
-        return to_files(sort_by_size(self.src))
+        with self.telemetry.phase("walk"):
+            return self.units(to_files(sort_by_size(self.src, self.store)))
 
     def by_random(self) -> List[str]:
-        files = to_files(list(candidate_files(self.src)))
+        files = self.files()
         random.shuffle(files)
         return files
 
@@ -214,57 +438,128 @@ class Runner:
         files = subprocess.run(
             ["binsort", self.src], capture_output=True, text=True
         ).stdout.split("\n")
-        return [f for f in files if not os.path.isdir(f)]
+        return self.units([f for f in files if not os.path.isdir(f)])
 
     def by_naive_similarity(self) -> List[str]:
-        files: List[Tuple[str, str]] = list(candidate_files(self.src))
-        return to_files(
-            sorted(files, key=lambda x: most_common(os.path.join(x[0], x[1])))
-        )
+        with self.telemetry.phase("walk"):
+            files: List[Tuple[str, str]] = list(candidate_files(self.src))
+        with self.telemetry.phase("similarity"):
+            return self.units(
+                to_files(
+                    sorted(
+                        files,
+                        key=lambda x: most_common(
+                            os.path.join(x[0], x[1]), self.store, self.tokens
+                        ),
+                    )
+                )
+            )
 
     def by_non_naive_similarity(self) -> List[str]:
-        files = list(candidate_files(self.src))
+        files = self.files()
         random.shuffle(files)  # why?
-        return order_by_similarity([os.path.join(f[0], f[1]) for f in files])
+        with self.telemetry.phase("similarity"):
+            return order_by_similarity(files, self.store, self.workers, self.tokens)
+
+    def by_minhash_similarity(self) -> List[str]:
+        files = self.files()
+        with self.telemetry.phase("similarity"):
+            return minhash_order(
+                files,
+                None,
+                self.minhash_perm,
+                self.minhash_bands,
+                signature_of=lambda file: self.tokens.signature(
+                    file, 4, self.minhash_perm, self.store
+                ),
+            )
+
+    def by_compression_distance(self) -> List[str]:
+        files = self.files()
+        with self.telemetry.phase("similarity"):
+            return ncd.compression_distance_order(
+                files,
+                self.backend,
+                self.store.data,
+                self.ncd_cache,
+                self.executor_kind,
+                self.workers,
+            )
 
     def by_non_naive_similarity_with_swap(self) -> List[str]:
-        files = list(candidate_files(self.src))
         return self.by_swapping_files(self.by_non_naive_similarity())
 
     def by_swapping_files(self, best_choice: List[str]) -> List[str]:
+        self.accept(best_choice)
         best_size = self.compute_size(best_choice, self.extension)
+        estimator = self.window_estimator(best_choice, best_size)
+        if estimator:
+            # the estimate only reads the region around a swap, so swaps are
+            # made in place, and undone if they aren't kept; this copy is the
+            # one that changes, not the order the evaluator accepted
+            best_choice = list(best_choice)
         i = 0
         iters = 0
-        while i + 1 < len(best_choice):
-            next_choice = list(best_choice)
+        while i + 1 < len(best_choice) and not self.out_of_time():
+            next_choice = best_choice if estimator else list(best_choice)
             left = next_choice[i]
             right = next_choice[i + 1]
             next_choice[i] = right
             next_choice[i + 1] = left
-            size = self.compute_size(next_choice, self.extension)
+            if estimator:
+                size = estimator.estimate(next_choice, (i, i + 1))
+            elif self.multifidelity:
+                size = self.scored_sizes(best_choice, best_size, [next_choice])[0]
+            else:
+                size = self.compute_size(next_choice, self.extension)
             if size + 1 < best_size:
                 best_choice = next_choice
                 best_size = size
+                if estimator:
+                    best_size = estimator.accept(best_choice, size, (i, i + 1))
+                else:
+                    self.accept(best_choice)
                 i = max(0, i - 3)  # yolo, think harder about bounds
                 iters += 1
+            elif estimator:
+                next_choice[i] = left
+                next_choice[i + 1] = right
             i += 1
+        if estimator:
+            estimator.verify(best_choice, best_size)
         return best_choice
 
     def by_swapping_count(self, files) -> List[str]:
-        i = 0
-        best_size = self.compute_size(files, self.extension)
-        best_choice = files
-        while i < self.count:
-            i += 1
-            with open("output", "a") as f:
+        start = list(files)
+        resumed = self.resume_state(start)
+        if resumed is None:
+            i = 0
+            self.accept(files)
+            best_size = self.compute_size(files, self.extension)
+            best_choice = files
+        else:
+            i = resumed["iteration"]
+            best_choice = files = resumed["best"]
+            best_size = resumed["best_size"]
+            self.accept(best_choice)
+        estimator = self.window_estimator(best_choice, best_size)
+        surrogate = self.make_surrogate()
+        batch = self.batch_size()
+        while i < self.count and not self.out_of_time():
+            candidates = []
+            moves = []
+            for _ in range(min(batch, self.count - i)):
+                i += 1
                 if i % 1000 == 0:
-                    now = datetime.datetime.now()
-                    msg = f"{now}, did iteration {i}"
-                    if self.debug:
-                        print(msg, file=f)
-            next_choice = list(best_choice)
-            swap(next_choice)
-            size = self.compute_size(next_choice, extension)
+                    self.progress(i, best_size)
+                next_choice = list(best_choice)
+                moves.append(swap(next_choice))
+                candidates.append(next_choice)
+            sizes = self.screened_sizes(
+                best_choice, best_size, candidates, moves, estimator, surrogate
+            )
+            size = min(sizes)
+            next_choice = candidates[sizes.index(size)]
             # making sure it's at least a gap of two, because it seems
             # as if the files generated here sometimes shrink or
             # expand by one byte, not sure why
@@ -272,11 +567,21 @@ class Runner:
                 best_choice = next_choice
                 files = next_choice
                 best_size = size
-                with open("output", "a") as f:
-                    now = datetime.datetime.now()
-                    msg = f"{now}, best_size={best_size} on iteration {i}"
-                    if self.debug:
-                        print(msg, file=f)
+                if estimator:
+                    move = moves[sizes.index(size)]
+                    best_size = estimator.accept(best_choice, size, move)
+                else:
+                    self.accept(best_choice)
+                self.progress(i, best_size)
+            self.checkpoint(
+                start, {"iteration": i, "best_size": best_size}, {"best": best_choice}
+            )
+        self.checkpoint(
+            start, {"iteration": i, "best_size": best_size}, {"best": best_choice}, force=True
+        )
+        if estimator:
+            estimator.verify(best_choice, best_size)
+        self.report_surrogate(surrogate)
         return best_choice
 
     def compute_size(self, files: List[str], extension=None) -> int:
@@ -284,111 +589,544 @@ class Runner:
             extension = self.extension
         if len(files) < 2:
             print(files)
-        target = self.workdir() + "/tmpfile.tar"
-        make_archive(target, files, extension)
-        file_name = target + extension
-        size = os.path.getsize(file_name)
-        os.remove(file_name)
+        if extension != self.extension:
+            evaluator = make_evaluator(
+                self.evaluator_kind,
+                self.workdir(),
+                extension,
+                self.store,
+                groups=self.groups(),
+            )
+            return evaluator.size(files)
+        scored = self.scored
+        with self.telemetry.phase("evaluate"):
+            if self.memo is None:
+                size = self.measured([files], self.evaluator_sizes)[0]
+            else:
+                key = self.memo.key(files)
+                size = self.memo.get(key)
+                if size is None:
+                    start = time.perf_counter()
+                    size = self.measured([files], self.evaluator_sizes)[0]
+                    self.memo.put(key, size, time.perf_counter() - start)
+        self.telemetry.evaluated([size], self.scored - scored)
         return size
 
+    def window_estimator(self, files: List[str], size: int) -> Optional[WindowEstimator]:
+        """
+        When approximating, an estimator of local moves from files, which has
+        the given size. Otherwise None, and moves should be scored exactly.
+        """
+        if not self.approximate:
+            return None
+        estimator = WindowEstimator(
+            self.backend,
+            self.compute_size,
+            self.approximate,
+            store=self.store,
+            groups=self.groups(),
+        )
+        estimator.reset(files, size)
+        if estimator.covered():
+            # every move changes the whole archive, so estimates save nothing
+            print(f"{self.method}: the window covers the archive, scoring moves exactly")
+            return None
+        return estimator
+
+    def make_surrogate(self) -> Optional[Surrogate]:
+        if not self.surrogate:
+            return None
+        return Surrogate(self.surrogate, self.store, self.tokens)
+
+    def screened_sizes(
+        self,
+        base: List[str],
+        base_size: int,
+        candidates: List[List[str]],
+        changes: List[Sequence[int]],
+        estimator: Optional[WindowEstimator] = None,
+        surrogate: Optional[Surrogate] = None,
+    ) -> List[int]:
+        """
+        The sizes of candidates made from base by changing the given positions.
+        With a surrogate, only the candidates it passes are scored, and the
+        others are given a size of sys.maxsize.
+        """
+        if surrogate is None:
+            chosen = list(range(len(candidates)))
+        else:
+            with self.telemetry.phase("surrogate"):
+                chosen = surrogate.screen(base, candidates, changes)
+        if estimator:
+            found = [estimator.estimate(candidates[k], changes[k]) for k in chosen]
+        elif chosen:
+            found = self.scored_sizes(base, base_size, [candidates[k] for k in chosen])
+        else:
+            found = []
+        sizes = [sys.maxsize] * len(candidates)
+        for k, size in zip(chosen, found):
+            sizes[k] = size
+            if surrogate is not None and size != sys.maxsize:
+                surrogate.learn(k, size - base_size)
+        return sizes
+
+    def scored_sizes(
+        self, base: List[str], base_size: int, candidates: List[List[str]]
+    ) -> List[int]:
+        """
+        The sizes of candidates made from base. With multi-fidelity scoring,
+        the candidates that aren't promoted to the target codec are given a
+        size of sys.maxsize.
+        """
+        if self.multifidelity is None:
+            return self.compute_sizes(candidates)
+        with self.telemetry.phase("proxy"):
+            sizes, promoted = self.multifidelity.sizes(
+                base, base_size, candidates, self.compute_sizes
+            )
+        return [size if p else sys.maxsize for size, p in zip(sizes, promoted)]
+
+    def make_fidelity(self) -> Optional[MultiFidelity]:
+        if not self.fidelity:
+            return None
+        return MultiFidelity(
+            self.fidelity, self.extension, self.store, self.backend, self.groups()
+        )
+
+    def report_surrogate(self, surrogate: Optional[Surrogate]) -> None:
+        if surrogate is None:
+            return
+        print(f"{self.method}: {surrogate.summary()}")
+        self.telemetry.event(
+            "surrogate",
+            candidates=surrogate.candidates,
+            compressed=surrogate.compressed,
+            saved=surrogate.saved(),
+            precision=surrogate.precision(),
+            base_rate=surrogate.base_rate(),
+        )
+
+    def compute_sizes(self, candidates: List[List[str]]) -> List[int]:
+        """Compute the sizes of a batch of candidates, possibly concurrently"""
+        scored = self.scored
+        with self.telemetry.phase("evaluate"):
+            sizes = self.batch_sizes(candidates)
+        self.telemetry.evaluated(sizes, self.scored - scored)
+        return sizes
+
+    def batch_sizes(self, candidates: List[List[str]]) -> List[int]:
+        if self.executor is None:
+            self.executor = make_executor(
+                self.executor_kind,
+                self.workers,
+                self.evaluator,
+                self.evaluator_kind,
+                self.workdir(),
+                self.extension,
+                self.evaluator_options,
+            )
+            if self.accepted is not None:
+                self.executor.accept(self.accepted)
+        if self.memo is None:
+            return self.measured(candidates, self.executor.sizes)
+        keys = [self.memo.key(candidate) for candidate in candidates]
+        sizes = [self.memo.get(key) for key in keys]
+        # score each distinct unknown order once
+        missing: Dict[bytes, List[str]] = {}
+        for key, size, candidate in zip(keys, sizes, candidates):
+            if size is None and key not in missing:
+                missing[key] = candidate
+        if missing:
+            start = time.perf_counter()
+            computed = self.measured(list(missing.values()), self.executor.sizes)
+            elapsed = (time.perf_counter() - start) / len(missing)
+            for key, size in zip(missing, computed):
+                self.memo.put(key, size, elapsed)
+            found = dict(zip(missing, computed))
+            sizes = [found[k] if s is None else s for k, s in zip(keys, sizes)]
+        return sizes
+
+    def evaluator_sizes(self, candidates: List[List[str]]) -> List[int]:
+        return [self.evaluator.size(candidate) for candidate in candidates]
+
+    def measured(
+        self,
+        candidates: List[List[str]],
+        sizes: Callable[[List[List[str]]], List[int]],
+    ) -> List[int]:
+        """
+        The sizes of candidates, from the history when an earlier run scored
+        them, and otherwise from sizes, which are then recorded
+        """
+        if self.history is None:
+            self.scored += len(candidates)
+            return sizes(candidates)
+        orders = [self.expand(candidate) for candidate in candidates]
+        keys = [order_key(order) for order in orders]
+        known = self.history.sizes(keys)
+        missing = [k for k, key in enumerate(keys) if key not in known]
+        computed = sizes([candidates[k] for k in missing]) if missing else []
+        self.scored += len(missing)
+        for k, size in zip(missing, computed):
+            self.history.record(keys[k], size, orders[k])
+            known[keys[k]] = size
+        return [known[key] for key in keys]
+
+    def batch_size(self, minimum: int = 1) -> int:
+        """
+        The number of candidates to generate per round. Defaults to enough to
+        keep every worker busy.
+        """
+        if self.candidates:
+            return self.candidates
+        return max(minimum, self.workers)
+
+    def resume_state(self, files: List[str]) -> Optional[Dict[str, Any]]:
+        """When resuming, the checkpointed state of this method, if there is one"""
+        if self.checkpointer is None:
+            return None
+        return self.checkpointer.load(self.method, files)
+
+    def checkpoint(
+        self,
+        files: List[str],
+        state: Dict[str, Any],
+        orders: Dict[str, List[str]],
+        tree: Optional[Node] = None,
+        force: bool = False,
+    ) -> None:
+        """Checkpoint the state of a search that started from files, if one is due"""
+        if self.checkpointer is None:
+            return
+        if force or self.checkpointer.due():
+            with self.telemetry.phase("checkpoint"):
+                self.checkpointer.save(self.method, files, state, orders, tree)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.close()
+            self.executor = None
+        if self.history is not None:
+            self.history.close()
+            self.history = None
+        self.tokens.close()
+        self.store.close()
+
+    def accept(self, files: List[str]) -> None:
+        """
+        Tell the evaluator that files is now the order that candidates will be
+        derived from, so it can cache work along it.
+        """
+        self.accepted = files
+        self.evaluator.accept(files)
+        if self.executor is not None:
+            self.executor.accept(files)
+
     def by_hill_climbing(self) -> List[str]:
-        files = to_files(candidate_files(self.src))
-        return self.hill_climbing_with_probabilistic_replacement(files)
+        return self.hill_climbing_with_probabilistic_replacement(self.start())
 
     # Note that this is only very loosely inspired by mcts, not a faithful
     # implementation
     def by_mcts(self) -> List[str]:
-        files = to_files(candidate_files(self.src))
+        files = self.start()
         path_length = len(files)
-        tree = self.initialize_mcts(files)
-        for i in range(self.count):
+        resumed = self.resume_state(files)
+        if resumed is None:
+            tree = self.initialize_mcts(files)
+            start = 0
+        else:
+            tree = resumed["tree"]
+            start = resumed["iteration"]
+        batch = self.batch_size()
+        base_size = self.compute_size(files) if self.multifidelity else 0
+        paths: List[List[str]] = []
+        # iterations whose paths have been scored
+        done = start
+        for i in range(start, self.count):
+            if self.out_of_time():
+                break
             # periodically prune tree and output progress
             if i % 100 == 0:
-                if i == 0 or self.count // i > 2:
-                    tree.prune_tree(5, 0)
-                else:
-                    tree.prune_tree(5, len(files) // (self.count // i))
+                with self.telemetry.phase("mcts.prune_tree"):
+                    if i == 0 or self.count // i > 2:
+                        tree.prune_tree(5, 0)
+                    else:
+                        tree.prune_tree(5, len(files) // (self.count // i))
                 if i % 1000 == 0:
                     print(f"iteration #{i}")
+                    self.progress(i, tree.min)
             depth: int = 0
-            if i < self.count // 2:
-                node = tree.choose_path(5)
+            with self.telemetry.phase("mcts.choose_path"):
+                if i < self.count // 2:
+                    node = tree.choose_path(5)
+                else:
+                    depth = len(files) // (self.count // i)
+                    # hacky: this will waste effort sometimes.
+                    # better to do a real solution that focuses on interesting cases
+                    if depth + 3 >= len(files):
+                        depth = len(files) - 3
+                    node = tree.choose_path(5, forced_depth=depth)
+            with self.telemetry.phase("mcts.combined_path"):
+                paths.append(tree.combined_path(files, node.path(), depth))
+            if len(paths) < batch and i + 1 < self.count:
+                continue
+            if self.multifidelity:
+                with self.telemetry.phase("proxy"):
+                    sizes, promoted = self.multifidelity.sizes(
+                        files, base_size, paths, self.compute_sizes
+                    )
+                # only paths scored with the target codec can become the best
+                sizes = [
+                    size if p else max(size, tree.min + 2)
+                    for size, p in zip(sizes, promoted)
+                ]
             else:
-                depth = len(files) // (self.count // i)
-                # hacky: this will waste effort sometimes.
-                # better to do a real solution that focuses on interesting cases
-                if depth + 3 >= len(files):
-                    depth = len(files) - 3
-                node = tree.choose_path(5, forced_depth=depth)
-            path = tree.combined_path(files, node.path(), depth)
-            size = self.compute_size(path)
-            if size < tree.min:
-                print("new best ", i, size)
-            tree.update(path, size)
-            tree.print_order(path, size)
+                sizes = self.compute_sizes(paths)
+            for path, size in zip(paths, sizes):
+                if size < tree.min:
+                    print("new best ", i, size)
+                with self.telemetry.phase("mcts.update"):
+                    tree.update(path, size)
+                tree.print_order(path, size)
+            paths = []
+            done = i + 1
+            self.checkpoint(files, {"iteration": done}, {}, tree)
+        self.checkpoint(files, {"iteration": done}, {}, tree, force=True)
         return tree.best_path()
 
     def initialize_mcts(self, files: List[str]):
         tree = Node()
         tree.set_base_order(files)
-        tree.update(files, self.compute_size(files))
+        size = self.compute_size(files)
+        with self.telemetry.phase("mcts.update"):
+            tree.update(files, size)
+        orders = []
         for i in range(512):
             order = files[:]
             for j in range(5):
                 swap(order)
-            size = self.compute_size(order)
-            tree.update(order, size)
+            orders.append(order)
+        for order, size in zip(orders, self.compute_sizes(orders)):
+            with self.telemetry.phase("mcts.update"):
+                tree.update(order, size)
             tree.print_order(order, size)
         print("initialized")
         return tree
 
     def by_counted_iterations(self) -> List[str]:
-        return self.by_swapping_count(to_files(candidate_files(self.src)))
+        return self.by_swapping_count(self.start())
 
     def hill_climbing_with_probabilistic_replacement(self, files: List[str]):
         """
         Runs a hill climbing algorithm.
 
-        Repeatedly runs 4 swaps. If any is an improvement, pick the best of them.
+        Repeatedly runs 4 swaps (or one per worker, if there are more workers).
+        If any is an improvement, pick the best of them.
         Alternately, has a 1/20 chance of accepting the swap even if it is not an improvement.
         """
-        state = OptState(files, self.compute_size(files, self.extension))
-        with open("output", "a") as output_file:
-            while True and state.iterations < self.count:
-                if state.iterations % 1000 == 0:
-                    now = datetime.datetime.now()
-                    msg = f"{now}, did iteration {state.iterations}"
-                    if self.debug:
-                        print(msg, file=output_file)
-                best_candidate_size = sys.maxsize
-                for candidate_num in range(4):
-                    state.iterations += 1
-                    next_choice = list(state.current)
-                    swap(next_choice)
-                    size = self.compute_size(next_choice, self.extension)
-                    if best_candidate_size is None or size < best_candidate_size:
-                        best_candidate = next_choice
-                        best_candidate_size = size
-                if best_candidate_size + 1 < state.best_size:
-                    state.best = best_candidate
-                    state.best_size = best_candidate_size
-
-                if best_candidate_size < state.current_size:
-                    state.current = best_candidate
-                    state.current_size = best_candidate_size
-                    now = datetime.datetime.now()
-                    msg = f"{now}, best_size={state.best_size}, best_size_candidate={best_candidate_size}, current_size={state.current_size} on iteration {state.iterations}"
-                    if self.debug:
-                        print(msg, file=output_file)
-                elif random.random() > 0.95:
-                    state.current = best_candidate
-                    state.current_size = best_candidate_size
-                    now = datetime.datetime.now()
-                    msg = f"{now}, switched randomly best_size={state.best_size}, best_size_candidate={best_candidate_size}, current_size={state.current_size} on iteration {state.iterations}"
-                    if self.debug:
-                        print(msg, file=output_file)
+        resumed = self.resume_state(files)
+        if resumed is None:
+            self.accept(files)
+            state = OptState(files, self.compute_size(files, self.extension))
+        else:
+            state = OptState.restore(resumed)
+            self.accept(state.current)
+        surrogate = self.make_surrogate()
+        while state.iterations < self.count and not self.out_of_time():
+            if state.iterations % 1000 == 0:
+                self.progress(state.iterations, state.best_size)
+            best_candidate_size = sys.maxsize
+            candidates = []
+            moves = []
+            for candidate_num in range(self.batch_size(4)):
+                state.iterations += 1
+                next_choice = list(state.current)
+                moves.append(swap(next_choice))
+                candidates.append(next_choice)
+            sizes = self.screened_sizes(
+                state.current, state.current_size, candidates, moves, None, surrogate
+            )
+            if min(sizes) == sys.maxsize:
+                # the surrogate, or the proxy codec of multi-fidelity scoring,
+                # screened them all out, but the iterations still count
+                self.checkpoint(files, *state.checkpoint())
+                continue
+            for next_choice, size in zip(candidates, sizes):
+                if best_candidate_size is None or size < best_candidate_size:
+                    best_candidate = next_choice
+                    best_candidate_size = size
+            if best_candidate_size + 1 < state.best_size:
+                state.best = best_candidate
+                state.best_size = best_candidate_size
+
+            if best_candidate_size < state.current_size:
+                state.current = best_candidate
+                state.current_size = best_candidate_size
+                self.accept(state.current)
+                self.progress(
+                    state.iterations,
+                    state.best_size,
+                    candidate_size=best_candidate_size,
+                    current_size=state.current_size,
+                )
+            elif random.random() > 0.95:
+                state.current = best_candidate
+                state.current_size = best_candidate_size
+                self.accept(state.current)
+                self.progress(
+                    state.iterations,
+                    state.best_size,
+                    candidate_size=best_candidate_size,
+                    current_size=state.current_size,
+                    switched_randomly=True,
+                )
+            self.checkpoint(files, *state.checkpoint())
+        self.checkpoint(files, *state.checkpoint(), force=True)
+        self.report_surrogate(surrogate)
         return state.best
 
+    def by_genetic(self) -> List[str]:
+        """
+        An island-model genetic search: see genetic.py. The count is shared
+        between the islands, each of which runs in a process of its own.
+        """
+        files = self.start()
+        if len(files) < 2:
+            return files
+        islands = max(1, min(self.islands, self.count // self.population))
+        settings = {
+            "seed": random.getrandbits(64),
+            "workdir": self.workdir(),
+            "evaluator": self.evaluator_kind,
+            "extension": self.extension,
+            "options": self.evaluator_options,
+            "deadline": self.deadline,
+            "budget": self.count // islands,
+            "population": self.population,
+            "migration": self.migration,
+            "crossover": self.crossover,
+        }
+        with self.telemetry.phase("evaluate"):
+            found = genetic.evolve(files, islands, settings)
+        for index, order, size, evaluations, generations in found:
+            print(
+                f"island {index}: {size} after {evaluations} evaluations, {generations} generations"
+            )
+            self.telemetry.evaluated([size], evaluations)
+        best = min(found, key=lambda result: result[2])
+        self.progress(sum(result[3] for result in found), best[2])
+        return best[1]
+
+    def by_hierarchical(self) -> List[str]:
+        """
+        Order blocks of directories, then the files within each block: see
+        hierarchy.py. Blocks are searched in parallel when there are workers.
+        """
+        files = self.files()
+        with self.telemetry.phase("similarity"):
+            blocks = hierarchy.order_blocks(
+                hierarchy.directory_blocks(files),
+                self.store,
+                self.minhash_perm,
+                self.minhash_bands,
+                self.tokens,
+            )
+        budgets = hierarchy.block_budgets(blocks, self.count, self.block_budget)
+        seeds = [random.getrandbits(64) for _ in blocks]
+        with self.telemetry.phase("evaluate"):
+            results = hierarchy.improve_blocks(
+                blocks,
+                budgets,
+                seeds,
+                self.deadline,
+                self.workers,
+                self.evaluator,
+                lambda workers: process_pool(
+                    self.evaluator_kind,
+                    self.workdir(),
+                    self.extension,
+                    self.evaluator_options,
+                    workers,
+                ),
+            )
+        evaluations = sum(result[3] for result in results)
+        saved = sum(result[2] - result[1] for result in results)
+        self.telemetry.evaluated([], evaluations)
+        print(
+            f"{len(blocks)} blocks, {evaluations} evaluations, {saved} bytes saved within blocks"
+        )
+        return [file for result in results for file in result[0]]
+
+    def by_segmented(self) -> List[str]:
+        """
+        Search segments of the order concurrently, each with segment_method:
+        see segments.py. After each round, the segments are put back together,
+        and the result kept if the whole order compresses better.
+        """
+        best = self.start()
+        groups = self.groups()
+        lengths = {
+            file: sum(self.store.member_length(f) for f in groups.get(file, [file]))
+            for file in best
+        }
+        minimum = segments.SEGMENT_WINDOWS * self.backend.window
+        best_size = self.compute_size(best)
+        for round_index in range(self.segment_rounds):
+            if self.out_of_time():
+                break
+            cuts = segments.boundaries(
+                [lengths[file] for file in best],
+                self.segment_count,
+                minimum,
+                round_index % 2 == 1,
+            )
+            parts = [best[start:end] for start, end in cuts]
+            time_budget = None
+            if self.deadline is not None:
+                left = self.deadline - time.monotonic()
+                time_budget = max(0.0, left / (self.segment_rounds - round_index))
+            settings = [
+                {
+                    "target_archive": self.target_archive,
+                    "src": self.src,
+                    "extension": self.extension,
+                    "count": max(1, self.count // self.segment_rounds // len(parts)),
+                    "evaluator": self.evaluator_kind,
+                    "cache_memory": self.evaluator_options["memory_limit"],
+                    "seed": random.getrandbits(64),
+                    "approximate": self.approximate,
+                    "memo_size": self.memo.capacity if self.memo else 0,
+                    "time_budget": time_budget,
+                    "surrogate": self.surrogate,
+                    "fidelity": self.fidelity,
+                    "level": self.backend.level,
+                    "window_log": self.backend.window_log,
+                    "groups": groups,
+                }
+                for _ in parts
+            ]
+            with self.telemetry.phase("evaluate"):
+                found = segments.search_segments(
+                    parts, settings, self.segment_method, self.workers
+                )
+            # each segment's order comes back expanded
+            candidate = self.units([file for part, _ in found for file in part])
+            size = self.compute_size(candidate)
+            print(f"round {round_index}: {len(parts)} segments, {best_size} -> {size}")
+            self.telemetry.evaluated([], sum(evaluations for _, evaluations in found))
+            if size + 1 < best_size:
+                best = candidate
+                best_size = size
+                self.progress(round_index, best_size)
+        return best
+
+    def start_budget(self) -> None:
+        if self.time_budget is not None:
+            self.deadline = time.monotonic() + self.time_budget
+
+    def out_of_time(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
     def run(self, arg):
         if arg == "--all":
             for k in self.options.keys():
@@ -405,6 +1143,23 @@ class OptState:
         self.current_size = best_size
         self.iterations = 0
 
+    def checkpoint(self) -> Tuple[Dict[str, Any], Dict[str, List[str]]]:
+        """The state to checkpoint, as plain values and orders"""
+        values = {
+            "best_size": self.best_size,
+            "current_size": self.current_size,
+            "iterations": self.iterations,
+        }
+        return values, {"best": self.best, "current": self.current}
+
+    @staticmethod
+    def restore(saved: Dict[str, Any]) -> "OptState":
+        state = OptState(saved["best"], saved["best_size"])
+        state.current = saved["current"]
+        state.current_size = saved["current_size"]
+        state.iterations = saved["iterations"]
+        return state
+
 
 class ArchiveMethod:
     """A method for creating an archive
@@ -420,20 +1175,325 @@ class ArchiveMethod:
         self.suffix = suffix
         self.method = method
 
+    def order(self) -> List[str]:
+        """Run the method, returning the order of the files"""
+        self.runner.start_budget()
+        self.runner.method = self.suffix
+        self.runner.telemetry.begin(self.suffix)
+        memo = self.runner.memo
+        if memo is not None:
+            memo.reset_stats()
+        self.runner.tokens.reset_stats()
+        history = self.runner.history
+        if history is not None:
+            history.reset_stats()
+        self.runner.multifidelity = self.runner.make_fidelity()
+        with self.runner.telemetry.profiled(self.suffix):
+            files = self.runner.expand(self.method.__call__())
+        if memo is not None and memo.hits + memo.misses:
+            print(f"{self.suffix}: {memo.summary()}")
+        tokens = self.runner.tokens
+        if tokens.hits + tokens.misses:
+            print(f"{self.suffix}: {tokens.summary()}")
+        if history is not None and history.hits + history.recorded:
+            print(f"{self.suffix}: {history.summary()}")
+        fidelity = self.runner.multifidelity
+        if fidelity is not None and fidelity.candidates:
+            print(f"{self.suffix}: {fidelity.summary()}")
+            self.runner.telemetry.event(
+                "fidelity",
+                candidates=fidelity.candidates,
+                promoted=fidelity.promoted,
+                correlation=fidelity.correlation,
+                fraction=fidelity.fraction,
+            )
+        self.runner.multifidelity = None
+        return files
+
     def __call__(self):
         name = self.runner.target_archive + "_" + self.suffix
-        files = self.method.__call__()
+        files = self.order()
+        extension = self.runner.extension
+        store = self.runner.store
+        backend = self.runner.backend
         try:
-            make_archive(name, files, self.runner.extension)
+            with self.runner.telemetry.phase("archive"):
+                if self.runner.target_archive == "-":
+                    write_archive(
+                        "-", files, extension, store, self.runner.output, backend
+                    )
+                else:
+                    write_archive(
+                        name + extension, files, extension, store, backend=backend
+                    )
         except Exception:
             print(files)
-
-
-# usage: tarper.py target_archive source_directory extension iteration_count key
+        self.runner.telemetry.end()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Optimize the order of files in a compressed tar archive"
+    )
+    parser.add_argument("target_archive", help="archive path prefix, or - for stdout")
+    parser.add_argument("source_directory")
+    parser.add_argument("extension", choices=sorted(BACKENDS))
+    parser.add_argument("iteration_count", type=int)
+    parser.add_argument("key", help="an ordering method, or --all")
+    parser.add_argument(
+        "--evaluator",
+        choices=sorted(EVALUATORS),
+        default="cli",
+        help="how candidate orderings are scored",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=None,
+        help="the compression level, which defaults to the codec's (gzip -6, zstd -19, xz -6, bzip2 -9, brotli 11, lz4 -9)",
+    )
+    parser.add_argument(
+        "--window-log",
+        type=int,
+        default=None,
+        help="log2 of the codec's window or dictionary size, where it has one",
+    )
+    parser.add_argument(
+        "--cache-memory",
+        type=int,
+        default=256,
+        help="megabytes of compressor snapshots kept by the incremental evaluator",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default="serial",
+        help="how batches of candidates are scored",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="threads or processes scoring candidates, 0 for one per core",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=None,
+        help="candidates per round (defaults to 4 for hillclimb, else 1, or the number of workers if larger)",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--minhash-perm",
+        type=int,
+        default=64,
+        help="length of the MinHash signatures used by minhashsimilarity",
+    )
+    parser.add_argument(
+        "--minhash-bands",
+        type=int,
+        default=16,
+        help="LSH bands for minhashsimilarity: more is more accurate, and slower",
+    )
+    parser.add_argument(
+        "--ncd-cache",
+        default=ncd.default_cache_dir(),
+        help="directory caching the cost matrices of compressiondistance",
+    )
+    parser.add_argument(
+        "--token-cache",
+        metavar="PATH",
+        default=None,
+        help="SQLite database keeping the tokens of files between runs, which are otherwise kept for the run only",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="PATH",
+        default=None,
+        help="SQLite database of the sizes of orders scored on this tree, which runs look up, add to, and start their searches from the best of",
+    )
+    parser.add_argument(
+        "--memo-size",
+        type=int,
+        default=100000,
+        help="number of scored orderings remembered, 0 to disable",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="seconds each method may search for, as well as the iteration count",
+    )
+    parser.add_argument(
+        "--telemetry",
+        metavar="PATH",
+        default=None,
+        help="append JSON lines of timings, evaluations and best sizes to PATH",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIRECTORY",
+        default=None,
+        help="run each method under cProfile, writing DIRECTORY/<method>.prof",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="DIRECTORY",
+        default=None,
+        help="periodically checkpoint hillclimb, counted and mcts to DIRECTORY/<method>.ckpt",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="seconds between checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue each method from its checkpoint, if it has one",
+    )
+    parser.add_argument(
+        "--islands",
+        type=int,
+        default=0,
+        help="processes running the genetic search, 0 for one per core",
+    )
+    parser.add_argument(
+        "--population",
+        type=int,
+        default=16,
+        help="orders on each island of the genetic search",
+    )
+    parser.add_argument(
+        "--migration",
+        type=int,
+        default=5,
+        metavar="GENERATIONS",
+        help="generations between migrations of the best orders to the next island",
+    )
+    parser.add_argument(
+        "--crossover",
+        choices=sorted(CROSSOVERS),
+        default="ox",
+        help="the crossover of the genetic search",
+    )
+    parser.add_argument(
+        "--surrogate",
+        type=float,
+        default=0.0,
+        metavar="FRACTION",
+        help="in hillclimb and counted, compress only the candidates a learned model ranks in the best FRACTION",
+    )
+    parser.add_argument(
+        "--block-budget",
+        type=int,
+        default=200,
+        help="the most evaluations hierarchical spends on each block",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=0,
+        help="segments segmented searches concurrently, 0 for one per worker",
+    )
+    parser.add_argument(
+        "--segment-method",
+        choices=segments.SEGMENT_METHODS,
+        default="counted",
+        help="the local search segmented runs on each segment",
+    )
+    parser.add_argument(
+        "--segment-rounds",
+        type=int,
+        default=2,
+        help="rounds of segmented, shifting the segment boundaries on every other",
+    )
+    parser.add_argument(
+        "--fidelity",
+        type=float,
+        default=0.0,
+        metavar="FRACTION",
+        help="in hillclimb, counted, swapping and mcts, score candidates with a fast proxy codec first, and promote about FRACTION to the target",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["off", "exact", "near"],
+        default="off",
+        help="search identical files, or near-identical ones too, as single units kept adjacent in the archive",
+    )
+    parser.add_argument(
+        "--approximate",
+        type=int,
+        default=0,
+        metavar="N",
+        help="score swaps by recompressing only the window around them, verifying the true size every N accepted moves",
+    )
+    # --all is a key, not an option, but argparse would treat it as one
+    args = parser.parse_args(["all" if arg == "--all" else arg for arg in argv])
+    if args.key == "all":
+        args.key = "--all"
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+    if args.key == "--all" and args.target_archive == "-":
+        parser.error("--all writes an archive per method, so it can't write to stdout")
+    backend = make_backend(args.extension, args.level, args.window_log)
+    if not backend.usable():
+        parser.error(str(backend.unusable()))
+    return args
+
+
+# usage: tarper.py target_archive source_directory extension iteration_count key [options]
 if __name__ == "__main__":
-    target_archive = sys.argv[1]
-    src = sys.argv[2]
-    extension = sys.argv[3]
-
-    runner = Runner(target_archive, src, extension, int(sys.argv[4]))
-    runner.run(sys.argv[5])
+    args = parse_args(sys.argv[1:])
+    extension = args.extension
+
+    runner = Runner(
+        args.target_archive,
+        args.source_directory,
+        extension,
+        args.iteration_count,
+        evaluator=args.evaluator,
+        cache_memory=args.cache_memory << 20,
+        executor=args.executor,
+        workers=args.workers,
+        candidates=args.candidates,
+        seed=args.seed,
+        approximate=args.approximate,
+        minhash_perm=args.minhash_perm,
+        minhash_bands=args.minhash_bands,
+        ncd_cache=args.ncd_cache,
+        memo_size=args.memo_size,
+        time_budget=args.time_budget,
+        telemetry_path=args.telemetry,
+        profile_dir=args.profile,
+        checkpoint_dir=args.checkpoint,
+        checkpoint_interval=args.checkpoint_interval,
+        resume=args.resume,
+        islands=args.islands,
+        population=args.population,
+        migration=args.migration,
+        crossover=args.crossover,
+        surrogate=args.surrogate,
+        block_budget=args.block_budget,
+        segment_count=args.segments,
+        segment_method=args.segment_method,
+        segment_rounds=args.segment_rounds,
+        fidelity=args.fidelity,
+        level=args.level,
+        window_log=args.window_log,
+        dedup=args.dedup,
+        token_cache=args.token_cache,
+        history=args.history,
+    )
+    try:
+        if args.target_archive == "-":
+            # the archive goes to stdout, so progress messages go to stderr
+            runner.output = sys.stdout.buffer
+            with contextlib.redirect_stdout(sys.stderr):
+                runner.run(args.key)
+        else:
+            runner.run(args.key)
+    finally:
+        runner.close()
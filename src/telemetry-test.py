@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+
+from tarper import Runner
+from testtree import write_tree
+from telemetry import Telemetry
+
+
+def test_evaluated_counts_and_records_improvements():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "telemetry.jsonl")
+        telemetry = Telemetry(path)
+        telemetry.begin("method")
+        telemetry.evaluated([30, 20])
+        # remembered sizes aren't counted
+        telemetry.evaluated([20], 0)
+        telemetry.evaluated([10], 1)
+        with telemetry.phase("evaluate"):
+            pass
+        summary = telemetry.end()
+        assert summary["evaluations"] == 3
+        assert summary["best_size"] == 10
+        assert [size for _, size in summary["best_sizes"]] == [20, 10]
+        assert summary["phases"]["evaluate"]["calls"] == 1
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        assert [r["event"] for r in records] == ["best", "best", "method"]
+        assert [r["evaluations"] for r in records] == [2, 3, 3]
+        assert all(r["method"] == "method" for r in records)
+
+
+def test_memo_hits_are_not_evaluations():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        write_tree(source, 6, name="{}")
+        runner = Runner(
+            os.path.join(root, "archive"),
+            source,
+            ".gz",
+            40,
+            evaluator="inprocess",
+            seed=1,
+            telemetry_path=os.path.join(root, "telemetry.jsonl"),
+        )
+        try:
+            runner.options["hillclimb"].order()
+            files = runner.files()
+            runner.compute_size(files)
+            runner.compute_sizes([files, files])
+            summary = runner.telemetry.summary()
+            assert runner.memo.hits > 0
+            assert summary["evaluations"] == runner.memo.misses
+        finally:
+            runner.close()
+
+
+def test_segmented_counts_only_compressions():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        write_tree(source, 3, name="{}")
+        runner = Runner(
+            os.path.join(root, "archive"), source, ".gz", 200, evaluator="inprocess", seed=1
+        )
+        try:
+            runner.options["segmented"].order()
+            # three files have six orders, compressed at most once a round in
+            # the segment, besides the whole order before and after each round
+            rounds = runner.segment_rounds
+            assert runner.telemetry.summary()["evaluations"] <= 6 * rounds + rounds + 1
+        finally:
+            runner.close()
@@ -0,0 +1,136 @@
+"""
+Instrumentation of the hot paths of a run.
+
+Telemetry accumulates the time spent in, and the number of calls to, named
+phases of the run: walking the source tree, building similarities, scoring
+orderings, the MCTS tree operations, and building and compressing archives.
+It also counts evaluations and records the best size seen over time.
+
+When given a path, it appends JSON lines to it: a "best" record for each
+improvement, "progress" records from the search loops, and a "method" record
+summarizing each method when it finishes. When given a profile directory, each
+method runs under cProfile and its stats are dumped to <directory>/<method>.prof,
+for reading with pstats or snakeviz.
+
+Code that has no Runner at hand, such as make_archive, times its phases with
+the module-level phase(), which records into the installed Telemetry, if any.
+"""
+import contextlib
+import cProfile
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class Phase:
+    __slots__ = ("seconds", "calls")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+
+
+class Telemetry:
+    def __init__(self, path: Optional[str] = None, profile_dir: Optional[str] = None):
+        self.path = path
+        self.profile_dir = profile_dir
+        self.method: Optional[str] = None
+        self.begin(None)
+
+    def begin(self, method: Optional[str]) -> None:
+        """Start recording a method, resetting everything recorded so far"""
+        self.method = method
+        self.start = time.perf_counter()
+        self.phases: Dict[str, Phase] = {}
+        self.evaluations = 0
+        self.best_size: Optional[int] = None
+        # (seconds since the start, size) for each improvement
+        self.best_sizes: List[Tuple[float, int]] = []
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = Phase()
+            phase.seconds += time.perf_counter() - start
+            phase.calls += 1
+
+    def evaluated(self, sizes: List[int], count: Optional[int] = None) -> None:
+        """
+        Record the sizes of scored orderings, count of which were compressed
+        rather than remembered (all of them, by default). Orderings scored
+        elsewhere may be given as the best of them and how many there were.
+        """
+        self.evaluations += len(sizes) if count is None else count
+        size = min(sizes, default=None)
+        if size is not None and (self.best_size is None or size < self.best_size):
+            self.best_size = size
+            elapsed = self.elapsed()
+            self.best_sizes.append((elapsed, size))
+            self.event("best", time=elapsed, size=size, evaluations=self.evaluations)
+
+    def event(self, kind: str, **fields: Any) -> None:
+        """Append a record to the JSON-lines file, if there is one"""
+        if self.path is None:
+            return
+        record = {"event": kind, "method": self.method}
+        record.update(fields)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = self.elapsed()
+        return {
+            "wall_time": elapsed,
+            "evaluations": self.evaluations,
+            "evaluations_per_sec": self.evaluations / elapsed if elapsed else 0,
+            "best_size": self.best_size,
+            "best_sizes": self.best_sizes,
+            "phases": {
+                name: {"seconds": phase.seconds, "calls": phase.calls}
+                for name, phase in sorted(self.phases.items())
+            },
+        }
+
+    def end(self) -> Dict[str, Any]:
+        """Finish recording the current method, returning its summary"""
+        summary = self.summary()
+        self.event("method", **summary)
+        return summary
+
+    @contextlib.contextmanager
+    def profiled(self, name: str) -> Iterator[None]:
+        """Run the body under cProfile, if there is a profile directory"""
+        if self.profile_dir is None:
+            yield
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(os.path.join(self.profile_dir, name + ".prof"))
+
+
+installed: Optional[Telemetry] = None
+
+
+def install(telemetry: Optional[Telemetry]) -> None:
+    global installed
+    installed = telemetry
+
+
+def phase(name: str):
+    if installed is None:
+        return contextlib.nullcontext()
+    return installed.phase(name)
@@ -0,0 +1,38 @@
+"""
+Trees of small text files for the tests.
+
+Files are words picked at random from WORDS, so orders of them compress to
+different sizes, and each seed gives the same tree.
+"""
+import os
+import random
+from typing import List
+
+WORDS = ["alpha", "beta", "gamma", "delta", "return", "import", "class"]
+
+
+def write_tree(
+    root: str,
+    count: int,
+    seed: int = 1,
+    longest: int = 500,
+    name: str = "f{}.txt",
+    directories: int = 0,
+) -> List[str]:
+    """
+    Write count files of 50 to longest words into root, named by name with
+    the index of each file, spread over that many subdirectories, if any.
+    Returns their paths, in the order written.
+    """
+    rng = random.Random(seed)
+    files = []
+    for i in range(count):
+        directory = root
+        if directories:
+            directory = os.path.join(root, "d" + str(i % directories))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name.format(i))
+        with open(path, "w") as f:
+            f.write(" ".join(rng.choice(WORDS) for _ in range(rng.randrange(50, longest))))
+        files.append(path)
+    return files
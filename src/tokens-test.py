@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+import tokens
+from minhash import EMPTY, signature
+from tokens import TokenCache, tokenize
+
+
+def test_tokenize_splits_on_separators():
+    data = b"foo(bar) {baz}[qux];x.y\tz\n\xff\xfeq"
+    assert list(tokenize(data)) == ["foo", "bar", "baz", "qux", "x", "y", "z", "\xff\xfeq"]
+    assert list(tokenize(data, 2)) == ["foo", "bar", "baz", "qux", "\xff\xfeq"]
+
+
+def test_tokens_across_blocks():
+    data = b"alpha beta.gamma(delta) epsilon " * 50
+    whole = list(tokenize(data))
+    block = tokens.BLOCK
+    tokens.BLOCK = 7
+    try:
+        assert list(tokenize(data)) == whole
+    finally:
+        tokens.BLOCK = block
+
+
+def test_cache_persists_and_notices_changes():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "cache", "tokens.sqlite")
+        file = os.path.join(root, "file")
+        empty = os.path.join(root, "empty")
+        with open(file, "wb") as f:
+            f.write(b"alpha beta beta gamma")
+        open(empty, "wb").close()
+        cache = TokenCache(path)
+        assert cache.words(file) == {"alpha": 1, "beta": 2, "gamma": 1}
+        assert cache.words(file, 4) == {"alpha": 1, "gamma": 1}
+        expected = signature(["alpha", "gamma"], 16)
+        assert cache.signature(file, 4, 16) == expected
+        assert cache.signature(empty, 4, 16) == (EMPTY,) * 16
+        cache.close()
+
+        cache = TokenCache(path)
+        assert cache.words(file, 4) == {"alpha": 1, "gamma": 1}
+        assert cache.signature(file, 4, 16) == expected
+        assert cache.signature(empty, 4, 16) == (EMPTY,) * 16
+        assert (cache.hits, cache.misses) == (3, 0)
+        cache.close()
+
+        with open(file, "wb") as f:
+            f.write(b"delta delta")
+        cache = TokenCache(path)
+        assert cache.words(file) == {"delta": 2}
+        assert cache.misses == 1
+        cache.close()
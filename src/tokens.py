@@ -0,0 +1,203 @@
+"""
+Tokenizing files for the similarity methods, with a persistent cache.
+
+Tokens are runs of bytes between whitespace and the separators . ; ( ) { }
+[ ], found by a regex over the bytes of a file, a block at a time, so large
+files are never copied whole and files that aren't UTF-8 tokenize as well as
+the rest. Tokens are decoded as latin-1, which maps each byte to one
+character, so lengths are in bytes, and every file has tokens.
+
+TokenCache keeps the token counts of each file, and the MinHash signatures
+made from them, in SQLite. Counts and signatures are stored by content hash,
+and files by path, with their size and modification time: a file whose size
+and time haven't changed is taken from the cache without being read, and a
+file that has changed is hashed, and only tokenized if no file had its
+contents before. Repeated runs over a mostly unchanged tree skip
+tokenization. Writes are committed in batches, and when the cache is closed.
+Without a path, the cache is only kept in memory, for the run.
+"""
+import array
+import collections
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from typing import Dict, Iterator, Optional, Tuple
+
+from minhash import EMPTY, TokenHasher, signature
+
+TOKEN = re.compile(rb"[^\s.;(){}\[\]]+")
+# the bytes tokenized at a time
+BLOCK = 1 << 20
+# writes between commits
+BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash BLOB
+);
+CREATE TABLE IF NOT EXISTS counts (hash BLOB PRIMARY KEY, counts TEXT);
+CREATE TABLE IF NOT EXISTS signatures (
+    hash BLOB, min_length INTEGER, num_perm INTEGER, signature BLOB,
+    PRIMARY KEY (hash, min_length, num_perm)
+);
+"""
+
+
+def tokenize(data, min_length: int = 0) -> Iterator[str]:
+    """The tokens of data longer than min_length, a block at a time"""
+    view = memoryview(data)
+    start = 0
+    while start < len(view):
+        block = bytes(view[start : start + BLOCK])
+        end = len(block)
+        if start + end < len(view):
+            # the last token may go on into the next block
+            end = _token_start(block, end) or end
+        for match in TOKEN.finditer(block, 0, end):
+            if match.end() - match.start() > min_length:
+                yield match.group().decode("latin-1")
+        start += end
+
+
+def _token_start(block: bytes, end: int) -> int:
+    """Where the token running up to end starts, 0 if it fills the block"""
+    position = end
+    while position > 0 and TOKEN.fullmatch(block, position - 1, position):
+        position -= 1
+    return position
+
+
+def read_file(file: str, store=None):
+    if store is not None:
+        return store.data(file)
+    with open(file, "rb") as f:
+        return f.read()
+
+
+def content_hash(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class TokenCache:
+    def __init__(self, path: Optional[str] = None):
+        self.connection: Optional[sqlite3.Connection] = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.executescript(SCHEMA)
+        self.hashes: Dict[str, bytes] = {}
+        self.all_counts: Dict[bytes, collections.Counter] = {}
+        self.signatures: Dict[Tuple[bytes, int, int], Tuple[int, ...]] = {}
+        self.hasher = TokenHasher()
+        self.pending = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def file_hash(self, file: str, store=None) -> bytes:
+        """The hash of file's contents, from the cache if it hasn't changed"""
+        found = self.hashes.get(file)
+        if found is not None:
+            return found
+        stat = os.stat(file)
+        path = os.path.abspath(file)
+        if self.connection is not None:
+            row = self.connection.execute(
+                "SELECT size, mtime_ns, hash FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+                self.hashes[file] = row[2]
+                return row[2]
+        found = self.hashes[file] = content_hash(read_file(file, store))
+        self.write(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, found),
+        )
+        return found
+
+    def counts(self, file: str, store=None) -> collections.Counter:
+        """The count of each token of file"""
+        key = self.file_hash(file, store)
+        found = self.all_counts.get(key)
+        if found is None and self.connection is not None:
+            row = self.connection.execute(
+                "SELECT counts FROM counts WHERE hash = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                found = collections.Counter(json.loads(row[0]))
+        if found is None:
+            self.misses += 1
+            found = collections.Counter(tokenize(read_file(file, store)))
+            self.write(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?)", (key, json.dumps(found))
+            )
+        else:
+            self.hits += 1
+        self.all_counts[key] = found
+        return found
+
+    def words(self, file: str, min_length: int = 0, store=None) -> collections.Counter:
+        """The count of each token of file longer than min_length"""
+        counts = self.counts(file, store)
+        if not min_length:
+            return counts
+        return collections.Counter(
+            {token: n for token, n in counts.items() if len(token) > min_length}
+        )
+
+    def signature(
+        self,
+        file: str,
+        min_length: int,
+        num_perm: int,
+        store=None,
+    ) -> Tuple[int, ...]:
+        """The MinHash signature of the tokens of file longer than min_length"""
+        key = (self.file_hash(file, store), min_length, num_perm)
+        found = self.signatures.get(key)
+        if found is None and self.connection is not None:
+            row = self.connection.execute(
+                "SELECT signature FROM signatures "
+                "WHERE hash = ? AND min_length = ? AND num_perm = ?",
+                key,
+            ).fetchone()
+            if row is not None:
+                # the signature of no tokens doesn't fit in 64 bits, and is
+                # stored as no bytes
+                found = tuple(array.array("Q", row[0])) or (EMPTY,) * num_perm
+        if found is not None:
+            self.hits += 1
+        else:
+            found = signature(
+                self.words(file, min_length, store), num_perm, self.hasher
+            )
+            values = b"" if EMPTY in found else array.array("Q", found).tobytes()
+            self.write(
+                "INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?)", key + (values,)
+            )
+        self.signatures[key] = found
+        return found
+
+    def write(self, statement: str, values: tuple) -> None:
+        if self.connection is None:
+            return
+        self.connection.execute(statement, values)
+        self.pending += 1
+        if self.pending >= BATCH:
+            self.connection.commit()
+            self.pending = 0
+
+    def summary(self) -> str:
+        return f"tokens: {self.hits} files from the cache, {self.misses} tokenized"
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,128 @@
+import os
+import random
+import tempfile
+
+from backends import Gzip
+from tarper import Runner
+from window import WindowEstimator
+
+# a tar header and 1000 bytes padded to 1024
+MEMBER = 512 + 1024
+
+
+def write_files(root: str, sizes) -> list:
+    rng = random.Random(1)
+    files = []
+    for i, size in enumerate(sizes):
+        path = os.path.join(root, "f" + str(i))
+        with open(path, "wb") as f:
+            f.write(bytes(rng.randrange(256) for _ in range(size)))
+        files.append(path)
+    return files
+
+
+def test_regions_reach_a_window_around_each_move():
+    with tempfile.TemporaryDirectory() as root:
+        files = write_files(root, [1000] * 10)
+        estimator = WindowEstimator(Gzip(6, 10), len, 0)
+        estimator.reset(files, 0)
+        assert estimator.offsets == [MEMBER * i for i in range(11)]
+        assert estimator.regions([5]) == [(4, 7)]
+        assert estimator.regions([6, 5]) == [(4, 8)]
+        assert estimator.regions([2, 8]) == [(1, 4), (7, 10)]
+        assert estimator.regions([0]) == [(0, 2)]
+        assert estimator.regions([9]) == [(8, 10)]
+        assert estimator.estimate(files) == 0
+
+
+def test_accept_keeps_offsets_and_verifies():
+    with tempfile.TemporaryDirectory() as root:
+        files = write_files(root, [100, 2000, 700, 5000, 10, 3000])
+        exact = []
+        estimator = WindowEstimator(
+            Gzip(6, 10), lambda order: exact.append(order) or 1234, 2
+        )
+        estimator.reset(files, 5000)
+        swapped = files[:1] + [files[3], files[2], files[1]] + files[4:]
+        assert estimator.accept(swapped, 4900, (1, 3)) == 4900
+        assert exact == []
+        offsets = estimator.offsets
+        estimator.reset(swapped, 4900)
+        assert offsets == estimator.offsets
+        # the second accepted move is verified, and the exact size kept
+        assert estimator.accept(files, 4800) == 1234
+        assert exact == [files]
+        assert estimator.verifications == [(4800, 1234)]
+        assert estimator.base_size == 1234
+
+
+def test_groups_take_up_their_members():
+    with tempfile.TemporaryDirectory() as root:
+        files = write_files(root, [1000] * 4)
+        groups = {files[0]: [files[0], files[2]]}
+        estimator = WindowEstimator(Gzip(6, 10), len, 0, groups=groups)
+        estimator.reset([files[0], files[1], files[3]], 0)
+        assert estimator.offsets == [0, 2 * MEMBER, 3 * MEMBER, 4 * MEMBER]
+
+
+def test_no_estimates_when_the_window_covers_the_archive():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        os.makedirs(source)
+        write_files(source, [1000] * 4)
+        for window_log, expected in ((15, False), (9, True)):
+            runner = Runner(
+                os.path.join(root, "archive"),
+                source,
+                ".gz",
+                10,
+                evaluator="inprocess",
+                approximate=5,
+                window_log=window_log,
+            )
+            try:
+                files = runner.files()
+                estimator = runner.window_estimator(files, runner.compute_size(files))
+                assert (estimator is not None) == expected
+            finally:
+                runner.close()
+
+
+def test_duplicates_are_counted_once():
+    with tempfile.TemporaryDirectory() as root:
+        files = write_files(root, [1000] * 4)
+        groups = {files[0]: [files[0], files[2]]}
+        estimator = WindowEstimator(Gzip(6, 10), len, 0, groups=groups)
+        # files[2] is already in the stream with files[0]
+        order = [files[0], files[1], files[2], files[3]]
+        estimator.reset(order, 0)
+        assert estimator.offsets == [0, 2 * MEMBER, 3 * MEMBER, 3 * MEMBER, 4 * MEMBER]
+        swapped = [files[2], files[1], files[0], files[3]]
+        estimator.accept(swapped, 0, (0, 2))
+        assert estimator.offsets == [0, MEMBER, 2 * MEMBER, 3 * MEMBER, 4 * MEMBER]
+
+
+def test_swapping_files_keeps_the_order_it_was_given():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        os.makedirs(source)
+        write_files(source, [300, 1000, 300, 1000, 300, 1000])
+        runner = Runner(
+            os.path.join(root, "archive"),
+            source,
+            ".gz",
+            10,
+            evaluator="inprocess",
+            approximate=2,
+            window_log=9,
+        )
+        try:
+            files = runner.files()
+            given = list(files)
+            order = runner.by_swapping_files(files)
+            # swaps are made in place on a copy, and the rejected ones undone
+            assert files == given
+            assert sorted(order) == sorted(files)
+            assert runner.compute_size(order) <= runner.compute_size(files) + 1
+        finally:
+            runner.close()
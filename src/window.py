@@ -0,0 +1,174 @@
+"""
+An approximate cost model for local moves.
+
+Compressors only look back a bounded window: 32KB for gzip, 2^27 bytes for
+zstd --long, and others set by the backend (see backends.py). Moving a file
+therefore only changes the compressed output in a neighbourhood of the move.
+WindowEstimator predicts the size of a candidate by compressing just that
+neighbourhood with the archive's backend, from a window before the first
+changed position to a window after the last one, in both the accepted order
+and the candidate, and adding the difference to the size of the accepted
+order. When the window covers the whole archive, every move changes all of
+it, and there is nothing to save.
+
+The prediction drifts from the true size as moves are accepted, so every
+`verify_interval` accepted moves the accepted order is compressed in full and
+the drift is reported.
+"""
+import bisect
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from backends import Backend
+from dedup import expand
+from evaluator import member_chunks, padding, tar_header, tar_info
+
+
+class WindowEstimator:
+    def __init__(
+        self,
+        backend: Backend,
+        exact: Callable[[List[str]], int],
+        verify_interval: int,
+        store=None,
+        groups: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.backend = backend
+        self.store = store
+        # units of duplicates, which orders are expanded into (see dedup.py)
+        self.groups = groups or {}
+        self.member = member_chunks(store)
+        self.exact = exact
+        self.verify_interval = verify_interval
+        self.window = backend.window
+        self.lengths: Dict[str, int] = {}
+        self.base: List[str] = []
+        self.base_size = 0
+        self.offsets: List[int] = []
+        self.base_regions: Dict[Tuple[int, int], int] = {}
+        self.accepted = 0
+        self.estimates = 0
+        self.verifications: List[Tuple[int, int]] = []
+
+    def member_lengths(self, files: List[str]) -> List[int]:
+        """
+        The number of bytes each of files, and the files it stands for, take
+        up in the tar stream. Like expand, files already in the stream take
+        up nothing.
+        """
+        seen = set()
+        lengths = []
+        for file in files:
+            length = 0
+            for member in self.groups.get(file, (file,)):
+                if member not in seen:
+                    seen.add(member)
+                    length += self.file_length(member)
+            lengths.append(length)
+        return lengths
+
+    def file_length(self, file: str) -> int:
+        if self.store is not None:
+            return self.store.member_length(file)
+        if file not in self.lengths:
+            info = tar_info(file)
+            self.lengths[file] = (
+                len(tar_header(info)) + info.size + len(padding(info.size))
+            )
+        return self.lengths[file]
+
+    def reset(self, files: List[str], size: int) -> None:
+        """Make files, of the given exact size, the accepted order"""
+        self.base = list(files)
+        self.base_size = size
+        self.set_offsets()
+        self.base_regions = {}
+
+    def set_offsets(self) -> None:
+        self.offsets = [0]
+        for length in self.member_lengths(self.base):
+            self.offsets.append(self.offsets[-1] + length)
+
+    def covered(self) -> bool:
+        """Whether the window covers the whole accepted order"""
+        return self.offsets[-1] <= self.window
+
+    def regions(self, changed: Iterable[int]) -> List[Tuple[int, int]]:
+        """
+        The half-open ranges of indexes that have to be recompressed for
+        moves at the changed positions, merged where they overlap.
+        """
+        regions: List[Tuple[int, int]] = []
+        for position in sorted(changed):
+            start = bisect.bisect_right(
+                self.offsets, self.offsets[position] - self.window
+            )
+            start = max(0, start - 1)
+            end = bisect.bisect_left(
+                self.offsets, self.offsets[position + 1] + self.window
+            )
+            end = min(len(self.base), end)
+            if regions and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], max(end, regions[-1][1]))
+            else:
+                regions.append((start, end))
+        return regions
+
+    def region_size(self, files: List[str]) -> int:
+        return self.backend.size(
+            chunk for file in expand(files, self.groups) for chunk in self.member(file)
+        )
+
+    def estimate(self, files: List[str], changed: Optional[Iterable[int]] = None) -> int:
+        """
+        Predict the size of files, which differs from the accepted order only
+        at the changed positions (found by comparing, if not given).
+        """
+        if changed is None:
+            changed = [i for i, (l, r) in enumerate(zip(self.base, files)) if l != r]
+        self.estimates += 1
+        delta = 0
+        for start, end in self.regions(changed):
+            if (start, end) not in self.base_regions:
+                self.base_regions[(start, end)] = self.region_size(self.base[start:end])
+            delta += self.region_size(files[start:end]) - self.base_regions[(start, end)]
+        return self.base_size + delta
+
+    def accept(
+        self, files: List[str], size: int, changed: Optional[Iterable[int]] = None
+    ) -> int:
+        """
+        Make files, with its estimated size, the accepted order. Returns the
+        size to compare further candidates against, which is the exact size if
+        this move triggered a verification.
+        """
+        self.accepted += 1
+        if self.verify_interval and self.accepted % self.verify_interval == 0:
+            size = self.verify(files, size)
+        if changed is None:
+            self.reset(files, size)
+            return size
+        # a permutation of [low, high] leaves the offsets outside it unchanged
+        low, high = min(changed), max(changed)
+        self.base[low : high + 1] = files[low : high + 1]
+        if self.groups:
+            # which occurrence of a duplicate takes up its bytes depends on
+            # the files before it
+            self.set_offsets()
+        else:
+            for i in range(low, high + 1):
+                self.offsets[i + 1] = self.offsets[i] + self.file_length(self.base[i])
+        self.base_regions = {
+            k: v for k, v in self.base_regions.items() if k[1] <= low or k[0] > high
+        }
+        self.base_size = size
+        return size
+
+    def verify(self, files: List[str], estimated: int) -> int:
+        """Compress files in full, and report how far the estimate drifted"""
+        actual = self.exact(files)
+        self.verifications.append((estimated, actual))
+        print(
+            f"verified after {self.accepted} moves: estimated={estimated}, "
+            f"actual={actual}, drift={estimated - actual}"
+        )
+        return actual